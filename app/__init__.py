@@ -1,7 +1,10 @@
 from flask import Flask
 
+from .logs import configure_logging
+
 def create_app(config):
     app = Flask(__name__)
+    configure_logging(config.get('log_level', 'INFO'), config.get('log_sample_every', 100))
 
     # Registrazione delle rotte del sistema EnergyGuard
     with app.app_context():
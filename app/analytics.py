@@ -0,0 +1,100 @@
+try:
+    import numpy
+except ImportError:  # dipendenza opzionale: senza numpy le analisi vettoriali non sono disponibili
+    numpy = None
+
+if numpy is not None:
+    # Righe (ts, value) lette da SQLite
+    SAMPLE_DTYPE = numpy.dtype([('ts', '<i8'), ('value', '<f8')])
+
+# Funzioni di aggregazione di resample
+AGGREGATIONS = ('mean', 'sum', 'min', 'max', 'count', 'first', 'last')
+
+
+def require_numpy():
+    if numpy is None:
+        raise RuntimeError('numpy is required for vectorized analytics')
+
+
+def empty_series():
+    return numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.float64)
+
+
+def merge_samples(parts):
+    """Merge ``(timestamps, values)`` pairs into one series ordered by time, one sample per timestamp.
+
+    On equal timestamps the sample from the earlier pair wins.
+    """
+    parts = [part for part in parts if len(part[0])]
+    if not parts:
+        return empty_series()
+    ts = numpy.concatenate([part[0] for part in parts]).astype(numpy.int64, copy=False)
+    values = numpy.concatenate([part[1] for part in parts]).astype(numpy.float64, copy=False)
+    order = numpy.argsort(ts, kind='stable')
+    ts, values = ts[order], values[order]
+    keep = numpy.empty(len(ts), dtype=bool)
+    keep[0] = True
+    numpy.not_equal(ts[1:], ts[:-1], out=keep[1:])
+    return ts[keep], values[keep]
+
+
+def resample(ts, values, step, how='mean'):
+    """Aggregate a series into ``step``-second buckets aligned to the epoch.
+
+    Returns ``(bucket_starts, aggregates)``; empty buckets are omitted. ``how`` is one of ``AGGREGATIONS``.
+    """
+    if how not in AGGREGATIONS:
+        raise ValueError(f"Invalid aggregation: {how} (expected one of {', '.join(AGGREGATIONS)})")
+    if not len(ts):
+        return empty_series()
+    buckets = ts - ts % step
+    starts = numpy.flatnonzero(numpy.concatenate(([True], buckets[1:] != buckets[:-1])))
+    counts = numpy.diff(numpy.append(starts, len(ts)))
+    if how == 'count':
+        result = counts.astype(numpy.float64)
+    elif how == 'first':
+        result = values[starts]
+    elif how == 'last':
+        result = values[starts + counts - 1]
+    elif how == 'min':
+        result = numpy.minimum.reduceat(values, starts)
+    elif how == 'max':
+        result = numpy.maximum.reduceat(values, starts)
+    else:
+        result = numpy.add.reduceat(values, starts)
+        if how == 'mean':
+            result /= counts
+    return buckets[starts], result
+
+
+def percentile(values, q):
+    """Return the ``q`` percentiles (a number or a list, 0-100) of ``values``, ``None`` for an empty series."""
+    if not len(values):
+        return None if numpy.ndim(q) == 0 else [None] * len(q)
+    return numpy.percentile(values, q).tolist()
+
+
+def moving_average(ts, values, window):
+    """Average of the samples in the trailing time window ``(ts - window, ts]`` of every sample."""
+    if not len(ts):
+        return empty_series()
+    sums = numpy.concatenate(([0.0], numpy.cumsum(values)))
+    first = numpy.searchsorted(ts, ts - window, side='right')
+    last = numpy.arange(1, len(ts) + 1)
+    return ts, (sums[last] - sums[first]) / (last - first)
+
+
+def total(series, step):
+    """Sum the ``step``-second means of several sensors, e.g. the consumption of a group of meters.
+
+    ``series`` is a list of ``(timestamps, values)``. Returns ``(bucket_starts, totals, sensors)`` where
+    ``sensors`` is how many sensors had samples in each bucket.
+    """
+    resampled = [resample(ts, values, step) for ts, values in series]
+    resampled = [part for part in resampled if len(part[0])]
+    if not resampled:
+        return (*empty_series(), numpy.empty(0, dtype=numpy.int64))
+    buckets, index = numpy.unique(numpy.concatenate([part[0] for part in resampled]), return_inverse=True)
+    totals = numpy.bincount(index, weights=numpy.concatenate([part[1] for part in resampled]),
+                            minlength=len(buckets))
+    return buckets, totals, numpy.bincount(index, minlength=len(buckets))
@@ -0,0 +1,134 @@
+import contextlib
+import json
+import time
+from functools import wraps
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+from . import create_app, routes, wire
+
+# Richieste Flask servite in parallelo dal pool di thread di a2wsgi
+WSGI_WORKERS = 32
+
+
+# Stessa semantica di routes.require_api_token per gli endpoint asincroni
+def require_api_token(endpoint):
+    @wraps(endpoint)
+    async def decorated_endpoint(request):
+        if not routes.valid_api_token(request.headers.get('Authorization')):
+            return JSONResponse(routes.UNAUTHORIZED, status_code=403)
+        return await endpoint(request)
+    return decorated_endpoint
+
+
+async def read_measurement(request):
+    body = await request.body()
+    mimetype = wire.normalize_mimetype(request.headers.get('Content-Type'))
+    start = time.perf_counter()
+    try:
+        data = routes.parse_binary_measurement(body, mimetype)
+        return data if data is not None else json.loads(body)
+    except ValueError:
+        return None
+    finally:
+        routes.observe_serialization(start, mimetype, 'decode')
+
+
+# Risposta JSON o MessagePack secondo l'header Accept, come routes.encoded_response
+def encoded_response(request, payload, status_code=200):
+    start = time.perf_counter()
+    if wire.negotiate(request.headers.get('Accept'), routes.RESPONSE_MIMETYPES) == wire.MSGPACK_MIMETYPE:
+        response = Response(wire.packb(payload), status_code=status_code, media_type=wire.MSGPACK_MIMETYPE)
+    else:
+        response = JSONResponse(payload, status_code=status_code)
+    routes.observe_serialization(start, response.media_type, 'encode')
+    return response
+
+
+async def index(request):
+    return JSONResponse({'status': 'EnergyGuard API running'})
+
+
+@require_api_token
+async def ingest_measurement(request):
+    data = await read_measurement(request)
+    required = {'sensor_id', 'timestamp', 'value'}
+    if not isinstance(data, dict) or not required.issubset(data):
+        return JSONResponse({'error': 'Invalid input',
+                             'message': 'sensor_id, timestamp and value are required'}, status_code=400)
+    try:
+        key = f"{data['sensor_id']}:{data['timestamp']}"
+        await routes.replication_manager.astore_measurement(key, data['value'])
+        return encoded_response(request, {'status': 'success', 'message': f'Measurement {key} stored successfully'})
+    except Exception as e:
+        return JSONResponse({'error': 'Internal server error', 'message': str(e)}, status_code=500)
+
+
+@require_api_token
+async def ingest_batch(request):
+    mimetype = wire.normalize_mimetype(request.headers.get('Content-Type'))
+    try:
+        batch = routes.decode_batch(await request.body(), mimetype)
+    except ValueError as e:
+        return JSONResponse({'error': 'Invalid input', 'message': str(e)}, status_code=400)
+    try:
+        stored = await run_in_threadpool(routes.replication_manager.store_measurements, batch)
+        return encoded_response(request, {'status': 'success', 'stored': stored,
+                                          'message': f'{stored} measurements stored successfully'})
+    except Exception as e:
+        return JSONResponse({'error': 'Internal server error', 'message': str(e)}, status_code=500)
+
+
+@require_api_token
+async def get_measurement(request):
+    sensor_key = request.path_params['sensor_key']
+    try:
+        result = await routes.replication_manager.aretrieve_measurement(sensor_key)
+        if result['value'] is not None:
+            return encoded_response(request, {'key': sensor_key, 'value': result['value'],
+                                              'message': result['message'], 'status': 'success'})
+        return JSONResponse({'error': 'Measurement not found', 'message': result['message']}, status_code=404)
+    except Exception as e:
+        return JSONResponse({'error': 'Internal server error', 'message': str(e)}, status_code=500)
+
+
+@require_api_token
+async def delete_measurement(request):
+    sensor_key = request.path_params['sensor_key']
+    manager = routes.replication_manager
+    try:
+        if not await run_in_threadpool(manager.measurement_exists, sensor_key):
+            return JSONResponse({'error': 'Measurement not found', 'message': 'Measurement does not exist'},
+                                status_code=404)
+        await run_in_threadpool(manager.delete_measurement, sensor_key)
+        return JSONResponse({'status': 'success', 'message': f'Measurement {sensor_key} deleted successfully'})
+    except Exception as e:
+        return JSONResponse({'error': 'Internal server error', 'message': str(e)}, status_code=500)
+
+
+def create_asgi_app(config):
+    """ASGI application with the same routes as the Flask app.
+
+    The hot paths (ingest, batch ingest, single reads and deletes) are native coroutines: replica
+    calls run concurrently through the fan-out pool and the remaining storage I/O in executors.
+    Every other route is served by the Flask app mounted through a WSGI adapter.
+    """
+    flask_app = create_app(config)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        yield
+        await run_in_threadpool(routes.replication_manager.close)
+
+    return Starlette(routes=[
+        Route('/', index),
+        Route('/ingest', ingest_measurement, methods=['POST']),
+        Route('/ingest/batch', ingest_batch, methods=['POST']),
+        Route('/measurement/{sensor_key}', get_measurement, methods=['GET']),
+        Route('/delete/{sensor_key}', delete_measurement, methods=['DELETE']),
+        Mount('/', WSGIMiddleware(flask_app, workers=WSGI_WORKERS)),
+    ], lifespan=lifespan)
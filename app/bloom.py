@@ -0,0 +1,77 @@
+import hashlib
+import math
+import os
+import struct
+
+# magic, versione, bit, funzioni di hash, chiavi inserite, capacità, righe e digest della tabella
+FILE_HEADER = struct.Struct('!4sBQBQQQq')
+FILE_MAGIC = b'EGBF'
+FILE_VERSION = 1
+
+
+class BloomFilter:
+    """Bloom filter over string keys sized for ``capacity`` keys at ``error_rate`` false positives.
+
+    ``k`` bit positions per key come from double hashing of one 128-bit blake2b digest.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(1, int(capacity))
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def saturated(self):
+        """True once more keys than ``capacity`` were added and the error rate is above target."""
+        return self.count > self.capacity
+
+    def save(self, path, fingerprint):
+        """Write the filter atomically, tagged with the ``(rows, digest)`` fingerprint of the table it covers."""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, self.num_bits, self.num_hashes, self.count,
+                                     self.capacity, *fingerprint))
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, fingerprint, error_rate=0.01):
+        """Return the filter saved at ``path`` if it matches ``fingerprint``, else ``None``."""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if len(data) < FILE_HEADER.size:
+            return None
+        magic, version, num_bits, num_hashes, count, capacity, rows, digest = FILE_HEADER.unpack_from(data)
+        bits = data[FILE_HEADER.size:]
+        if (magic, version) != (FILE_MAGIC, FILE_VERSION) or (rows, digest) != tuple(fingerprint) \
+                or len(bits) != (num_bits + 7) // 8:
+            return None
+        bloom = cls.__new__(cls)
+        bloom.capacity, bloom.error_rate = capacity, error_rate
+        bloom.num_bits, bloom.num_hashes, bloom.count = num_bits, num_hashes, count
+        bloom.bits = bytearray(bits)
+        return bloom
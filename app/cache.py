@@ -0,0 +1,122 @@
+import collections
+import sys
+import threading
+import time
+
+MISSING = object()
+# Stima del costo fisso di una voce: nodo dell'OrderedDict, tupla e scadenza
+ENTRY_OVERHEAD = 120
+
+
+def entry_size(key, value):
+    return sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD
+
+
+class MeasurementCache:
+    """Bounded LRU cache of measurement values with an optional TTL.
+
+    At most ``max_entries`` entries and ``max_bytes`` estimated bytes are kept; the least recently
+    used entries are evicted first. ``ttl`` (seconds, ``None`` = no expiry) is checked on lookup.
+
+    Read-through fills are guarded against races with writes: ``reserve()`` returns a token before
+    the storage read, and ``fill()`` drops the value when the key was invalidated after the token.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()  # key -> (value, size, scadenza)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._epoch = 0
+        self._cleared_at = 0
+        self._readers = collections.Counter()  # token delle letture in corso
+        self._invalidated = {}  # key -> epoch, solo mentre ci sono letture in corso
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached value of ``key`` or ``MISSING``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def reserve(self):
+        with self._lock:
+            self._readers[self._epoch] += 1
+            return self._epoch
+
+    def fill(self, key, value, token):
+        """Cache ``value`` read from storage after ``reserve()`` returned ``token``; ``None`` is not cached."""
+        with self._lock:
+            self._readers[token] -= 1
+            if not self._readers[token]:
+                del self._readers[token]
+            stale = token < self._cleared_at or self._invalidated.get(key, -1) > token
+            if not self._readers:
+                self._invalidated.clear()
+            elif len(self._invalidated) > 1024:
+                # Servono solo le invalidazioni successive alla lettura in corso più vecchia
+                oldest = min(self._readers)
+                self._invalidated = {k: epoch for k, epoch in self._invalidated.items() if epoch > oldest}
+            if value is None or stale:
+                return
+            size = entry_size(key, value)
+            if size > self.max_bytes:
+                return
+            if key in self._entries:
+                self._drop(key)
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self._entries[key] = (value, size, expires)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                if self._readers:
+                    self._invalidated[key] = self._epoch
+                if key in self._entries:
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._cleared_at = self._epoch
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
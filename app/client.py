@@ -1,103 +1,463 @@
+import asyncio
 import json
 import os
+import random
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from . import wire
+
+try:
+    import httpx
+except ImportError:  # dipendenza opzionale: serve solo ad AsyncEnergyGuardClient
+    httpx = None
+
+# wire_format -> Content-Type delle scritture
+WIRE_FORMATS = {'json': wire.JSON_MIMETYPE, 'msgpack': wire.MSGPACK_MIMETYPE, 'packed': wire.PACKED_MIMETYPE}
+# Risposte dopo le quali una richiesta idempotente viene ripetuta. Scritture, cancellazioni, letture e cambi di
+# stato dei nodi lo sono; add_node e remove_node no (un secondo tentativo avvierebbe un altro ribilanciamento)
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class EnergyGuardError(Exception):
+    """Raised when the server answers with an error status; ``payload`` is the decoded error body."""
 
-class EnergyGuardClient:
+    def __init__(self, status_code, message, payload=None):
+        super().__init__(f'Error {status_code}: {message}')
+        self.status_code = status_code
+        self.payload = payload
 
-    def __init__(self, base_url, api_token):
-        self.base_url = base_url
+
+class BaseClient:
+    """Request encoding, response decoding, retry policy and batching buffer shared by both clients.
+
+    ``add()`` buffers measurements and sends them to ``/ingest/batch`` once ``batch_size`` are
+    waiting or ``flush_interval`` seconds after the oldest one was buffered. Failed idempotent requests
+    are repeated up to ``retries`` times with exponential backoff and full jitter.
+    """
+
+    def __init__(self, base_url, api_token, wire_format='json', pool_size=10, timeout=10.0, retries=3,
+                 backoff=0.05, max_backoff=2.0, batch_size=500, flush_interval=1.0):
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f'Unsupported wire format: {wire_format}')
+        self.base_url = base_url.rstrip('/')
+        self.wire_format = wire_format
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
         self.headers = {"Authorization": f"Bearer {api_token}"}
-        self.check_initialization()
+        # Con un formato binario anche le risposte arrivano in MessagePack
+        if wire_format != 'json':
+            self.headers['Accept'] = f"{wire.MSGPACK_MIMETYPE}, {wire.JSON_MIMETYPE};q=0.5"
+        self._buffer = []
+        self._buffered_at = None
+        self._flush_error = None  # (eccezione, misurazioni perse) dell'ultimo flush in background fallito
+        self.stats = {'requests': 0, 'retries': 0, 'batches': 0, 'flushed': 0}
+
+    def encode_measurements(self, measurements, single=False):
+        """Encode ``(sensor_id, timestamp, value)`` tuples as the body of an ingest request in ``wire_format``."""
+        if self.wire_format == 'packed':
+            return wire.pack_records((sensor_id, int(timestamp), value) for sensor_id, timestamp, value in measurements)
+        if single:
+            (sensor_id, timestamp, value), = measurements
+            payload = {'sensor_id': sensor_id, 'timestamp': timestamp, 'value': value}
+        elif self.wire_format == 'msgpack':
+            payload = [list(measurement) for measurement in measurements]
+        else:
+            payload = [{'sensor_id': sensor_id, 'timestamp': timestamp, 'value': value}
+                       for sensor_id, timestamp, value in measurements]
+        if self.wire_format == 'msgpack':
+            return wire.packb(payload)
+        return json.dumps(payload).encode('utf-8')
+
+    def decode_response(self, response):
+        """Decode a ``requests`` or ``httpx`` response according to its Content-Type."""
+        mimetype = wire.normalize_mimetype(response.headers.get('Content-Type'))
+        if mimetype == wire.PACKED_MIMETYPE:
+            return {'status': 'success', 'records': wire.unpack_records(response.content),
+                    'next_cursor': response.headers.get('X-Next-Cursor')}
+        if mimetype in wire.MSGPACK_MIMETYPES:
+            return wire.unpackb(response.content)
+        return json.loads(response.content)
+
+    def result(self, response, method=None, attempt=0):
+        # Un DELETE ripetuto trova la chiave già cancellata dal tentativo precedente
+        if method == 'DELETE' and attempt and response.status_code == 404:
+            return {'status': 'success', 'message': 'Measurement deleted by a previous attempt'}
+        try:
+            data = self.decode_response(response)
+        except ValueError:
+            raise EnergyGuardError(response.status_code, f'Invalid response: {response.content[:200]!r}')
+        if response.status_code >= 400:
+            message = data.get('message', 'No details') if isinstance(data, dict) else 'No details'
+            raise EnergyGuardError(response.status_code, message, data)
+        return data
+
+    def retry_delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def should_retry(self, response, attempt, idempotent=True):
+        return idempotent and response.status_code in RETRY_STATUSES and attempt < self.retries
+
+    def ingest_request(self, path, measurements, single=False):
+        headers = {'Content-Type': WIRE_FORMATS[self.wire_format]}
+        return {'method': 'POST', 'path': path, 'content': self.encode_measurements(measurements, single),
+                'headers': headers}
+
+    def measurements_request(self, limit=None, cursor=None):
+        params = {name: value for name, value in (('limit', limit), ('cursor', cursor)) if value is not None}
+        headers = {}
+        if self.wire_format == 'packed':
+            headers['Accept'] = f"{wire.PACKED_MIMETYPE}, {wire.JSON_MIMETYPE};q=0.5"
+        return {'method': 'GET', 'path': '/measurements', 'params': params, 'headers': headers}
+
+    def replication_body(self, strategy, replication_factor=None):
+        data = {'strategy': strategy}
+        if replication_factor is not None:
+            data['replication_factor'] = replication_factor
+        return data
+
+    def _buffer_add(self, measurement):
+        """Append to the buffer; return the batch to send when ``batch_size`` is reached."""
+        if not self._buffer:
+            self._buffered_at = time.monotonic()
+        self._buffer.append(measurement)
+        if len(self._buffer) >= self.batch_size:
+            return self._take_buffer()
+        return None
+
+    def _take_buffer(self):
+        batch, self._buffer, self._buffered_at = self._buffer, [], None
+        return batch
+
+    def _buffer_due(self):
+        return self._buffered_at is not None and time.monotonic() - self._buffered_at >= self.flush_interval
+
+    def _raise_flush_error(self):
+        # Un lotto perso dal flusher in background viene segnalato alla chiamata successiva
+        if self._flush_error is not None:
+            (error, count), self._flush_error = self._flush_error, None
+            raise EnergyGuardError(getattr(error, 'status_code', None), f'Background flush of {count} '
+                                   f'measurements failed: {error}')
+
+
+class EnergyGuardClient(BaseClient):
+    """Client over one pooled keep-alive ``requests.Session``; every method returns the decoded response.
+
+    Errors are raised as ``EnergyGuardError`` (HTTP status) or ``requests.RequestException``
+    (network, after the retries). A background thread flushes the ``add()`` buffer on time.
+    """
+
+    def __init__(self, base_url, api_token, wire_format='json', **options):
+        super().__init__(base_url, api_token, wire_format, **options)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._buffer_lock = threading.Lock()
+        self._send_lock = threading.Lock()   # i lotti partono nell'ordine in cui sono stati chiusi
+        self._stop = threading.Event()
+        self._flusher = None
+
+    def request(self, method, path, content=None, params=None, headers=None, json_body=None, idempotent=True):
+        if json_body is not None:
+            content = json.dumps(json_body).encode('utf-8')
+            headers = {**(headers or {}), 'Content-Type': wire.JSON_MIMETYPE}
+        attempt = 0
+        while True:
+            self.stats['requests'] += 1
+            try:
+                response = self.session.request(method, f'{self.base_url}{path}', data=content, params=params,
+                                                headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if not idempotent or attempt >= self.retries:
+                    raise
+            else:
+                if not self.should_retry(response, attempt, idempotent):
+                    return self.result(response, method, attempt)
+            time.sleep(self.retry_delay(attempt))
+            attempt += 1
+            self.stats['retries'] += 1
 
     def check_initialization(self):
-        if not self.base_url or not self.headers.get('Authorization'):
-            print("Error: Missing base URL or API token.")
-            return False
+        """Return True when the server is reachable and accepts the API token."""
         try:
-            response = requests.get(f"{self.base_url}/nodes_status", headers=self.headers)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            print(f"Error connecting to server: {e}")
-            exit()
+            self.get_nodes_status()
+        except (EnergyGuardError, requests.RequestException):
+            return False
         return True
 
     def ingest(self, sensor_id, timestamp, value):
-        key = f"{sensor_id}:{timestamp}"
-        data = {'sensor_id': sensor_id, 'timestamp': timestamp, 'value': value}
+        return self.request(**self.ingest_request('/ingest', [(sensor_id, timestamp, value)], single=True))
+
+    def ingest_batch(self, measurements):
+        """Send ``(sensor_id, timestamp, value)`` tuples to ``/ingest/batch`` in one request."""
+        return self.request(**self.ingest_request('/ingest/batch', measurements))
+
+    def add(self, sensor_id, timestamp, value):
+        """Buffer one measurement; the caller sends the batch itself when the buffer is full."""
+        self._raise_flush_error()
+        with self._buffer_lock:
+            batch = self._buffer_add((sensor_id, timestamp, value))
+            if self._flusher is None and self.flush_interval:
+                self._flusher = threading.Thread(target=self._flush_loop, name='client-flusher', daemon=True)
+                self._flusher.start()
+            if batch is not None:
+                self._send_lock.acquire()
+        if batch is not None:
+            try:
+                self._send_batch(batch)
+            finally:
+                self._send_lock.release()
+
+    def flush(self):
+        """Send the buffered measurements now; return how many the server stored."""
+        with self._buffer_lock:
+            batch = self._take_buffer()
+            self._send_lock.acquire()
         try:
-            response = requests.post(f"{self.base_url}/ingest", json=data, headers=self.headers)
-            self.handle_response(response)
-        except requests.RequestException as e:
-            print(f"Request failed: {e}")
+            stored = self._send_batch(batch) if batch else 0
+        finally:
+            self._send_lock.release()
+        self._raise_flush_error()
+        return stored
+
+    def _send_batch(self, batch):
+        stored = self.ingest_batch(batch)['stored']
+        self.stats['batches'] += 1
+        self.stats['flushed'] += stored
+        return stored
+
+    def _flush_loop(self):
+        while not self._stop.wait(min(self.flush_interval, 0.05)):
+            with self._buffer_lock:
+                if not self._buffer_due():
+                    continue
+                batch = self._take_buffer()
+                self._send_lock.acquire()
+            try:
+                self._send_batch(batch)
+            except Exception as e:
+                self._flush_error = (e, len(batch))
+            finally:
+                self._send_lock.release()
 
     def get_measurement(self, key):
+        """Return the measurement of ``key`` or ``None`` when it does not exist."""
         try:
-            response = requests.get(f"{self.base_url}/measurement/{key}", headers=self.headers)
-            self.handle_response(response)
-        except requests.RequestException as e:
-            print(f"Request failed: {e}")
+            return self.request('GET', f'/measurement/{key}')
+        except EnergyGuardError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    def get_measurements(self, limit=None, cursor=None):
+        """Read one page of ``/measurements``; with ``wire_format='packed'`` the page is a list of records."""
+        return self.request(**self.measurements_request(limit, cursor))
 
     def delete_measurement(self, key):
-        try:
-            response = requests.delete(f"{self.base_url}/delete/{key}", headers=self.headers)
-            self.handle_response(response)
-        except requests.RequestException as e:
-            print(f"Request failed: {e}")
+        return self.request('DELETE', f'/delete/{key}')
 
     def fail_node(self, node_id):
-        try:
-            response = requests.post(f"{self.base_url}/fail_node/{node_id}", headers=self.headers)
-            self.handle_response(response)
-        except requests.RequestException as e:
-            print(f"Request failed: {e}")
+        return self.request('POST', f'/fail_node/{node_id}')
 
     def recover_node(self, node_id):
-        try:
-            response = requests.post(f"{self.base_url}/recover_node/{node_id}", headers=self.headers)
-            self.handle_response(response)
-        except requests.RequestException as e:
-            print(f"Request failed: {e}")
+        return self.request('POST', f'/recover_node/{node_id}')
 
     def get_nodes_status(self):
-        try:
-            response = requests.get(f"{self.base_url}/nodes_status", headers=self.headers)
-            self.handle_response(response)
-        except requests.RequestException as e:
-            print(f"Request failed: {e}")
+        return self.request('GET', '/nodes_status')
 
     def set_replication_strategy(self, strategy, replication_factor=None):
-        data = {'strategy': strategy}
-        if replication_factor is not None:
-            data['replication_factor'] = replication_factor
-        try:
-            response = requests.post(f"{self.base_url}/configure_replication", json=data, headers=self.headers)
-            self.handle_response(response)
-        except requests.RequestException as e:
-            print(f"Request failed: {e}")
+        return self.request('POST', '/configure_replication',
+                            json_body=self.replication_body(strategy, replication_factor), idempotent=False)
 
     def get_responsible_nodes(self, key):
-        try:
-            response = requests.get(f"{self.base_url}/replica_nodes/{key}", headers=self.headers)
-            self.handle_response(response)
-        except requests.RequestException as e:
-            print(f"Request failed: {e}")
+        return self.request('GET', f'/replica_nodes/{key}')
+
+    def add_node(self, weight=None):
+        return self.request('POST', '/add_node', json_body={} if weight is None else {'weight': weight},
+                            idempotent=False)
+
+    def remove_node(self, node_id):
+        return self.request('POST', f'/remove_node/{node_id}', idempotent=False)
 
-    def handle_response(self, response):
+    def rebalance_status(self):
+        return self.request('GET', '/rebalance_status')
+
+    def close(self):
+        """Flush the buffer, stop the background flusher and close the pooled connections."""
         try:
-            data = response.json()
-            if response.status_code == 200:
-                print(json.dumps(data, indent=2))
+            self.flush()
+        finally:
+            self._stop.set()
+            if self._flusher is not None:
+                self._flusher.join()
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncEnergyGuardClient(BaseClient):
+    """Asyncio variant of ``EnergyGuardClient`` over a pooled ``httpx.AsyncClient``.
+
+    Must be used from one event loop; the ``add()`` buffer is flushed on time by a task of that loop.
+    """
+
+    def __init__(self, base_url, api_token, wire_format='json', **options):
+        if httpx is None:
+            raise RuntimeError('AsyncEnergyGuardClient requires the httpx package')
+        super().__init__(base_url, api_token, wire_format, **options)
+        limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        self.session = httpx.AsyncClient(base_url=self.base_url, headers=self.headers, limits=limits,
+                                         timeout=self.timeout)
+        self._send_lock = asyncio.Lock()
+        self._flusher = None
+
+    async def request(self, method, path, content=None, params=None, headers=None, json_body=None,
+                      idempotent=True):
+        if json_body is not None:
+            content = json.dumps(json_body).encode('utf-8')
+            headers = {**(headers or {}), 'Content-Type': wire.JSON_MIMETYPE}
+        attempt = 0
+        while True:
+            self.stats['requests'] += 1
+            try:
+                response = await self.session.request(method, path, content=content, params=params,
+                                                      headers=headers)
+            except httpx.TransportError:
+                if not idempotent or attempt >= self.retries:
+                    raise
             else:
-                print(f"Error {response.status_code}: {data.get('message', 'No details')}")
-        except ValueError:
-            print(f"Invalid response: {response.text}")
+                if not self.should_retry(response, attempt, idempotent):
+                    return self.result(response, method, attempt)
+            await asyncio.sleep(self.retry_delay(attempt))
+            attempt += 1
+            self.stats['retries'] += 1
+
+    async def check_initialization(self):
+        try:
+            await self.get_nodes_status()
+        except (EnergyGuardError, httpx.HTTPError):
+            return False
+        return True
+
+    async def ingest(self, sensor_id, timestamp, value):
+        return await self.request(**self.ingest_request('/ingest', [(sensor_id, timestamp, value)], single=True))
+
+    async def ingest_batch(self, measurements):
+        return await self.request(**self.ingest_request('/ingest/batch', measurements))
+
+    async def add(self, sensor_id, timestamp, value):
+        self._raise_flush_error()
+        if self._flusher is None and self.flush_interval:
+            self._flusher = asyncio.create_task(self._flush_loop())
+        batch = self._buffer_add((sensor_id, timestamp, value))
+        if batch is not None:
+            async with self._send_lock:
+                await self._send_batch(batch)
+
+    async def flush(self):
+        batch = self._take_buffer()
+        async with self._send_lock:
+            stored = await self._send_batch(batch) if batch else 0
+        self._raise_flush_error()
+        return stored
+
+    async def _send_batch(self, batch):
+        stored = (await self.ingest_batch(batch))['stored']
+        self.stats['batches'] += 1
+        self.stats['flushed'] += stored
+        return stored
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(min(self.flush_interval, 0.05))
+            if not self._buffer_due():
+                continue
+            batch = self._take_buffer()
+            async with self._send_lock:
+                try:
+                    await self._send_batch(batch)
+                except Exception as e:
+                    self._flush_error = (e, len(batch))
+
+    async def get_measurement(self, key):
+        try:
+            return await self.request('GET', f'/measurement/{key}')
+        except EnergyGuardError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    async def get_measurements(self, limit=None, cursor=None):
+        return await self.request(**self.measurements_request(limit, cursor))
+
+    async def delete_measurement(self, key):
+        return await self.request('DELETE', f'/delete/{key}')
+
+    async def fail_node(self, node_id):
+        return await self.request('POST', f'/fail_node/{node_id}')
+
+    async def recover_node(self, node_id):
+        return await self.request('POST', f'/recover_node/{node_id}')
+
+    async def get_nodes_status(self):
+        return await self.request('GET', '/nodes_status')
+
+    async def set_replication_strategy(self, strategy, replication_factor=None):
+        return await self.request('POST', '/configure_replication',
+                                  json_body=self.replication_body(strategy, replication_factor), idempotent=False)
+
+    async def get_responsible_nodes(self, key):
+        return await self.request('GET', f'/replica_nodes/{key}')
+
+    async def add_node(self, weight=None):
+        return await self.request('POST', '/add_node', json_body={} if weight is None else {'weight': weight},
+                                  idempotent=False)
+
+    async def remove_node(self, node_id):
+        return await self.request('POST', f'/remove_node/{node_id}', idempotent=False)
+
+    async def rebalance_status(self):
+        return await self.request('GET', '/rebalance_status')
+
+    async def aclose(self):
+        try:
+            await self.flush()
+        finally:
+            if self._flusher is not None:
+                self._flusher.cancel()
+                try:
+                    await self._flusher
+                except asyncio.CancelledError:
+                    pass
+            await self.session.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
 
 
 def load_config(path='config/config_client.json'):
     default = {
         "host": "127.0.0.1",
         "port": 5000,
-        "API_TOKEN": "your_api_token_here"
+        "API_TOKEN": "your_api_token_here",
+        "wire_format": "json"
     }
     if not os.path.exists(path):
         os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -111,14 +471,25 @@ def load_config(path='config/config_client.json'):
             return default
 
 
+def print_result(call, *args):
+    try:
+        print(json.dumps(call(*args), indent=2))
+    except EnergyGuardError as e:
+        print(e)
+    except requests.RequestException as e:
+        print(f"Request failed: {e}")
+
+
 if __name__ == '__main__':
     config = load_config()
     base_url = f"http://{config['host']}:{config['port']}"
     token = config['API_TOKEN']
 
-    client = EnergyGuardClient(base_url, token)
+    client = EnergyGuardClient(base_url, token, config['wire_format'])
 
-    if client.check_initialization():
+    if not client.check_initialization():
+        print("Error connecting to server: check base URL and API token.")
+    else:
         print("\nWelcome to EnergyGuard CLI")
         while True:
             print("\nMenu:")
@@ -137,30 +508,31 @@ if __name__ == '__main__':
                 sid = input("Sensor ID: ")
                 ts = input("Timestamp: ")
                 val = input("Value: ")
-                client.ingest(sid, ts, val)
+                print_result(client.ingest, sid, ts, val)
             elif choice == '2':
                 k = input("Sensor key (e.g., sensor1:timestamp): ")
-                client.get_measurement(k)
+                print_result(client.get_measurement, k)
             elif choice == '3':
                 k = input("Sensor key to delete: ")
-                client.delete_measurement(k)
+                print_result(client.delete_measurement, k)
             elif choice == '4':
                 nid = input("Node ID to fail: ")
-                client.fail_node(nid)
+                print_result(client.fail_node, nid)
             elif choice == '5':
                 nid = input("Node ID to recover: ")
-                client.recover_node(nid)
+                print_result(client.recover_node, nid)
             elif choice == '6':
-                client.get_nodes_status()
+                print_result(client.get_nodes_status)
             elif choice == '7':
                 s = input("Strategy (full/consistent): ")
                 rf = input("Replication factor (blank if full): ")
                 rf = int(rf) if rf.strip().isdigit() else None
-                client.set_replication_strategy(s, rf)
+                print_result(client.set_replication_strategy, s, rf)
             elif choice == '8':
                 k = input("Sensor key to inspect: ")
-                client.get_responsible_nodes(k)
+                print_result(client.get_responsible_nodes, k)
             elif choice == '9':
                 break
             else:
                 print("Invalid choice")
+        client.close()
@@ -0,0 +1,269 @@
+import collections
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:  # dipendenza opzionale: senza numpy la valutazione dei batch resta campione per campione
+    numpy = None
+
+# Sotto questa soglia un batch di un sensore viene valutato campione per campione
+VECTORIZE_MIN = 16
+
+
+class Detector:
+    """Rolling anomaly detector for one sensor.
+
+    ``update(ts, value)`` consumes one sample in O(1) and returns True when it is anomalous with
+    respect to the samples seen before it. ``evaluate(ts, values)`` does the same for a whole batch
+    (numpy arrays, ``ts`` is NaN when unknown) and leaves the detector in the same state.
+    """
+    kind = None
+
+    def params(self):
+        raise NotImplementedError
+
+    def describe(self):
+        return {'type': self.kind, **self.params()}
+
+    def update(self, ts, value):
+        raise NotImplementedError
+
+    def evaluate(self, ts, values):
+        return numpy.array([self.update(None if math.isnan(t) else t, v) for t, v in zip(ts, values)], dtype=bool)
+
+
+class EwmaDetector(Detector):
+    """Flags samples farther than ``k`` exponentially weighted standard deviations from the EWMA."""
+    kind = 'ewma'
+
+    def __init__(self, alpha=0.1, k=3.0, warmup=10):
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be in (0, 1]')
+        self.alpha = float(alpha)
+        self.k = float(k)
+        self.warmup = int(warmup)
+        self.state = array('d', (0.0, 0.0, 0.0))  # campioni, media, media dei quadrati
+
+    def params(self):
+        return {'alpha': self.alpha, 'k': self.k, 'warmup': self.warmup}
+
+    def _anomalous(self, n, mean, meansq, value):
+        std = math.sqrt(max(meansq - mean * mean, 0.0))
+        return n >= self.warmup and std > 0 and abs(value - mean) > self.k * std
+
+    def update(self, ts, value):
+        n, mean, meansq = self.state
+        anomalous = self._anomalous(n, mean, meansq, value)
+        if n == 0:
+            mean, meansq = value, value * value
+        else:
+            mean += self.alpha * (value - mean)
+            meansq += self.alpha * (value * value - meansq)
+        self.state[0], self.state[1], self.state[2] = n + 1, mean, meansq
+        return anomalous
+
+    def _smooth(self, initial, values):
+        # s_j = b^(j+1) * (s_init + a * sum_{i<=j} x_i * b^-(i+1)), a blocchi perché b^-i resti finito
+        b = 1.0 - self.alpha
+        if b == 0:
+            return values.copy()
+        block = max(1, int(300 / -math.log10(b)))
+        out = numpy.empty_like(values)
+        for start in range(0, len(values), block):
+            chunk = values[start:start + block]
+            powers = b ** numpy.arange(1, len(chunk) + 1)
+            out[start:start + len(chunk)] = powers * (initial + self.alpha * numpy.cumsum(chunk / powers))
+            initial = out[start + len(chunk) - 1]
+        return out
+
+    def evaluate(self, ts, values):
+        flags = numpy.zeros(len(values), dtype=bool)
+        if self.state[0] == 0 and len(values):
+            flags[0] = self.update(None, values[0])
+            return numpy.concatenate((flags[:1], self.evaluate(ts[1:], values[1:])))
+        n, mean, meansq = self.state
+        means = self._smooth(mean, values)
+        meansqs = self._smooth(meansq, values * values)
+        prev_mean = numpy.concatenate(([mean], means[:-1]))
+        prev_meansq = numpy.concatenate(([meansq], meansqs[:-1]))
+        std = numpy.sqrt(numpy.maximum(prev_meansq - prev_mean * prev_mean, 0.0))
+        counts = n + numpy.arange(len(values))
+        flags = (counts >= self.warmup) & (std > 0) & (numpy.abs(values - prev_mean) > self.k * std)
+        if len(values):
+            self.state[0], self.state[1], self.state[2] = n + len(values), means[-1], meansqs[-1]
+        return flags
+
+
+class _WindowDetector(Detector):
+    """Keeps the last ``window`` values in a circular array."""
+
+    def __init__(self, window):
+        self.window = int(window)
+        if self.window < 2:
+            raise ValueError('window must be at least 2')
+        self.buffer = array('d', bytes(8 * self.window))
+        self.count = 0  # campioni nella finestra
+        self.pos = 0    # prossima posizione da scrivere
+
+    def recent(self):
+        """Values in the window, oldest first."""
+        if self.count < self.window:
+            return numpy.frombuffer(self.buffer, dtype=float)[:self.count].copy()
+        return numpy.roll(numpy.frombuffer(self.buffer, dtype=float), -self.pos)
+
+    def _push(self, value):
+        evicted = self.buffer[self.pos] if self.count == self.window else None
+        self.buffer[self.pos] = value
+        self.pos = (self.pos + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+        return evicted
+
+    def _reset(self, values):
+        tail = values[-self.window:]
+        self.buffer[:len(tail)] = array('d', tail.tolist())
+        self.count = len(tail)
+        self.pos = self.count % self.window
+
+
+class ZScoreDetector(_WindowDetector):
+    """Flags samples whose z-score over the previous ``window`` samples exceeds ``k``."""
+    kind = 'zscore'
+
+    def __init__(self, window=60, k=3.0):
+        super().__init__(window)
+        self.k = float(k)
+        self.sums = array('d', (0.0, 0.0))  # somma e somma dei quadrati della finestra
+
+    def params(self):
+        return {'window': self.window, 'k': self.k}
+
+    def _anomalous(self, count, total, total_sq, value):
+        if count < self.window:
+            return False
+        mean = total / count
+        std = math.sqrt(max(total_sq / count - mean * mean, 0.0))
+        return std > 0 and abs(value - mean) > self.k * std
+
+    def update(self, ts, value):
+        anomalous = self._anomalous(self.count, self.sums[0], self.sums[1], value)
+        evicted = self._push(value)
+        if evicted is not None:
+            self.sums[0] -= evicted
+            self.sums[1] -= evicted * evicted
+        self.sums[0] += value
+        self.sums[1] += value * value
+        if self.pos == 0:
+            # Ricalcolo a ogni giro del buffer: l'errore delle sottrazioni non si accumula
+            self.sums[0] = math.fsum(self.buffer)
+            self.sums[1] = math.fsum(v * v for v in self.buffer)
+        return anomalous
+
+    def evaluate(self, ts, values):
+        history = numpy.concatenate((self.recent(), values))
+        offset = len(history) - len(values)
+        sums = numpy.concatenate(([0.0], numpy.cumsum(history)))
+        sums_sq = numpy.concatenate(([0.0], numpy.cumsum(history * history)))
+        ends = offset + numpy.arange(len(values))
+        starts = numpy.maximum(ends - self.window, 0)
+        counts = ends - starts
+        full = counts >= self.window
+        safe = numpy.maximum(counts, 1)
+        mean = (sums[ends] - sums[starts]) / safe
+        std = numpy.sqrt(numpy.maximum((sums_sq[ends] - sums_sq[starts]) / safe - mean * mean, 0.0))
+        flags = full & (std > 0) & (numpy.abs(values - mean) > self.k * std)
+        self._reset(history)
+        window = self.recent()
+        self.sums[0], self.sums[1] = math.fsum(window), math.fsum(window * window)
+        return flags
+
+
+class RateOfChangeDetector(Detector):
+    """Flags samples changing faster than ``max_rate`` per second (per sample when timestamps are unknown)."""
+    kind = 'rate'
+
+    def __init__(self, max_rate):
+        self.max_rate = float(max_rate)
+        self.state = array('d', (0.0, 0.0, math.nan))  # c'è un campione precedente, valore, timestamp
+
+    def params(self):
+        return {'max_rate': self.max_rate}
+
+    def update(self, ts, value):
+        has_prev, last_value, last_ts = self.state
+        anomalous = False
+        if has_prev:
+            dt = ts - last_ts if ts is not None and not math.isnan(last_ts) else math.nan
+            rate = (value - last_value) / dt if dt > 0 else value - last_value
+            anomalous = abs(rate) > self.max_rate
+        self.state[0], self.state[1], self.state[2] = 1.0, value, math.nan if ts is None else ts
+        return anomalous
+
+    def evaluate(self, ts, values):
+        if not len(values):
+            return numpy.zeros(0, dtype=bool)
+        has_prev, last_value, last_ts = self.state
+        prev_values = numpy.concatenate(([last_value], values[:-1]))
+        dt = ts - numpy.concatenate(([last_ts], ts[:-1]))
+        timed = dt > 0  # False anche per NaN
+        rate = numpy.where(timed, (values - prev_values) / numpy.where(timed, dt, 1.0), values - prev_values)
+        flags = numpy.abs(rate) > self.max_rate
+        if not has_prev:
+            flags[0] = False
+        self.state[0], self.state[1], self.state[2] = 1.0, values[-1], ts[-1]
+        return flags
+
+
+class WindowRangeDetector(_WindowDetector):
+    """Flags samples after which max - min over the last ``window`` samples exceeds ``max_range``."""
+    kind = 'minmax'
+
+    def __init__(self, window=60, max_range=0.0):
+        super().__init__(window)
+        self.max_range = float(max_range)
+        self.seq = 0
+        # Code monotone (sequenza, valore): massimo e minimo della finestra in O(1) ammortizzato
+        self.maxima = collections.deque()
+        self.minima = collections.deque()
+
+    def params(self):
+        return {'window': self.window, 'max_range': self.max_range}
+
+    def _track(self, value):
+        while self.maxima and self.maxima[-1][1] <= value:
+            self.maxima.pop()
+        while self.minima and self.minima[-1][1] >= value:
+            self.minima.pop()
+        self.maxima.append((self.seq, value))
+        self.minima.append((self.seq, value))
+        oldest = self.seq - self.window + 1
+        for queue in (self.maxima, self.minima):
+            if queue[0][0] < oldest:
+                queue.popleft()
+        self.seq += 1
+
+    def update(self, ts, value):
+        self._push(value)
+        self._track(value)
+        return self.maxima[0][1] - self.minima[0][1] > self.max_range
+
+    def evaluate(self, ts, values):
+        history = numpy.concatenate((self.recent()[-(self.window - 1):], values))
+        padded = numpy.concatenate((numpy.full(self.window - 1, numpy.nan), history))
+        windows = numpy.lib.stride_tricks.sliding_window_view(padded, self.window)[-len(values):]
+        flags = numpy.nanmax(windows, axis=1) - numpy.nanmin(windows, axis=1) > self.max_range
+        self._reset(numpy.concatenate((self.recent(), values)))
+        self.maxima.clear()
+        self.minima.clear()
+        for value in self.recent():
+            self._track(value)
+        return flags
+
+
+DETECTOR_TYPES = {cls.kind: cls for cls in (EwmaDetector, ZScoreDetector, RateOfChangeDetector, WindowRangeDetector)}
+
+
+def create_detector(kind, **params):
+    if kind not in DETECTOR_TYPES:
+        raise ValueError(f'Unsupported detector: {kind}')
+    return DETECTOR_TYPES[kind](**params)
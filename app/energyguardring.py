@@ -1,53 +1,184 @@
 import hashlib
 import bisect
+import logging
+import zlib
+
+try:
+    import xxhash
+except ImportError:  # dipendenza opzionale
+    xxhash = None
+
+logger = logging.getLogger(__name__)
+
+
+def _md5(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16)
+
+
+def _crc32(key):
+    return zlib.crc32(key.encode('utf-8'))
+
+
+def _xxh64(key):
+    return xxhash.xxh64_intdigest(key)
+
+
+# nome -> (funzione, bit dello spazio degli hash)
+HASH_FUNCTIONS = {
+    'md5': (_md5, 128),
+    'crc32': (_crc32, 32),
+    'xxhash': (_xxh64, 64),
+}
+
+
+def range_filter(ranges, hash_function='md5'):
+    """Return a predicate telling whether a key hashes into one of ``ranges``.
+
+    ``ranges`` are ``(start, end)`` pairs of :meth:`EnergyGuardRing.ownership_changes`: ``[start, end)``,
+    wrapping around the ring when ``end <= start``.
+    """
+    hash_fn, bits = HASH_FUNCTIONS[hash_function]
+    intervals = []
+    for start, end in ranges:
+        if end > start:
+            intervals.append((start, end))
+        else:
+            intervals.extend(((start, 2 ** bits), (0, end)))
+    intervals.sort()
+    starts = [start for start, _ in intervals]
+
+    def contains(key):
+        position = hash_fn(key)
+        i = bisect.bisect_right(starts, position) - 1
+        return i >= 0 and position < intervals[i][1]
+    return contains
+
 
 class EnergyGuardRing:
-    def __init__(self, storage_nodes=None, replication_factor=None):
+    def __init__(self, storage_nodes=None, replication_factor=None, vnodes=1, weights=None, hash_function='md5'):
+        if hash_function not in HASH_FUNCTIONS:
+            raise ValueError(f'Unsupported hash function: {hash_function}')
+        if hash_function == 'xxhash' and xxhash is None:
+            raise ValueError('hash_function "xxhash" requires the xxhash package')
         self.replication_factor = replication_factor or len(storage_nodes)
+        self.vnodes = max(1, int(vnodes))
+        self.weights = dict(weights or {})
+        self.hash_function = hash_function
+        self._hash_fn, self.hash_bits = HASH_FUNCTIONS[hash_function]
         self.ring = dict()
         self.sorted_hashes = []
-        self.temp_data_store = {}
+        self.nodes = {}
+        # Tabella precalcolata: per ogni segmento dell'anello, le repliche responsabili
+        # e l'intera lista di preferenza (nodi fisici distinti in senso orario)
+        self._responsible = []
+        self._preference = []
 
         if storage_nodes:
             for node in storage_nodes:
-                self.add_storage_node(node)
+                self._place(node)
+            self._rebuild_table()
 
     def _hash(self, key):
-        return int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16)
+        return self._hash_fn(key)
+
+    def _position(self, label):
+        # Le posizioni dei nodi usano sempre md5 (ridotto allo spazio dell'hash scelto) per distribuirle
+        # uniformemente anche quando le chiavi sono hashate con una funzione non crittografica
+        if self.hash_function == 'md5':
+            return self._hash(label)
+        return _md5(label) % (2 ** self.hash_bits)
+
+    def _vnode_labels(self, node):
+        count = max(1, round(self.vnodes * self.weights.get(node.node_id, 1)))
+        # Il primo punto usa str(node_id) per mantenere le posizioni della versione con un solo punto per nodo
+        return [str(node.node_id)] + [f'{node.node_id}#{i}' for i in range(1, count)]
+
+    def _place(self, node):
+        self.nodes[node.node_id] = node
+        for label in self._vnode_labels(node):
+            node_hash = self._position(label)
+            if node_hash in self.ring:
+                continue  # collisione: il punto resta al nodo che lo possedeva
+            self.ring[node_hash] = node
+            bisect.insort(self.sorted_hashes, node_hash)
+
+    def _rebuild_table(self):
+        positions = len(self.sorted_hashes)
+        if not positions:
+            self._responsible, self._preference = [], []
+            return
+        replicas = min(self.replication_factor, len(self.nodes))
+
+        # Lista di preferenza dell'ultima posizione calcolata percorrendo l'anello,
+        # le altre all'indietro: pref[i] = nodo(i) + pref[i+1] senza nodo(i)
+        preference = [None] * positions
+        last, seen = [], set()
+        for step in range(positions):
+            node = self.ring[self.sorted_hashes[(positions - 1 + step) % positions]]
+            if node.node_id not in seen:
+                seen.add(node.node_id)
+                last.append(node)
+        preference[-1] = tuple(last)
+        for i in range(positions - 2, -1, -1):
+            node = self.ring[self.sorted_hashes[i]]
+            preference[i] = (node,) + tuple(n for n in preference[i + 1] if n is not node)
+
+        self._preference = preference
+        self._responsible = [pref[:replicas] for pref in preference]
+
+    def _segment(self, key):
+        return self._segment_at(self._hash(key))
+
+    def _segment_at(self, position):
+        idx = bisect.bisect(self.sorted_hashes, position)
+        return idx if idx < len(self.sorted_hashes) else 0
 
     def add_storage_node(self, node):
-        node_hash = self._hash(str(node.node_id))
-        self.ring[node_hash] = node
-        bisect.insort(self.sorted_hashes, node_hash)
-        print(f"[EnergyGuard] Nodo storage {node.node_id} aggiunto all'anello.")
+        self._place(node)
+        self._rebuild_table()
+        logger.info('Storage node %s added to the ring', node.node_id)
 
     def remove_storage_node(self, node):
-        node_hash = self._hash(str(node.node_id))
-        if node_hash in self.ring:
+        if self.nodes.pop(node.node_id, None) is None:
+            return
+        for node_hash in [h for h, n in self.ring.items() if n.node_id == node.node_id]:
             del self.ring[node_hash]
             self.sorted_hashes.remove(node_hash)
-            print(f"[EnergyGuard] Nodo storage {node.node_id} rimosso dall'anello.")
+        self._rebuild_table()
+        logger.info('Storage node %s removed from the ring', node.node_id)
 
-    def get_responsible_nodes(self, sensor_key):
-        if not self.ring:
-            return []
+    def ownership_changes(self, other):
+        """Return the hash ranges whose replica set differs between this ring and ``other``.
 
-        hash_key = self._hash(sensor_key)
-        idx = bisect.bisect(self.sorted_hashes, hash_key)
-
-        selected_nodes = []
-        used_ids = set()
+        Each range is ``{'start', 'end', 'before', 'after'}``: keys hashing to ``[start, end)`` (wrapping
+        around the ring when ``end <= start``) move from the ``before`` to the ``after`` node ids.
+        Both rings must use the same hash function.
+        """
+        starts = sorted(set(self.sorted_hashes) | set(other.sorted_hashes))
+        changes = []
+        for i, start in enumerate(starts):
+            before = [node.node_id for node in self._responsible[self._segment_at(start)]] if self.ring else []
+            after = [node.node_id for node in other._responsible[other._segment_at(start)]] if other.ring else []
+            if set(before) != set(after):
+                changes.append({'start': start, 'end': starts[(i + 1) % len(starts)], 'before': before,
+                                'after': after})
+        return changes
+
+    def range_share(self, ranges):
+        """Fraction of the hash space covered by ``ranges`` as returned by :meth:`ownership_changes`."""
+        space = 2 ** self.hash_bits
+        return sum((r['end'] - r['start']) % space or space for r in ranges) / space
 
-        while len(selected_nodes) < self.replication_factor:
-            if idx >= len(self.sorted_hashes):
-                idx = 0
-            node = self.ring[self.sorted_hashes[idx]]
-            if node.node_id not in used_ids:
-                selected_nodes.append(node)
-                used_ids.add(node.node_id)
-            idx += 1
+    def get_responsible_nodes(self, sensor_key):
+        if not self.ring:
+            return ()
+        return self._responsible[self._segment(sensor_key)]
 
-        return selected_nodes
+    def get_preference_list(self, key):
+        """Return every physical node in ring order starting from the owner of ``key``."""
+        if not self.ring:
+            return ()
+        return self._preference[self._segment(key)]
 
     # Alias used by MeasurementReplicationManager
     def get_nodes_for_key(self, key):
@@ -64,56 +195,50 @@ class EnergyGuardRing:
                 return node
         return None
 
-    def get_next_active_node(self, key, exclude_node_id=None):
-        if not self.ring:
-            return None
-
-        hash_key = self._hash(key)
-        idx = bisect.bisect(self.sorted_hashes, hash_key)
-
-        for i in range(len(self.sorted_hashes)):
-            next_idx = (idx + i) % len(self.sorted_hashes)
-            next_node = self.ring[self.sorted_hashes[next_idx]]
-            if next_node.is_alive() and next_node.node_id != exclude_node_id:
-                return next_node
-
-        return None
-
-    def redistribute_measurements(self, failed_node):
-        next_node = self.get_next_active_node(f'{failed_node.node_id}:0', exclude_node_id=failed_node.node_id)
-        if next_node:
-            print(f"[EnergyGuard] Ridistribuzione delle misurazioni del nodo {failed_node.node_id} verso {next_node.node_id}.")
-            for key, value in failed_node.get_all_data():
-                if not next_node.key_exists(key):
-                    next_node.write(key, value)
-                    self.temp_data_store[key] = (next_node.node_id, value)
+    def distribution_report(self, sample_keys=None):
+        """Report the share of the hash space (and optionally of ``sample_keys``) owned by each node.
 
-    def recover_node(self, recovered_node):
-        print(f"[EnergyGuard] Recupero del nodo {recovered_node.node_id} iniziato.")
-
-        keys_to_recover = [
-            key for key, (temp_node_id, _) in self.temp_data_store.items()
-            if temp_node_id != recovered_node.node_id
-        ]
-
-        for key in keys_to_recover:
-            temp_node_id, value = self.temp_data_store[key]
-            temp_node = self.get_node_by_id(temp_node_id)
-            natural_nodes = self.get_responsible_nodes(key)
-
-            if temp_node and temp_node_id != recovered_node.node_id:
-                if temp_node not in natural_nodes:
-                    temp_node.delete(key)
-
-                if not recovered_node.key_exists(key):
-                    recovered_node.write(key, value)
-
-                del self.temp_data_store[key]
-
-        print(f"[EnergyGuard] Recupero del nodo {recovered_node.node_id} completato.")
+        ``primary_share`` is the fraction of keys whose first replica is the node, ``replica_share``
+        the fraction of keys the node stores a copy of. ``skew`` is max/mean of the primary shares.
+        """
+        space = 2 ** self.hash_bits
+        primary = {node_id: 0 for node_id in self.nodes}
+        replica = {node_id: 0 for node_id in self.nodes}
+        positions = len(self.sorted_hashes)
+        for i, node_hash in enumerate(self.sorted_hashes):
+            # Le chiavi nell'arco [hash precedente, hash) sono servite dal segmento i
+            arc = (node_hash - self.sorted_hashes[i - 1]) % space if positions > 1 else space
+            primary[self._preference[i][0].node_id] += arc
+            for node in self._responsible[i]:
+                replica[node.node_id] += arc
+
+        report = {
+            'hash_function': self.hash_function,
+            'vnodes': self.vnodes,
+            'positions': positions,
+            'replication_factor': self.replication_factor,
+            'nodes': {
+                node_id: {'primary_share': primary[node_id] / space, 'replica_share': replica[node_id] / space}
+                for node_id in self.nodes
+            },
+        }
+        shares = [primary[node_id] / space for node_id in self.nodes]
+        if shares:
+            mean = sum(shares) / len(shares)
+            report['skew'] = max(shares) / mean if mean else 0.0
+            report['stddev'] = (sum((x - mean) ** 2 for x in shares) / len(shares)) ** 0.5
+
+        if sample_keys is not None:
+            counts = {node_id: 0 for node_id in self.nodes}
+            total = 0
+            for key in sample_keys:
+                counts[self.get_responsible_nodes(key)[0].node_id] += 1
+                total += 1
+            for node_id, count in counts.items():
+                report['nodes'][node_id]['sample_keys'] = count
+            if total:
+                report['sample_skew'] = max(counts.values()) / (total / len(counts))
+        return report
 
     def get_node_by_id(self, node_id):
-        for node in self.ring.values():
-            if node.node_id == node_id:
-                return node
-        return None
+        return self.nodes.get(node_id)
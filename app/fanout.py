@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+
+class QuorumError(Exception):
+    """Raised when fewer replicas than the requested quorum acknowledged an operation."""
+
+
+class ReplicaFanout:
+    READ_MODES = ('sequential', 'parallel', 'hedged')
+
+    def __init__(self, max_workers=8, write_quorum=None, read_quorum=1, read_mode='sequential',
+                 hedge_delay=0.005, timeout=None):
+        if read_mode not in self.READ_MODES:
+            raise ValueError(f'Unsupported read mode: {read_mode}')
+        self.max_workers = max_workers
+        self.write_quorum = write_quorum    # None = tutte le repliche vive
+        self.read_quorum = read_quorum
+        self.read_mode = read_mode
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='replica') if max_workers > 0 else None
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+    def _required(self, nodes, quorum):
+        return len(nodes) if quorum is None else quorum
+
+    @staticmethod
+    def _report_late_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning('Late replica operation failed: %s', future.exception())
+
+    # --- Scritture ---
+
+    def write(self, nodes, operation, quorum=None):
+        """Run ``operation(node)`` on all nodes at once and return when the write quorum acknowledged.
+
+        The operations still running after the quorum is reached complete in the background.
+        Returns the number of acknowledgements observed.
+        """
+        nodes = list(nodes)
+        required = self._required(nodes, self.write_quorum if quorum is None else quorum)
+
+        if self.executor is None or len(nodes) <= 1:
+            acks, errors = 0, []
+            for node in nodes:
+                try:
+                    operation(node)
+                    acks += 1
+                except Exception as e:
+                    errors.append(e)
+            return self._check_quorum(acks, required, errors)
+
+        futures = [self.executor.submit(operation, node) for node in nodes]
+        acks, errors = 0, []
+        pending = set(futures)
+        while pending and acks < required:
+            done, pending = wait(pending, timeout=self.timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    acks += 1
+                else:
+                    errors.append(future.exception())
+        for future in pending:
+            future.add_done_callback(self._report_late_failure)
+        return self._check_quorum(acks, required, errors)
+
+    async def awrite(self, nodes, operation, quorum=None):
+        """Asyncio variant of :meth:`write`; the blocking operations run in the fan-out pool."""
+        nodes = list(nodes)
+        required = self._required(nodes, self.write_quorum if quorum is None else quorum)
+        loop = asyncio.get_running_loop()
+        pending = {loop.run_in_executor(self.executor, operation, node) for node in nodes}
+        acks, errors = 0, []
+        while pending and acks < required:
+            done, pending = await asyncio.wait(pending, timeout=self.timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    acks += 1
+                else:
+                    errors.append(future.exception())
+        for future in pending:
+            future.add_done_callback(self._report_late_failure)
+        return self._check_quorum(acks, required, errors)
+
+    @staticmethod
+    def _check_quorum(acks, required, errors):
+        if acks < required:
+            detail = f': {errors[0]}' if errors else ''
+            raise QuorumError(f'Write quorum not reached ({acks}/{required} acknowledgements){detail}')
+        return acks
+
+    # --- Letture ---
+
+    def read(self, nodes, operation, quorum=None, mode=None):
+        """Read from the replicas and return ``(node, value)`` for the first non-``None`` result.
+
+        ``sequential`` probes one node after the other, ``parallel`` queries every replica at once and
+        waits for at least ``quorum`` answers, ``hedged`` starts with the first replica and sends a backup
+        request to the next one whenever no answer arrived within ``hedge_delay`` seconds.
+        """
+        nodes = list(nodes)
+        mode = mode or self.read_mode
+        if self.executor is None or len(nodes) <= 1 or mode == 'sequential':
+            answered = False
+            for node in nodes:
+                try:
+                    value = operation(node)
+                except Exception:
+                    continue    # replica in errore: si passa alla successiva, come nella lettura parallela
+                answered = True
+                if value is not None:
+                    return node, value
+            return self._sequential_miss(nodes, answered)
+        if mode == 'hedged':
+            return self._hedged_read(nodes, operation)
+
+        required = min(self.read_quorum if quorum is None else quorum, len(nodes))
+        futures = {self.executor.submit(operation, node): node for node in nodes}
+        pending = set(futures)
+        answers, found = 0, (None, None)
+        while pending:
+            done, pending = wait(pending, timeout=self.timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is not None:
+                    continue
+                answers += 1
+                value = future.result()
+                if value is not None and found[0] is None:
+                    found = (futures[future], value)
+            if answers >= required and found[0] is not None:
+                break
+        if answers < required:
+            raise QuorumError(f'Read quorum not reached ({answers}/{required} answers)')
+        return found
+
+    @staticmethod
+    def _sequential_miss(nodes, answered):
+        if nodes and not answered:
+            raise QuorumError('Read quorum not reached (0/1 answers)')
+        return None, None
+
+    def _hedged_read(self, nodes, operation):
+        futures = {}
+        remaining = list(nodes)
+        pending = set()
+        while remaining or pending:
+            if remaining:
+                node = remaining.pop(0)
+                future = self.executor.submit(operation, node)
+                futures[future] = node
+                pending.add(future)
+            deadline = time.monotonic() + self.hedge_delay
+            while pending:
+                timeout = max(0, deadline - time.monotonic()) if remaining else self.timeout
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    if remaining:
+                        break    # nessuna risposta in tempo: invia la richiesta di backup
+                    return None, None
+                for future in done:
+                    if future.exception() is None and future.result() is not None:
+                        return futures[future], future.result()
+                if remaining:
+                    break    # risposta vuota o errore: prova subito la replica successiva
+        return None, None
+
+    async def aread(self, nodes, operation, quorum=None, mode=None):
+        """Asyncio variant of :meth:`read`; the blocking operations run in the fan-out pool."""
+        nodes = list(nodes)
+        mode = mode or self.read_mode
+        loop = asyncio.get_running_loop()
+        if len(nodes) <= 1 or mode == 'sequential':
+            answered = False
+            for node in nodes:
+                try:
+                    value = await loop.run_in_executor(self.executor, operation, node)
+                except Exception:
+                    continue
+                answered = True
+                if value is not None:
+                    return node, value
+            return self._sequential_miss(nodes, answered)
+        if mode == 'hedged':
+            return await self._ahedged_read(nodes, operation)
+
+        required = min(self.read_quorum if quorum is None else quorum, len(nodes))
+        futures = {loop.run_in_executor(self.executor, operation, node): node for node in nodes}
+        pending = set(futures)
+        answers, found = 0, (None, None)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=self.timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is not None:
+                    continue
+                answers += 1
+                if future.result() is not None and found[0] is None:
+                    found = (futures[future], future.result())
+            if answers >= required and found[0] is not None:
+                break
+        if answers < required:
+            raise QuorumError(f'Read quorum not reached ({answers}/{required} answers)')
+        return found
+
+    async def _ahedged_read(self, nodes, operation):
+        loop = asyncio.get_running_loop()
+        futures = {}
+        remaining = list(nodes)
+        pending = set()
+        while remaining or pending:
+            if remaining:
+                node = remaining.pop(0)
+                future = loop.run_in_executor(self.executor, operation, node)
+                futures[future] = node
+                pending.add(future)
+            deadline = time.monotonic() + self.hedge_delay
+            while pending:
+                timeout = max(0, deadline - time.monotonic()) if remaining else self.timeout
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if remaining:
+                        break    # nessuna risposta in tempo: invia la richiesta di backup
+                    return None, None
+                for future in done:
+                    if future.exception() is None and future.result() is not None:
+                        return futures[future], future.result()
+                if remaining:
+                    break    # risposta vuota o errore: prova subito la replica successiva
+        return None, None
@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import threading
+
+
+class HintLog:
+    """Durable log of hinted handoffs.
+
+    A hint records that ``key`` belongs to the dead node ``target`` and was written to ``holder``
+    instead (``op='put'``), or that it was deleted while ``target`` was down (``op='del'``).
+    Values are not duplicated: on replay they are read back from the holder.
+    """
+
+    def __init__(self, path, synchronous='NORMAL'):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(f'PRAGMA synchronous={synchronous}')
+        with self._conn:
+            self._conn.execute(
+                '''CREATE TABLE IF NOT EXISTS hints (id INTEGER PRIMARY KEY AUTOINCREMENT, target INTEGER NOT NULL,
+                   holder INTEGER, key TEXT NOT NULL, op TEXT NOT NULL)''')
+            self._conn.execute('''CREATE INDEX IF NOT EXISTS idx_hints_target ON hints (target, id)''')
+
+    def add(self, hints):
+        """Append ``(target, holder, key, op)`` records in one transaction."""
+        if not hints:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany('''INSERT INTO hints (target, holder, key, op) VALUES (?, ?, ?, ?)''', hints)
+
+    def pending(self, target, holders, limit):
+        """Return up to ``limit`` ``(id, holder, key, op)`` hints for ``target`` replayable from ``holders``."""
+        placeholders = ','.join('?' * len(holders))
+        with self._lock:
+            return self._conn.execute(
+                f'''SELECT id, holder, key, op FROM hints
+                    WHERE target=? AND (holder IS NULL OR holder IN ({placeholders}))
+                    ORDER BY id LIMIT ?''', [target, *holders, limit]).fetchall()
+
+    def remove(self, ids):
+        with self._lock, self._conn:
+            self._conn.executemany('''DELETE FROM hints WHERE id=?''', [(hint_id,) for hint_id in ids])
+
+    def clear(self, target):
+        with self._lock, self._conn:
+            self._conn.execute('''DELETE FROM hints WHERE target=?''', (target,))
+
+    def backlog(self):
+        """Return ``{target: pending hints}``."""
+        with self._lock:
+            return dict(self._conn.execute('''SELECT target, COUNT(*) FROM hints GROUP BY target'''))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,49 @@
+import itertools
+import logging
+
+LOGGER_NAME = 'app'
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+
+def configure_logging(level='INFO', sample_every=100):
+    """Send the package logs to stderr at ``level`` and set the rate of the sampled call sites."""
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+    SampledLogger.every = max(1, int(sample_every))
+    return logger
+
+
+class SampledLogger:
+    """Logs one message out of ``every`` for call sites on the hot path.
+
+    Messages below the logger level are dropped before being counted or formatted; the ones that
+    pass report how many similar messages they stand for. ``every`` is shared and set by
+    ``configure_logging``; an instance can override it.
+    """
+    every = 100
+
+    def __init__(self, logger, every=None):
+        self.logger = logger
+        if every is not None:
+            self.every = every
+        self._calls = itertools.count()
+
+    def log(self, level, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        # itertools.count è atomico sotto il GIL: nessun lock sul percorso caldo
+        if next(self._calls) % self.every:
+            return
+        if self.every > 1:
+            msg = f'{msg} (sampled 1/{self.every})'
+        self.logger.log(level, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
+
+    def warning(self, msg, *args):
+        self.log(logging.WARNING, msg, *args)
@@ -1,105 +1,958 @@
+import asyncio
 import sqlite3
 import os
-from .energyguardring import EnergyGuardRing
+import collections
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from . import analytics
+from .bloom import BloomFilter
+from .cache import MISSING, MeasurementCache
+from .detectors import VECTORIZE_MIN, create_detector, numpy
+from .energyguardring import EnergyGuardRing, range_filter
+from .fanout import ReplicaFanout
+from .hints import HintLog
+from .logs import SampledLogger
+from .merkle import key_bucket, row_hash, build_tree, sync_node
+from .metrics import MetricsRegistry
+from .rebalance import Rebalance, WriteGate
+from .rollups import RESOLUTIONS, RollupStore
+from .segments import Segment, segment_eligible, stored_values, write_segment
+from .timeseries import MILLISECOND_EPOCH, parse_timestamp, split_key, numeric_value
+
+logger = logging.getLogger(__name__)
+# Messaggi emessi per singola misurazione: campionati per non pesare sul percorso di scrittura
+sampled_logger = SampledLogger(logger)
 
 class StorageNode:
-    def __init__(self, node_id, port):
+    SCHEMA_VERSION = 5
+    UNDATED = 'measurements_undated'
+    # Upsert (e non INSERT OR REPLACE) così i trigger dei digest vedono la riga sostituita come UPDATE
+    INSERT_SQL = '''INSERT INTO {table} (key, sensor_id, ts, value, bucket, h) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET sensor_id=excluded.sensor_id, ts=excluded.ts,
+                    value=excluded.value, bucket=excluded.bucket, h=excluded.h'''
+    PARTITION_SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, sensor_id TEXT, ts INTEGER, value NUMERIC,
+                                               bucket INTEGER, h INTEGER)''',
+        '''CREATE INDEX IF NOT EXISTS idx_{table}_sensor_ts ON {table} (sensor_id, ts, key)''',
+        '''CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)''',
+        # SQLite non ha l'operatore XOR: a ^ b = (a | b) & ~(a & b). La riga del bucket nasce con la sua
+        # prima chiave, così una partizione piccola non crea i digest di tutti i bucket
+        '''CREATE TRIGGER IF NOT EXISTS {table}_digest_insert AFTER INSERT ON {table} BEGIN
+               INSERT INTO partition_digests (partition, bucket, digest, count) VALUES ('{table}', NEW.bucket, NEW.h, 1)
+               ON CONFLICT(partition, bucket) DO UPDATE SET digest = (digest | NEW.h) & ~(digest & NEW.h),
+                                                            count = count + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS {table}_digest_delete AFTER DELETE ON {table} BEGIN
+               UPDATE partition_digests SET digest = (digest | OLD.h) & ~(digest & OLD.h), count = count - 1
+               WHERE partition = '{table}' AND bucket = OLD.bucket;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS {table}_digest_update AFTER UPDATE OF h ON {table} BEGIN
+               UPDATE partition_digests SET digest = (((digest | OLD.h) & ~(digest & OLD.h)) | NEW.h)
+                                                   & ~(((digest | OLD.h) & ~(digest & OLD.h)) & NEW.h)
+               WHERE partition = '{table}' AND bucket = NEW.bucket;
+           END''',
+    )
+    DIGEST_TRIGGERS = ('insert', 'delete', 'update')
+    # Limite di SQLite sui termini di una SELECT composta (UNION ALL)
+    MAX_COMPOUND = 400
+    SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+    JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+
+    def __init__(self, node_id, port, data_dir='data', pool_size=4,
+                 journal_mode='WAL', synchronous='NORMAL', bloom_capacity=100000, bloom_error_rate=0.01,
+                 partition_seconds=86400):
         self.node_id = node_id
         self.port = port
+        self.data_dir = data_dir
         self.name_db = f'storage_{node_id}.db'
-        self.db_path = os.path.join('data', self.name_db)
+        self.db_path = os.path.join(data_dir, self.name_db)
         self.alive = True
+
+        journal_mode = journal_mode.upper()
+        synchronous = synchronous.upper()
+        if journal_mode not in self.JOURNAL_MODES:
+            raise ValueError(f'Unsupported journal mode: {journal_mode}')
+        if synchronous not in self.SYNCHRONOUS_LEVELS:
+            raise ValueError(f'Unsupported synchronous level: {synchronous}')
+        if int(partition_seconds) <= 0:
+            raise ValueError(f'partition_seconds must be positive: {partition_seconds}')
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        # Ampiezza delle partizioni in secondi: i timestamp delle chiavi sono epoch in secondi (quelli in
+        # millisecondi vengono convertiti, vedi parse_timestamp)
+        self.partition_seconds = int(partition_seconds)
+
+        # Pool di connessioni persistenti; pool_size=0 apre una connessione per operazione
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._pool_lock = threading.Lock()
+        self._opened = 0
+
+        # Partizioni esistenti: nome della tabella -> (inizio, fine) dell'intervallo di tempo
+        self._partitions = {}
+        self._partition_lock = threading.Lock()
+        # Partizioni compattate in segmenti colonnari: nome della tabella -> Segment. Il dizionario viene
+        # sostituito, mai modificato, così un lettore riconosce un cambiamento durante la sua lettura
+        self.segment_dir = os.path.join(data_dir, f'segments_{node_id}')
+        self._segments = {}
+        # Le scritture (condivise) escludono compattazione, scongelamento ed eliminazione (esclusive)
+        self._cold_gate = WriteGate()
+
+        # Filtro di Bloom sulle chiavi: bloom_capacity=0 lo disattiva
+        self.bloom = None
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.bloom_path = os.path.join(data_dir, f'storage_{node_id}.bloom')
+        self.bloom_negatives = 0  # letture evitate perché il filtro esclude la chiave
+        self._bloom_lock = threading.Lock()
+        self._bloom_pending = None
+        self._bloom_rebuilding = False
+
         self._create_data_directory()
         self._initialize_db()
+        self._open_segments()
+        if bloom_capacity:
+            self.bloom = BloomFilter.load(self.bloom_path, self.table_fingerprint(), bloom_error_rate)
+            if self.bloom is None:
+                self.rebuild_bloom()
 
     def _create_data_directory(self):
-        if not os.path.exists('data'):
-            os.makedirs('data')
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir, exist_ok=True)
 
     def _initialize_db(self):
-        if not os.path.exists(self.db_path):
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''CREATE TABLE IF NOT EXISTS measurements (key TEXT PRIMARY KEY, value TEXT)''')
-            conn.commit()
+        with self._connection() as conn:
+            with conn:
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                if version < 1:
+                    self._migrate_to_timeseries(conn)
+                if version < 2:
+                    self._migrate_to_digests(conn)
+                if version < 3:
+                    self._migrate_to_partitions(conn)
+                if version < 4:
+                    conn.execute('''ALTER TABLE partitions ADD COLUMN cold INTEGER NOT NULL DEFAULT 0''')
+                if version < 5:
+                    self._migrate_to_second_epochs(conn)
+                conn.execute(f'PRAGMA user_version={self.SCHEMA_VERSION}')
+                self._initialize_partitioning(conn)
+            self._partitions = {name: (start, end) for name, start, end in
+                                conn.execute('''SELECT name, start, end FROM partitions''')}
+
+    def _migrate_to_timeseries(self, conn):
+        # Schema v1: sensor_id e timestamp (epoch intero) estratti dalla chiave, valore numerico
+        # quando possibile (affinità NUMERIC) e indice composto per le scansioni per intervallo
+        legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='measurements'").fetchone()
+        if legacy:
+            conn.execute('''ALTER TABLE measurements RENAME TO measurements_legacy''')
+        conn.execute('''CREATE TABLE measurements (key TEXT PRIMARY KEY, sensor_id TEXT, ts INTEGER, value NUMERIC)''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS idx_measurements_sensor_ts ON measurements (sensor_id, ts, key)''')
+        if legacy:
+            rows = conn.execute('''SELECT key, value FROM measurements_legacy''').fetchall()
+            conn.executemany('''INSERT INTO measurements (key, sensor_id, ts, value) VALUES (?, ?, ?, ?)''',
+                             [(key, *split_key(key), value) for key, value in rows])
+            conn.execute('''DROP TABLE measurements_legacy''')
+
+    def _migrate_to_digests(self, conn):
+        # Schema v2: bucket di hash e hash di riga per l'anti-entropy con alberi di Merkle
+        conn.execute('''ALTER TABLE measurements ADD COLUMN bucket INTEGER''')
+        conn.execute('''ALTER TABLE measurements ADD COLUMN h INTEGER''')
+        rows = conn.execute('''SELECT key, value FROM measurements''').fetchall()
+        conn.executemany('''UPDATE measurements SET bucket=?, h=? WHERE key=?''',
+                         [(key_bucket(key), row_hash(key, value), key) for key, value in rows])
+
+    def _migrate_to_partitions(self, conn):
+        # Schema v3: una tabella per finestra di partition_seconds, registrata in partitions con il suo
+        # intervallo; i digest dei bucket sono tenuti per partizione, così eliminarne una non tocca le righe
+        conn.execute('''CREATE TABLE storage_meta (name TEXT PRIMARY KEY, value)''')
+        conn.execute('''INSERT INTO storage_meta (name, value) VALUES ('partition_seconds', ?)''',
+                     (self.partition_seconds,))
+        conn.execute('''CREATE TABLE partitions (name TEXT PRIMARY KEY, start INTEGER, end INTEGER)''')
+        conn.execute('''CREATE TABLE partition_digests (partition TEXT, bucket INTEGER, digest INTEGER NOT NULL,
+                        count INTEGER NOT NULL, PRIMARY KEY (partition, bucket)) WITHOUT ROWID''')
+        groups = {}
+        for row in conn.execute('''SELECT key, sensor_id, ts, value, bucket, h FROM measurements'''):
+            groups.setdefault(self._partition(row[2]), []).append(row)
+        for partition, rows in groups.items():
+            self._create_partition(conn, partition)
+            conn.executemany(self.INSERT_SQL.format(table=partition[0]), rows)
+        conn.execute('''DROP TABLE measurements''')
+        conn.execute('''DROP TABLE IF EXISTS digests''')
+
+    def _migrate_to_second_epochs(self, conn):
+        # Schema v5: i timestamp in millisecondi diventano secondi (vedi parse_timestamp); le loro righe
+        # lasciano le partizioni larghe partition_seconds millisecondi per quelle della loro finestra reale
+        groups, emptied = {}, []
+        for table, cold in conn.execute('''SELECT name, cold FROM partitions WHERE start IS NOT NULL''').fetchall():
+            rows = conn.execute(f'''SELECT key, value FROM {table} WHERE abs(ts) >= ?''',
+                                (MILLISECOND_EPOCH,)).fetchall()
+            if not rows:
+                continue
+            conn.execute(f'''DELETE FROM {table} WHERE abs(ts) >= ?''', (MILLISECOND_EPOCH,))
+            if not cold and not conn.execute(f'''SELECT 1 FROM {table} LIMIT 1''').fetchone():
+                emptied.append(table)
+            for key, value in rows:
+                row = self._row(key, value)
+                groups.setdefault(self._partition(row[2]), []).append(row)
+        for table in emptied:
+            conn.execute(f'''DROP TABLE {table}''')
+            conn.execute('''DELETE FROM partitions WHERE name=?''', (table,))
+            conn.execute('''DELETE FROM partition_digests WHERE partition=?''', (table,))
+        for partition, rows in groups.items():
+            self._create_partition(conn, partition)
+            conn.executemany(self.INSERT_SQL.format(table=partition[0]), rows)
+
+    def _initialize_partitioning(self, conn):
+        stored = conn.execute('''SELECT value FROM storage_meta WHERE name='partition_seconds' ''').fetchone()
+        if stored and stored[0] != self.partition_seconds:
+            # Le chiavi esistenti sono state assegnate con l'ampiezza originale: si continua con quella
+            logger.warning('Node %s keeps partition_seconds=%s from its data file (configured %s)', self.node_id,
+                           stored[0], self.partition_seconds)
+            self.partition_seconds = stored[0]
+
+    # --- Partizioni ---
+
+    def _partition(self, ts):
+        """Return ``(table, start, end)`` of the partition holding timestamp ``ts``."""
+        if ts is None:
+            return self.UNDATED, None, None
+        start = ts - ts % self.partition_seconds
+        return f'measurements_{start}' if start >= 0 else f'measurements_m{-start}', start, start + self.partition_seconds
+
+    def _key_partition(self, key):
+        return self._partition(split_key(key)[1])[0]
+
+    def _create_partition(self, conn, partition):
+        table, start, end = partition
+        for statement in self.PARTITION_SCHEMA:
+            conn.execute(statement.format(table=table))
+        conn.execute('''INSERT OR IGNORE INTO partitions (name, start, end) VALUES (?, ?, ?)''', (table, start, end))
+
+    def _group_rows(self, rows):
+        """Group full rows by partition: ``{(table, start, end): rows}``."""
+        groups = {}
+        for row in rows:
+            groups.setdefault(self._partition(row[2]), []).append(row)
+        return groups
+
+    def _write_rows(self, rows, deletes=()):
+        """Upsert full rows and delete keys in one transaction, creating the partitions they need.
+
+        A compacted partition is first moved back to its table (see :meth:`_thaw`).
+        """
+        groups = self._group_rows(rows)
+        delete_groups = {}
+        for key in deletes:
+            delete_groups.setdefault(self._key_partition(key), []).append((key,))
+        while True:
+            self._cold_gate.acquire_shared()
+            try:
+                cold = [table for table, _, _ in groups if table in self._segments]
+                cold += [table for table in delete_groups if table in self._segments]
+                if not cold:
+                    self._commit_rows(groups, delete_groups)
+                    return
+            finally:
+                self._cold_gate.release_shared()
+            for table in set(cold):
+                self._thaw(table)
+
+    def _commit_rows(self, groups, delete_groups):
+        created = []
+        with self._connection() as conn:
+            with conn:
+                for partition, partition_rows in groups.items():
+                    if partition[0] not in self._partitions:
+                        self._create_partition(conn, partition)
+                        created.append(partition)
+                    conn.executemany(self.INSERT_SQL.format(table=partition[0]), partition_rows)
+                for table, keys in delete_groups.items():
+                    if table in self._partitions:
+                        conn.executemany(f'''DELETE FROM {table} WHERE key=?''', keys)
+        if created:
+            with self._partition_lock:
+                self._partitions = {**self._partitions, **{table: (start, end) for table, start, end in created}}
+
+    def partitions(self):
+        """Return the partitions ``[(table, start, end)]`` in time order, the undated one first."""
+        return sorted(((name, start, end) for name, (start, end) in self._partitions.items()),
+                      key=lambda partition: (partition[1] is not None, partition[1] or 0))
+
+    def partition_stats(self):
+        """Return ``{'partition', 'start', 'end', 'rows', 'cold', 'segment_bytes'}`` per partition, in time order."""
+        with self._connection() as conn:
+            counts = dict(conn.execute('''SELECT partition, SUM(count) FROM partition_digests GROUP BY partition'''))
+        segments = self._segments
+        return [{'partition': name, 'start': start, 'end': end, 'rows': counts.get(name, 0), 'cold': name in segments,
+                 'segment_bytes': segments[name].nbytes if name in segments else 0}
+                for name, start, end in self.partitions()]
+
+    def drop_partitions(self, before):
+        """Drop every partition whose window ends at or before ``before`` (epoch seconds).
+
+        Each one costs a ``DROP TABLE``, the removal of its digests and of its segment file, whatever
+        its size; returns ``{'partitions': dropped, 'rows': rows dropped}``.
+        """
+        with self._cold_gate.exclusive():
+            with self._partition_lock:
+                expired = [name for name, (_, end) in self._partitions.items() if end is not None and end <= before]
+                if not expired:
+                    return {'partitions': 0, 'rows': 0}
+                self._partitions = {name: bounds for name, bounds in self._partitions.items() if name not in expired}
+            segments = [self._segments[name] for name in expired if name in self._segments]
+            if segments:
+                self._segments = {name: segment for name, segment in self._segments.items() if name not in expired}
+            rows = 0
+            with self._connection() as conn:
+                with conn:
+                    for name in expired:
+                        rows += conn.execute('''SELECT COALESCE(SUM(count), 0) FROM partition_digests
+                                                WHERE partition=?''', (name,)).fetchone()[0]
+                        conn.execute(f'''DROP TABLE IF EXISTS {name}''')
+                        conn.execute('''DELETE FROM partitions WHERE name=?''', (name,))
+                        conn.execute('''DELETE FROM partition_digests WHERE partition=?''', (name,))
+            for segment in segments:
+                segment.close()
+                os.remove(segment.path)
+        logger.info('Node %s dropped %d expired partitions (%d rows)', self.node_id, len(expired), rows)
+        return {'partitions': len(expired), 'rows': rows}
+
+    # --- Segmenti colonnari ---
+
+    def _segment_path(self, table):
+        return os.path.join(self.segment_dir, f'{table}.seg')
+
+    def _open_segments(self):
+        with self._connection() as conn:
+            cold = [name for name, in conn.execute('''SELECT name FROM partitions WHERE cold=1''')]
+        if cold and numpy is None:
+            raise RuntimeError(f'Node {self.node_id} has compacted partitions: numpy is required to read them')
+        segments = {name: Segment(self._segment_path(name)) for name in cold}
+        # File di una compattazione interrotta prima del commit o di una partizione già scongelata
+        if os.path.isdir(self.segment_dir):
+            for filename in os.listdir(self.segment_dir):
+                name, extension = os.path.splitext(filename)
+                if extension != '.seg' or name not in segments:
+                    os.remove(os.path.join(self.segment_dir, filename))
+        self._segments = segments
+
+    def _drop_digest_triggers(self, conn, table):
+        for operation in self.DIGEST_TRIGGERS:
+            conn.execute(f'''DROP TRIGGER IF EXISTS {table}_digest_{operation}''')
+
+    def _partition_fingerprint(self, table):
+        with self._connection() as conn:
+            return conn.execute('''SELECT bucket, digest, count FROM partition_digests WHERE partition=? AND count > 0
+                                    ORDER BY bucket''', (table,)).fetchall()
+
+    def compact_partitions(self, before):
+        """Compact every partition whose window ends at or before ``before`` into a columnar segment.
+
+        Returns ``{'partitions', 'rows', 'bytes'}``; without numpy nothing is compacted.
+        """
+        report = {'partitions': 0, 'rows': 0, 'bytes': 0}
+        if numpy is None:
+            return report
+        for table, _, end in self.partitions():
+            if end is None or end > before or table in self._segments:
+                continue
+            compacted = self._compact(table)
+            if compacted:
+                report['partitions'] += 1
+                report['rows'] += compacted[0]
+                report['bytes'] += compacted[1]
+        if report['partitions']:
+            logger.info('Node %s compacted %d partitions (%d rows, %d bytes)', self.node_id, report['partitions'],
+                        report['rows'], report['bytes'])
+        return report
+
+    def _compact(self, table):
+        """Move the rows of ``table`` a segment can rebuild exactly into one; return ``(rows, bytes)``.
+
+        The rows are read and encoded without blocking writers; if the partition changed meanwhile
+        (its digests differ) nothing happens and the next run tries again.
+        """
+        fingerprint = self._partition_fingerprint(table)
+        series, residual = {}, []
+        for row in self._query_partition(table, '''SELECT key, sensor_id, ts, value, bucket, h FROM {table}
+                                                   ORDER BY sensor_id, ts'''):
+            if segment_eligible(*row[:4]):
+                timestamps, values = series.setdefault(row[1], ([], []))
+                timestamps.append(row[2])
+                values.append(row[3])
+            else:
+                residual.append(row)  # chiavi non canoniche e valori non numerici restano nella tabella
+        if not series:
+            return None
+        path = self._segment_path(table)
+        os.makedirs(self.segment_dir, exist_ok=True)
+        with self._cold_gate.exclusive():
+            if table not in self._partitions or self._partition_fingerprint(table) != fingerprint:
+                return None
+            size = write_segment(path, series)
+            # Il segmento è visibile prima che le righe lascino la tabella (vedi _consistent)
+            self._segments = {**self._segments, table: Segment(path)}
+            try:
+                with self._connection() as conn:
+                    with conn:
+                        # Senza trigger i digest della partizione restano quelli delle righe, ora nel segmento
+                        self._drop_digest_triggers(conn, table)
+                        conn.execute(f'''DELETE FROM {table}''')
+                        conn.executemany(self.INSERT_SQL.format(table=table), residual)
+                        self._create_partition(conn, (table, *self._partitions[table]))
+                        conn.execute('''UPDATE partitions SET cold=1 WHERE name=?''', (table,))
+            except Exception:
+                self._segments = {name: segment for name, segment in self._segments.items() if name != table}
+                os.remove(path)
+                raise
+        return sum(len(timestamps) for timestamps, _ in series.values()), size
+
+    def _thaw(self, table):
+        """Move a compacted partition back into its table before it is written again."""
+        with self._cold_gate.exclusive():
+            segment = self._segments.get(table)
+            if segment is None:
+                return
+            rows = self._segment_rows(segment)
+            with self._connection() as conn:
+                with conn:
+                    self._drop_digest_triggers(conn, table)
+                    conn.executemany(self.INSERT_SQL.format(table=table), rows)
+                    self._create_partition(conn, (table, *self._partitions[table]))
+                    conn.execute('''UPDATE partitions SET cold=0 WHERE name=?''', (table,))
+            # Le righe sono già nella tabella quando il segmento sparisce (vedi _consistent)
+            self._segments = {name: other for name, other in self._segments.items() if name != table}
+            segment.close()
+            os.remove(segment.path)
+        logger.info('Node %s thawed partition %s (%d rows) to write it', self.node_id, table, len(rows))
+
+    def _consistent(self, read):
+        """Run ``read(segments)`` again until no partition was compacted or thawed while it ran.
+
+        A compaction publishes the segment before deleting the rows and a thaw restores the rows
+        before retiring the segment: a read that saw the same segments throughout missed no row,
+        though it may meet a row in both places. A retired segment is closed, so a read using it
+        fails and is run again too.
+        """
+        while True:
+            segments = self._segments
+            try:
+                result = read(segments)
+            except (TypeError, ValueError):
+                if self._segments is segments:
+                    raise
+                continue
+            if self._segments is segments:
+                return result
+
+    @staticmethod
+    def _segment_value(segment, key):
+        sensor_id, ts = split_key(key)
+        if segment is None or key != f'{sensor_id}:{ts}':
+            return None
+        return segment.lookup(sensor_id, ts)
+
+    @staticmethod
+    def _segment_rows(segment, buckets=None):
+        """Return the full rows ``(key, sensor_id, ts, value, bucket, h)`` of ``segment`` (only in ``buckets``)."""
+        rows = []
+        for sensor_id, timestamps, values in segment.series():
+            for ts, value in zip(timestamps.tolist(), stored_values(values)):
+                key = f'{sensor_id}:{ts}'
+                bucket = key_bucket(key)
+                if buckets is None or bucket in buckets:
+                    rows.append((key, sensor_id, ts, value, bucket, row_hash(key, value)))
+        return rows
+
+    @staticmethod
+    def _segment_scan(segment, sensor_id, start, end, after, limit):
+        """Return ``(ts, key, value)`` rows of a sensor from ``segment``, as :meth:`scan_sensor`."""
+        timestamps, values = segment.arrays(sensor_id, start, end)
+        if after is not None and after[0] is not None:
+            after_ts, after_key = after
+            skip = int(numpy.searchsorted(timestamps, after_ts, side='right'))
+            # Stesso timestamp del cursore: la riga segue solo se la sua chiave è maggiore
+            if skip and timestamps[skip - 1] == after_ts and f'{sensor_id}:{after_ts}' > after_key:
+                skip -= 1
+            timestamps, values = timestamps[skip:], values[skip:]
+        if limit is not None:
+            timestamps, values = timestamps[:limit], values[:limit]
+        return [(ts, f'{sensor_id}:{ts}', value) for ts, value in zip(timestamps.tolist(), stored_values(values))]
+
+    @staticmethod
+    def _merge(first, second, key, limit=None):
+        """Merge two sorted row lists, keeping one row per ``key`` value."""
+        merged, last = [], None
+        for row in heapq.merge(first, second, key=key):
+            if merged and key(row) == last:
+                continue
+            merged.append(row)
+            last = key(row)
+            if limit is not None and len(merged) >= limit:
+                break
+        return merged
+
+    def _union(self, select, params, order=None, limit=None):
+        """Run ``select`` (with a ``{table}`` placeholder) on every partition as one ``UNION ALL`` query.
+
+        With ``order`` SQLite merges the ordered results of the partitions, so ``limit`` rows cost about
+        ``limit`` index reads. Past ``MAX_COMPOUND`` partitions (or the bound variables limit) the query
+        runs in chunks merged here.
+        """
+        tables = [name for name, _, _ in self.partitions()]
+        size = max(1, min(self.MAX_COMPOUND, 30000 // max(1, len(params))))
+        for attempt in range(2):
+            try:
+                results = []
+                with self._connection() as conn:
+                    for i in range(0, len(tables), size):
+                        chunk = tables[i:i + size]
+                        query = ' UNION ALL '.join(select.format(table=table) for table in chunk)
+                        if order:
+                            query += f' ORDER BY {order}'
+                        if limit is not None:
+                            query += f' LIMIT {int(limit)}'
+                        results.append(conn.execute(query, list(params) * len(chunk)).fetchall())
+                break
+            except sqlite3.OperationalError as e:
+                # Partizione eliminata dalla retention: la cache è già aggiornata, si ripete senza
+                if attempt or 'no such table' not in str(e):
+                    raise
+                tables = [name for name in tables if name in self._partitions]
+        if len(results) <= 1:
+            return results[0] if results else []
+        if order:
+            rows = list(heapq.merge(*results, key=lambda row: row[0]))
+            return rows[:limit] if limit is not None else rows
+        return [row for rows in results for row in rows]
+
+    @staticmethod
+    def _row(key, value):
+        # L'hash di riga usa il valore come verrà memorizzato, identico su ogni replica
+        sensor_id, ts = split_key(key)
+        value = numeric_value(value)
+        return key, sensor_id, ts, value, key_bucket(key), row_hash(key, value)
+
+    def _open_connection(self):
+        # check_same_thread=False: la connessione passa tra i thread del server Flask,
+        # ma il pool garantisce che sia usata da un solo thread alla volta.
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        return conn
+
+    def _acquire(self):
+        if self.pool_size <= 0:
+            return self._open_connection()
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            if self._opened < self.pool_size:
+                self._opened += 1
+                return self._open_connection()
+        return self._pool.get()
+
+    def _release(self, conn):
+        if self.pool_size <= 0:
             conn.close()
+        else:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a connection from the node pool for the duration of the block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def close(self):
+        """Save the Bloom filter and close every pooled connection of the node."""
+        if self.bloom is not None:
+            with self._bloom_lock:
+                self.bloom.save(self.bloom_path, self.table_fingerprint())
+        with self._pool_lock:
+            while True:
+                try:
+                    conn = self._pool.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+                self._opened -= 1
+        for segment in self._segments.values():
+            segment.close()
+
+    # --- Filtro di Bloom ---
+
+    def table_fingerprint(self):
+        """Return ``(rows, xor of bucket digests)``: it identifies the set of stored rows."""
+        rows, digest = 0, 0
+        # Sempre lo stato di SQLite, anche per le sottoclassi che bufferizzano le scritture
+        for bucket_digest, count in StorageNode.bucket_digests(self).values():
+            rows += count
+            digest ^= bucket_digest
+        return rows, digest
+
+    def _remember(self, keys):
+        # Le chiavi entrano nel filtro prima del commit: una lettura non le scarta mai per errore
+        if self.bloom is None:
+            return
+        with self._bloom_lock:
+            self.bloom.update(keys)
+            if self._bloom_pending is not None:
+                self._bloom_pending.extend(keys)
+            saturated = self.bloom.saturated() and not self._bloom_rebuilding
+            if saturated:
+                self._bloom_rebuilding = True
+        if saturated:
+            threading.Thread(target=self.rebuild_bloom, name=f'bloom-rebuild-{self.node_id}', daemon=True).start()
+
+    def rebuild_bloom(self):
+        """Rebuild the filter from the stored keys, sized for twice the current row count."""
+        if not self.bloom_capacity:
+            return
+        with self._bloom_lock:
+            self._bloom_rebuilding = True
+            self._bloom_pending = []
+        try:
+            with self._connection() as conn:
+                rows = conn.execute('''SELECT COALESCE(SUM(count), 0) FROM partition_digests''').fetchone()[0]
+            bloom = BloomFilter(max(self.bloom_capacity, 2 * rows), self.bloom_error_rate)
+            bloom.update(self._consistent(self._all_keys))
+            with self._bloom_lock:
+                # Le scritture arrivate durante la scansione e quelle non ancora in SQLite
+                bloom.update(self._bloom_pending)
+                bloom.update(self._unflushed_keys())
+                self.bloom = bloom
+        finally:
+            with self._bloom_lock:
+                self._bloom_pending = None
+                self._bloom_rebuilding = False
+
+    def _all_keys(self, segments):
+        keys = [key for key, in self._union('''SELECT key FROM {table}''', ())]
+        for segment in segments.values():
+            for sensor_id, timestamps, _ in segment.series():
+                keys.extend(f'{sensor_id}:{ts}' for ts in timestamps.tolist())
+        return keys
+
+    def _unflushed_keys(self):
+        return ()
+
+    def might_contain(self, key):
+        """False only when the node certainly does not store ``key``."""
+        bloom = self.bloom
+        if bloom is None or key in bloom:
+            return True
+        self.bloom_negatives += 1
+        return False
+
+    def bloom_stats(self):
+        bloom = self.bloom
+        if bloom is None:
+            return None
+        return {'keys': bloom.count, 'capacity': bloom.capacity, 'bits': bloom.num_bits,
+                'hashes': bloom.num_hashes, 'negatives': self.bloom_negatives}
+
+    # --- Operazioni del nodo ---
+
+    def _query_partition(self, table, query, params=()):
+        """Run ``query`` (with a ``{table}`` placeholder) on one partition; a missing partition has no rows."""
+        if table not in self._partitions:
+            return []
+        try:
+            with self._connection() as conn:
+                return conn.execute(query.format(table=table), params).fetchall()
+        except sqlite3.OperationalError as e:
+            # Partizione eliminata dalla retention durante la lettura
+            if 'no such table' not in str(e):
+                raise
+            return []
 
     def write(self, key, value):
         if self.alive:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''INSERT OR REPLACE INTO measurements (key, value) VALUES (?, ?)''', (key, value))
-            conn.commit()
-            conn.close()
+            self._remember([key])
+            self._write_rows([self._row(key, value)])
+
+    def write_many(self, rows):
+        """Write a list of (key, value) pairs in a single transaction."""
+        if self.alive and rows:
+            self._remember([key for key, _ in rows])
+            self._write_rows([self._row(key, value) for key, value in rows])
 
     def read(self, key):
-        if self.alive:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''SELECT value FROM measurements WHERE key=?''', (key,))
-            result = cursor.fetchone()
-            conn.close()
-            return result[0] if result else None
+        if self.alive and self.might_contain(key):
+            query = '''SELECT value FROM {table} WHERE key=?'''
+            return self._consistent(lambda segments: self._read_column(segments, key, query))
+
+    def _read_column(self, segments, key, query):
+        """Return the first column of ``query`` for ``key``, or the value from the partition's segment."""
+        table = self._key_partition(key)
+        result = self._query_partition(table, query, (key,))
+        if result:
+            return result[0][0]
+        return self._segment_value(segments.get(table), key)
 
     def delete(self, key):
-        if self.alive:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''DELETE FROM measurements WHERE key=?''', (key,))
-            conn.commit()
-            conn.close()
+        if self.alive and self.might_contain(key):
+            self._write_rows([], [key])
 
     def key_exists(self, key):
         if self.alive:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''SELECT 1 FROM measurements WHERE key=?''', (key,))
-            exists = cursor.fetchone() is not None
-            conn.close()
-            return exists
+            if not self.might_contain(key):
+                return False
+            query = '''SELECT 1 FROM {table} WHERE key=?'''
+            return self._consistent(lambda segments: self._read_column(segments, key, query)) is not None
+
+    def _scan_partitions(self, start, end, after_ts):
+        """Return the partitions that can hold rows with ``start <= ts < end`` after ``after_ts``, in time order."""
+        selected = []
+        for table, partition_start, partition_end in self.partitions():
+            if partition_start is None:
+                # Le righe senza timestamp vengono ordinate per prime e non cadono in nessun intervallo
+                if start is None and end is None and after_ts is None:
+                    selected.append(table)
+            elif ((start is None or partition_end > start) and (end is None or partition_start < end)
+                  and (after_ts is None or partition_end > after_ts)):
+                selected.append(table)
+        return selected
+
+    def scan_sensor(self, sensor_id, start=None, end=None, limit=None, after=None):
+        """Return ``(ts, key, value)`` rows of a sensor ordered by time, with ``start <= ts < end``.
+
+        ``after`` is a ``(ts, key)`` keyset cursor: only rows strictly after it are returned. Only the
+        partitions overlapping the interval are read, in time order, until ``limit`` rows are found.
+        """
+        if not self.alive:
+            return []
+        query = '''SELECT ts, key, value FROM {table} WHERE sensor_id=?'''
+        params = [sensor_id]
+        if start is not None:
+            query += ' AND ts >= ?'
+            params.append(start)
+        if end is not None:
+            query += ' AND ts < ?'
+            params.append(end)
+        if after is not None:
+            after_ts, after_key = after
+            if after_ts is None:
+                # Le righe senza timestamp vengono ordinate per prime
+                query += ' AND ((ts IS NULL AND key > ?) OR ts IS NOT NULL)'
+                params.append(after_key)
+            else:
+                query += ' AND (ts > ? OR (ts = ? AND key > ?))'
+                params.extend((after_ts, after_ts, after_key))
+        query += ' ORDER BY ts, key LIMIT ?'
+        tables = self._scan_partitions(start, end, after[0] if after is not None else None)
+
+        def scan(segments):
+            rows = []
+            for table in tables:
+                remaining = None if limit is None else limit - len(rows)
+                partition_rows = self._query_partition(table, query, params + [-1 if remaining is None else remaining])
+                if table in segments:
+                    cold_rows = self._segment_scan(segments[table], sensor_id, start, end, after, remaining)
+                    partition_rows = self._merge(partition_rows, cold_rows, lambda row: (row[0], row[1]), remaining)
+                rows.extend(partition_rows)
+                if limit is not None and len(rows) >= limit:
+                    break
+            return rows
+        return self._consistent(scan)
+
+    def iter_sensor(self, sensor_id, start=None, end=None, after=None, batch_size=1000):
+        """Iterate over a sensor's rows in time order, fetching ``batch_size`` rows per query."""
+        while True:
+            rows = self.scan_sensor(sensor_id, start, end, batch_size, after)
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][:2]
+
+    def sensor_arrays(self, sensor_id, start=None, end=None):
+        """Return a sensor's numeric samples with ``start <= ts < end`` as ``(timestamps int64, values float64)``.
+
+        Compacted partitions are decoded straight from their segments. Rows without a timestamp or with a
+        non-numeric value are skipped; of several rows on the same timestamp the SQLite one is kept.
+        """
+        analytics.require_numpy()
+        if not self.alive:
+            return analytics.empty_series()
+        query = '''SELECT ts, value FROM {table} WHERE sensor_id=? AND ts IS NOT NULL
+                   AND typeof(value) IN ('integer', 'real')'''
+        params = [sensor_id]
+        if start is not None:
+            query += ' AND ts >= ?'
+            params.append(start)
+        if end is not None:
+            query += ' AND ts < ?'
+            params.append(end)
+        tables = self._scan_partitions(start, end, None)
+
+        def load(segments):
+            parts = []
+            for table in tables:
+                rows = self._query_partition(table, query, params)
+                if rows:
+                    samples = numpy.fromiter(rows, dtype=analytics.SAMPLE_DTYPE, count=len(rows))
+                    parts.append((samples['ts'], samples['value']))
+                if table in segments:
+                    parts.append(segments[table].arrays(sensor_id, start, end))
+            return analytics.merge_samples(parts)
+        return self._consistent(load)
+
+    def rows_page(self, after_key=None, limit=1000):
+        """Return up to ``limit`` ``(key, value)`` pairs with key greater than ``after_key``, in key order."""
+        if not self.alive:
+            return []
+
+        def page(segments):
+            if after_key is None:
+                rows = self._union('''SELECT key, value FROM {table}''', (), order='key', limit=limit)
+            else:
+                rows = self._union('''SELECT key, value FROM {table} WHERE key > ?''', (after_key,), order='key',
+                                   limit=limit)
+            for segment in segments.values():
+                rows = self._merge(rows, segment.rows_page(after_key, limit), lambda row: row[0], limit)
+            return rows
+        return self._consistent(page)
+
+    def iter_rows(self, after_key=None, batch_size=1000):
+        """Iterate over ``(key, value)`` pairs in key order using keyset pagination.
+
+        The pooled connection is released between batches, so a slow consumer never holds it.
+        """
+        while True:
+            rows = self.rows_page(after_key, batch_size)
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after_key = rows[-1][0]
+
+    def rows_in_ranges(self, ranges, hash_function='md5', after_key=None, limit=1000):
+        """Return the next page of ``(key, value)`` pairs whose ring hash falls in ``ranges``, in key order.
+
+        Ring positions are not stored, so the node pages through its keys and hashes them itself: only
+        the matching rows leave it. Returns ``(rows, last_key, scanned)`` with the last key examined
+        (``None`` at the end of the node) and how many rows were examined.
+        """
+        contains = range_filter(ranges, hash_function)
+        rows, scanned = [], 0
+        while len(rows) < limit:
+            page = self.rows_page(after_key, limit)
+            scanned += len(page)
+            rows.extend(row for row in page if contains(row[0]))
+            if len(page) < limit:
+                return rows, None, scanned
+            after_key = page[-1][0]
+        return rows, after_key, scanned
 
     def fail(self):
         self.alive = False
 
-    def recover(self, active_nodes, strategy='full'):
+    def recover(self, active_nodes, strategy='full', retention_before=None):
         if not self.alive:
             self.alive = True
-            if strategy == 'full':
-                self.sync_with_active_nodes(active_nodes)
+            # Le partizioni scadute durante il fermo si eliminano prima di confrontarsi con i peer
+            if retention_before is not None:
+                self.drop_partitions(retention_before)
+            report = self.sync_with_active_nodes(active_nodes) if strategy == 'full' else None
+            # Il nuovo filtro non contiene più le chiavi cancellate
+            self.rebuild_bloom()
+            return report
+        return None
 
     def is_alive(self):
         return self.alive
 
     def sync_with_active_nodes(self, active_nodes):
-        all_keys = set()
-        for node in active_nodes:
-            if node.is_alive() and node.node_id != self.node_id:
-                conn = sqlite3.connect(node.db_path)
-                cursor = conn.cursor()
-                cursor.execute('''SELECT key, value FROM measurements''')
-                rows = cursor.fetchall()
-                conn.close()
-                for key, value in rows:
-                    self.write(key, value)
-                    all_keys.add(key)
+        """Anti-entropy: copy only the hash ranges whose Merkle digests differ from the alive peers."""
+        peers = [node for node in active_nodes if node.is_alive() and node.node_id != self.node_id]
+        return sync_node(self, peers)
+
+    def bucket_digests(self):
+        # Lo XOR e i conteggi delle partizioni si combinano bucket per bucket
+        digests = {}
+        with self._connection() as conn:
+            for bucket, digest, count in conn.execute('''SELECT bucket, digest, count FROM partition_digests
+                                                         WHERE count > 0'''):
+                total_digest, total_count = digests.get(bucket, (0, 0))
+                digests[bucket] = (total_digest ^ digest, total_count + count)
+        return digests
+
+    def merkle_tree(self):
+        return build_tree(self.bucket_digests())
+
+    def rows_in_buckets(self, buckets):
+        """Return the full rows ``(key, sensor_id, ts, value, bucket, h)`` stored in ``buckets``."""
+        placeholders = ','.join('?' * len(buckets))
+
+        def read(segments):
+            rows = {row[0]: row for row in self._union(f'''SELECT key, sensor_id, ts, value, bucket, h FROM {{table}}
+                                                           WHERE bucket IN ({placeholders})''', list(buckets))}
+            for segment in segments.values():
+                for row in self._segment_rows(segment, set(buckets)):
+                    rows.setdefault(row[0], row)
+            return list(rows.values())
+        return self._consistent(read)
+
+    def rows_for_keys(self, keys):
+        """Return the full rows ``(key, sensor_id, ts, value, bucket, h)`` of the given keys."""
+        groups = {}
+        for key in keys:
+            groups.setdefault(self._key_partition(key), []).append(key)
+
+        def read(segments):
+            rows = {}
+            for table, table_keys in groups.items():
+                for i in range(0, len(table_keys), 500):
+                    chunk = table_keys[i:i + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    rows.update((row[0], row) for row in self._query_partition(
+                        table, f'''SELECT key, sensor_id, ts, value, bucket, h FROM {{table}}
+                                   WHERE key IN ({placeholders})''', chunk))
+                for key in table_keys:
+                    value = None if key in rows else self._segment_value(segments.get(table), key)
+                    if value is not None:
+                        rows[key] = (key, *split_key(key), value, key_bucket(key), row_hash(key, value))
+            return list(rows.values())
+        return self._consistent(read)
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''SELECT key FROM measurements''')
-        self_keys = cursor.fetchall()
-        conn.close()
+    def row_hashes_in_buckets(self, buckets):
+        placeholders = ','.join('?' * len(buckets))
 
-        for (key,) in self_keys:
-            if key not in all_keys:
-                self.delete(key)
+        def read(segments):
+            hashes = dict(self._union(f'''SELECT key, h FROM {{table}} WHERE bucket IN ({placeholders})''',
+                                      list(buckets)))
+            for segment in segments.values():
+                for row in self._segment_rows(segment, set(buckets)):
+                    hashes.setdefault(row[0], row[5])
+            return hashes
+        return self._consistent(read)
+
+    def apply_rows(self, rows, deletes=()):
+        """Upsert full rows and delete keys in a single transaction (used by the anti-entropy sync)."""
+        if not rows and not deletes:
+            return
+        self._remember([row[0] for row in rows])
+        self._write_rows(rows, deletes)
 
     def get_all_keys(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''SELECT key, value FROM measurements''')
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
+        def read(segments):
+            rows = dict(self._union('''SELECT key, value FROM {table}''', ()))
+            for segment in segments.values():
+                for sensor_id, timestamps, values in segment.series():
+                    for ts, value in zip(timestamps.tolist(), stored_values(values)):
+                        rows.setdefault(f'{sensor_id}:{ts}', value)
+            return list(rows.items())
+        return self._consistent(read)
 
     # Compatibility helper used by EnergyGuardRing
     def get_all_data(self):
@@ -108,61 +961,339 @@ class StorageNode:
 
 
 class MeasurementReplicationManager:
-    def __init__(self, num_nodes=3, port=5000, strategy='full', replication_factor=None):
+    def __init__(self, num_nodes=3, port=5000, strategy='full', replication_factor=None, node_options=None,
+                 fanout_options=None, ring_options=None, hint_batch_size=500, storage_backend='sqlite',
+                 node_mode='inprocess', node_host='127.0.0.1', node_port_base=None, rpc_pool_size=8,
+                 alert_options=None, rollup_interval=1.0, cache_options=None, metrics_enabled=True,
+                 rebalance_options=None, retention_seconds=None, retention_interval=60, cold_after=None):
         self.num_nodes = num_nodes
+        self.metrics = MetricsRegistry(metrics_enabled)
         self.strategy = strategy
-        self.nodes = [StorageNode(i, port + i) for i in range(num_nodes)]
+        self.ring_options = ring_options or {}
+        node_options = node_options or {}
+        self.node_mode = node_mode
+        self._node_processes = []
+        if node_mode == 'process':
+            # Un processo per nodo, raggiunto tramite RPC; la porta base di default segue quella del server API
+            from .rpc import spawn_nodes
+            self._spawn_options = (storage_backend, node_options, node_host, node_port_base or port + 1,
+                                   rpc_pool_size)
+            self.nodes, self._node_processes = spawn_nodes(range(num_nodes), *self._spawn_options)
+        elif node_mode == 'inprocess':
+            node_class = self._node_class(storage_backend)
+            self._spawn_options = (node_class, port, node_options)
+            self.nodes = [node_class(i, port + i, **node_options) for i in range(num_nodes)]
+        else:
+            raise ValueError(f'Unsupported node mode: {node_mode}')
+        # Gli id dei nodi non vengono riusati nella vita del processo
+        self._next_node_id = num_nodes
+        self.rebalance_options = rebalance_options or {}
+        self._rebalance = None
+        self._rebalance_lock = threading.Lock()
+        self._gate = WriteGate()
         self.hash_ring = None
-        self.alert_manager = AlertManager()
+        self.alert_manager = AlertManager(metrics=self.metrics, **(alert_options or {}))
+        self.fanout = ReplicaFanout(**(fanout_options or {}))
+        self.hint_log = HintLog(os.path.join(node_options.get('data_dir', 'data'), 'hints.db'),
+                                node_options.get('synchronous', 'NORMAL'))
+        self.hint_batch_size = hint_batch_size
+        # cache_options=None: cache disattivata
+        self.cache = MeasurementCache(**cache_options) if cache_options is not None else None
+        self.rollups = RollupStore(os.path.join(node_options.get('data_dir', 'data'), 'rollups.db'),
+                                   lambda sensor_id, start, end: self.iter_sensor_history(sensor_id, start, end),
+                                   node_options.get('synchronous', 'NORMAL'), rollup_interval,
+                                   degraded=lambda: not all(node.is_alive() for node in self.nodes))
 
         if strategy == 'consistent':
-            self.hash_ring = EnergyGuardRing(self.nodes, replication_factor=replication_factor)
+            self.hash_ring = EnergyGuardRing(self.nodes, replication_factor=replication_factor, **self.ring_options)
+        self._instrument()
 
-    def set_replication_strategy(self, strategy, replication_factor=None):
-        self.strategy = strategy
-        if strategy == 'consistent':
-            self.hash_ring = EnergyGuardRing(self.nodes, replication_factor=replication_factor)
-        else:
-            self.hash_ring = None
+        # Ogni retention_interval le partizioni più vecchie di retention_seconds vengono eliminate
+        # e quelle più vecchie di cold_after compattate in segmenti colonnari
+        self.retention_seconds = retention_seconds
+        self.cold_after = cold_after
+        self._retention_stop = threading.Event()
+        self._retention_worker = None
+        if (retention_seconds or cold_after) and retention_interval:
+            self._retention_worker = threading.Thread(target=self._retention_loop, args=(retention_interval,),
+                                                      name='retention', daemon=True)
+            self._retention_worker.start()
+
+    def _instrument(self):
+        metrics = self.metrics
+        self.operation_latency = metrics.histogram(
+            'energyguard_operation_seconds', 'Latency of measurement operations', ('operation',))
+        self.ring_latency = metrics.histogram(
+            'energyguard_ring_lookup_seconds', 'Latency of the replica placement of one key')
+        self.node_latency = metrics.histogram(
+            'energyguard_node_operation_seconds', 'Latency of one call to a storage node', ('operation', 'node'))
+        self.serialization_latency = metrics.histogram(
+            'energyguard_serialization_seconds', 'Latency of request decoding and response encoding',
+            ('format', 'direction'))
+        self.replica_failures = metrics.counter(
+            'energyguard_replica_failures_total', 'Storage node calls that raised an error', ('operation', 'node'))
+        self.retention_dropped = metrics.counter(
+            'energyguard_retention_dropped_partitions_total', 'Partitions dropped by the retention policy', ('node',))
+        self.partitions_compacted = metrics.counter(
+            'energyguard_compacted_partitions_total', 'Partitions compacted into columnar segments', ('node',))
+        metrics.collected('energyguard_node_up', 'Whether a storage node is alive', 'gauge',
+                          lambda: {node.node_id: int(node.is_alive()) for node in self.nodes}, ('node',))
+        metrics.collected('energyguard_hint_backlog', 'Hinted operations waiting for their target node', 'gauge',
+                          lambda: {node.node_id: self.hint_backlog().get(node.node_id, 0) for node in self.nodes},
+                          ('node',))
+        if self.cache is not None:
+            for field in ('hits', 'misses', 'evictions', 'expirations', 'invalidations'):
+                metrics.collected(f'energyguard_cache_{field}_total', f'Measurement cache {field}', 'counter',
+                                  lambda field=field: getattr(self.cache, field))
+            metrics.collected('energyguard_cache_entries', 'Entries in the measurement cache', 'gauge',
+                              lambda: self.cache.stats()['entries'])
+
+    def _node_call(self, node, operation, *args):
+        """Call ``node.<operation>(*args)`` recording its latency and failures."""
+        start = time.perf_counter()
+        try:
+            return getattr(node, operation)(*args)
+        except Exception:
+            self.replica_failures.inc(1, operation, node.node_id)
+            raise
+        finally:
+            self.node_latency.observe(time.perf_counter() - start, operation, node.node_id)
+
+    @staticmethod
+    def _node_class(storage_backend):
+        if storage_backend == 'sqlite':
+            return StorageNode
+        if storage_backend == 'wal':
+            from .walstore import WalStorageNode
+            return WalStorageNode
+        raise ValueError(f'Unsupported storage backend: {storage_backend}')
+
+    STRATEGIES = ('full', 'consistent')
+
+    def set_replication_strategy(self, strategy, replication_factor=None, wait=False):
+        """Switch to ``strategy`` and migrate the stored data to the new placement in the background.
+
+        Missing replicas are copied and surplus ones deleted by a :class:`Rebalance`; until it completes
+        reads try both placements. Raises ``ValueError`` while a node is down or another rebalance runs.
+        Returns the migration status (the final one with ``wait``).
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f'Unsupported replication strategy: {strategy}')
+        with self._rebalance_lock:
+            self._check_rebalance()
+            job = self._start_rebalance('strategy', None, list(self.nodes), lambda: None, strategy,
+                                        replication_factor)
+        return job.wait() if wait else job.status()
+
+    def _replica_plan(self, key):
+        """Return ``(nodes, hints)`` for ``key``: the alive replicas plus, for every dead replica,
+        the next alive node of the preference list, and the ``(target, holder)`` hints to record.
+        """
+        start = time.perf_counter()
+        plan = self._place_key(key)
+        self.ring_latency.observe(time.perf_counter() - start)
+        return plan
+
+    def _place_key(self, key):
+        if self.strategy != 'consistent':
+            return [node for node in self.nodes if node.is_alive()], []
+        responsible = self.hash_ring.get_nodes_for_key(key)
+        nodes = [node for node in responsible if node.is_alive()]
+        if len(nodes) == len(responsible):
+            return nodes, []
+        dead = [node for node in responsible if not node.is_alive()]
+        fallbacks = [node for node in self.hash_ring.get_preference_list(key)[len(responsible):] if node.is_alive()]
+        hints = []
+        for target, holder in zip(dead, fallbacks):
+            nodes.append(holder)
+            hints.append((target.node_id, holder.node_id))
+        return nodes, hints
+
+    def _alive_replicas(self, key):
+        return self._replica_plan(key)[0]
+
+    def _read_plan(self, key):
+        """Replicas to read ``key`` from: while data is being moved, the current ones followed by the
+        other owners under the old and the new placement.
+        """
+        nodes = self._alive_replicas(key)
+        job = self._rebalance
+        if job is not None and job.dual_read:
+            nodes = nodes + [node for node in dict.fromkeys((*job.old_owners(key), *job.new_owners(key)))
+                             if node not in nodes and node.is_alive()]
+        return nodes
+
+    def _copying(self):
+        """The rebalance whose new owners must receive the writes, if one is copying data."""
+        job = self._rebalance
+        return job if job is not None and job.dual_write else None
+
+    def _write_plan(self, key):
+        """Like :meth:`_replica_plan`, plus the new owners of ``key`` while a rebalance copies its range."""
+        nodes, hints = self._replica_plan(key)
+        job = self._copying()
+        if job is not None:
+            nodes = nodes + [node for node in job.new_owners(key) if node not in nodes and node.is_alive()]
+        return nodes, hints
+
+    def _touch(self, keys):
+        """Report keys just written to the copying rebalance: a page it copies may be older than them."""
+        job = self._copying()
+        if job is not None:
+            job.touch(keys)
 
     def store_measurement(self, key, value):
-        if self.strategy == 'full':
-            for node in self.nodes:
-                if node.is_alive():
-                    node.write(key, value)
-        elif self.strategy == 'consistent':
-            for node in self.hash_ring.get_nodes_for_key(key):
-                if node.is_alive():
-                    node.write(key, value)
+        start = time.perf_counter()
+        self._gate.acquire_shared()
+        try:
+            # Scrittura in parallelo sulle repliche: ritorna dopo W conferme
+            nodes, hints = self._write_plan(key)
+            try:
+                self.fanout.write(nodes, lambda node: self._node_call(node, 'write', key, value))
+            finally:
+                self._touch([key])
+        finally:
+            self._gate.release_shared()
+        self._after_store(key, value, hints)
+        self.operation_latency.observe(time.perf_counter() - start, 'store')
 
-        # --- Controllo anomalie ---
+    async def astore_measurement(self, key, value):
+        loop = asyncio.get_running_loop()
+        if not self._gate.acquire_shared(blocking=False):
+            # Un ribilanciamento sta installando la nuova disposizione: l'attesa avviene in un thread,
+            # non nell'event loop
+            return await loop.run_in_executor(None, self.store_measurement, key, value)
+        start = time.perf_counter()
         try:
-            sensor_id, timestamp = key.split(":", 1)  # dividi solo alla prima occorrenza
-            self.alert_manager.check_for_anomaly(sensor_id, value, timestamp)
-        except Exception as e:
-            print(f"[ALERT ERROR] Failed to check anomaly for key {key}: {e}")
+            nodes, hints = self._write_plan(key)
+            try:
+                await self.fanout.awrite(nodes, lambda node: self._node_call(node, 'write', key, value))
+            finally:
+                self._touch([key])
+        finally:
+            self._gate.release_shared()
+        # Suggerimenti e rollup scrivono su SQLite: fuori dall'event loop
+        await loop.run_in_executor(None, self._after_store, key, value, hints)
+        self.operation_latency.observe(time.perf_counter() - start, 'store')
+
+    def _after_store(self, key, value, hints):
+        if hints:
+            self.hint_log.add([(target, holder, key, 'put') for target, holder in hints])
+        self.rollups.mark([key])
+        if self.cache:
+            self.cache.invalidate([key])
+
+        # --- Controllo anomalie ---
+        self._check_alerts([(key, value)])
 
+    def store_measurements(self, batch):
+        """Store a batch of (key, value) pairs with one transaction per replica node."""
+        batch = list(batch)
+        if not batch:
+            return 0
+        start = time.perf_counter()
 
+        with self._gate.shared():
+            # Raggruppa le chiavi per nodo responsabile
+            groups = {}
+            hints = []
+            if self.strategy == 'full' and self._copying() is None:
+                for node in self.nodes:
+                    if node.is_alive():
+                        groups[node.node_id] = (node, batch)
+            else:
+                for key, value in batch:
+                    nodes, key_hints = self._write_plan(key)
+                    for node in nodes:
+                        groups.setdefault(node.node_id, (node, []))[1].append((key, value))
+                    hints.extend((target, holder, key, 'put') for target, holder in key_hints)
 
+            # I gruppi contengono chiavi diverse: si attende la conferma di tutti i nodi
+            try:
+                self.fanout.write([node for node, _ in groups.values()],
+                                  lambda node: self._node_call(node, 'write_many', groups[node.node_id][1]),
+                                  quorum=len(groups))
+            finally:
+                self._touch(key for key, _ in batch)
+        self.hint_log.add(hints)
+        self.rollups.mark(key for key, _ in batch)
+        if self.cache:
+            self.cache.invalidate([key for key, _ in batch])
+
+        self._check_alerts(batch)
+        self.operation_latency.observe(time.perf_counter() - start, 'store_batch')
+        return len(batch)
+
+    def _check_alerts(self, rows):
+        measurements = []
+        for key, value in rows:
+            sensor_id, sep, timestamp = key.partition(":")  # dividi solo alla prima occorrenza
+            if sep:
+                measurements.append((sensor_id, value, timestamp))
+            else:
+                sampled_logger.warning('Skipping anomaly check for key %s: not a sensor:timestamp key', key)
+        # Il controllo avviene fuori dal percorso di scrittura, nel worker dell'AlertManager
+        self.alert_manager.submit(measurements)
 
     def retrieve_measurement(self, key):
-        if self.strategy == 'full':
-            for node in self.nodes:
-                if node.is_alive():
-                    result = node.read(key)
-                    if result is not None:
-                        return {'value': result, 'message': f'Retrieved from node {node.node_id}'}
-        elif self.strategy == 'consistent':
-            node = self.hash_ring.get_node(key)
-            if node and node.is_alive():
-                result = node.read(key)
-                if result is not None:
-                    return {'value': result, 'message': f'Retrieved from node {node.node_id}'}
+        start = time.perf_counter()
+        if self.cache is None:
+            node, result = self.fanout.read(self._read_plan(key), lambda n: self._node_call(n, 'read', key))
+            return self._retrieved(node, result, start)
+        cached = self.cache.get(key)
+        if cached is not MISSING:
+            self.operation_latency.observe(time.perf_counter() - start, 'retrieve')
+            return {'value': cached, 'message': 'Retrieved from cache'}
+        token = self.cache.reserve()
+        node, result = None, None
+        try:
+            node, result = self.fanout.read(self._read_plan(key), lambda n: self._node_call(n, 'read', key))
+        finally:
+            self.cache.fill(key, result, token)
+        return self._retrieved(node, result, start)
+
+    async def aretrieve_measurement(self, key):
+        start = time.perf_counter()
+        if self.cache is None:
+            node, result = await self.fanout.aread(self._read_plan(key),
+                                                   lambda n: self._node_call(n, 'read', key))
+            return self._retrieved(node, result, start)
+        cached = self.cache.get(key)
+        if cached is not MISSING:
+            self.operation_latency.observe(time.perf_counter() - start, 'retrieve')
+            return {'value': cached, 'message': 'Retrieved from cache'}
+        token = self.cache.reserve()
+        node, result = None, None
+        try:
+            node, result = await self.fanout.aread(self._read_plan(key),
+                                                   lambda n: self._node_call(n, 'read', key))
+        finally:
+            self.cache.fill(key, result, token)
+        return self._retrieved(node, result, start)
+
+    def _retrieved(self, node, result, start):
+        self.operation_latency.observe(time.perf_counter() - start, 'retrieve')
+        if result is not None:
+            return {'value': result, 'message': f'Retrieved from node {node.node_id}'}
         return {'value': None, 'message': 'Measurement not found or all nodes are down'}
 
     def delete_measurement(self, key):
-        for node in self.nodes:
-            node.delete(key)
+        start = time.perf_counter()
+        with self._gate.shared():
+            job = self._copying()
+            try:
+                for node in self.nodes + job.joining if job is not None else self.nodes:
+                    self._node_call(node, 'delete', key)
+            finally:
+                self._touch([key])
+        if self.strategy == 'consistent':
+            # Le repliche morte riceveranno la cancellazione al recupero
+            self.hint_log.add([(node.node_id, None, key, 'del')
+                               for node in self.hash_ring.get_nodes_for_key(key) if not node.is_alive()])
+        self.rollups.mark([key])
+        if self.cache:
+            self.cache.invalidate([key])
+        self.operation_latency.observe(time.perf_counter() - start, 'delete')
 
     def measurement_exists(self, key):
         for node in self.nodes:
@@ -170,70 +1301,599 @@ class MeasurementReplicationManager:
                 return True
         return False
     
+    def _read_nodes(self):
+        nodes = [node for node in self.nodes if node.is_alive()]
+        if self.strategy == 'full':
+            # Ogni nodo vivo contiene l'intero dataset: basta il primo
+            return nodes[:1]
+        return nodes
+
+    @staticmethod
+    def _dedupe(rows, key_index):
+        last_key = None
+        for row in rows:
+            if row[key_index] == last_key:
+                continue  # stessa chiave da un'altra replica
+            last_key = row[key_index]
+            yield row
+
+    def iter_measurements(self, after_key=None):
+        """Yield ``(key, value)`` pairs in key order, merging the replicas on the fly."""
+        rows = heapq.merge(*(node.iter_rows(after_key) for node in self._read_nodes()), key=lambda row: row[0])
+        return self._dedupe(rows, 0)
+
     def get_all_measurements(self):
         """Return all key/value pairs available across alive nodes."""
-        measurements = {}
-        for node in self.nodes:
-            if node.is_alive():
-                for key, value in node.get_all_keys():
-                    measurements[key] = value
-        return measurements
-    
+        return dict(self.iter_measurements())
+
+    def iter_sensor_history(self, sensor_id, start=None, end=None, after=None, batch_size=1000):
+        """Yield ``(ts, key, value)`` rows of a sensor with ``start <= ts < end`` in time order."""
+        rows = heapq.merge(*(node.iter_sensor(sensor_id, start, end, after, batch_size) for node in self._read_nodes()),
+                           key=lambda row: (row[0] is not None, row[0] or 0, row[1]))
+        return self._dedupe(rows, 1)
+
+    def get_sensor_history(self, sensor_id, start=None, end=None, limit=None, after=None):
+        """Return ``(ts, key, value)`` rows of a sensor with ``start <= ts < end``, ordered by time."""
+        batch_size = min(limit, 1000) if limit else 1000
+        return list(itertools.islice(self.iter_sensor_history(sensor_id, start, end, after, batch_size), limit))
+
+    def sensor_arrays(self, sensor_id, start=None, end=None):
+        """Return a sensor's numeric samples with ``start <= ts < end`` as ``(timestamps, values)`` numpy arrays."""
+        analytics.require_numpy()
+        return analytics.merge_samples([self._node_call(node, 'sensor_arrays', sensor_id, start, end)
+                                        for node in self._read_nodes()])
+
+    def aggregate_sensor_history(self, sensor_id, bucket, start=None, end=None):
+        """Return per-bucket count/sum/min/max/avg of a sensor from the rollups (``bucket`` in ``RESOLUTIONS``)."""
+        resolution = RESOLUTIONS[bucket]
+        # Si ricalcolano solo i minuti del sensore che cadono nei bucket richiesti
+        if start is not None:
+            start -= start % resolution
+        if end is not None:
+            end += -end % resolution
+        if self.rollups.pending(sensor_id, start, end):
+            self.rollups.compact(sensor_id, start, end)
+        return [{'bucket': bucket_start, 'count': count, 'sum': total, 'min': low, 'max': high, 'avg': total / count}
+                for bucket_start, count, total, low, high in self.rollups.aggregate(sensor_id, resolution, start, end)]
+
+    def get_node(self, node_id):
+        return next((node for node in self.nodes if node.node_id == node_id), None)
+
     def fail_node(self, node_id):
-        if 0 <= node_id < len(self.nodes):
-            node = self.nodes[node_id]
+        node = self.get_node(node_id)
+        if node is not None:
             node.fail()
-            if self.strategy == 'consistent':
-                self.hash_ring.redistribute_measurements(node)
 
     def recover_node(self, node_id):
-        if 0 <= node_id < len(self.nodes):
-            node = self.nodes[node_id]
-            node.recover(self.nodes, self.strategy)
+        node = self.get_node(node_id)
+        if node is not None:
+            report = node.recover(self.nodes, self.strategy, self.retention_cutoff())
             if self.strategy == 'consistent':
-                print(f"Recovering node {node_id}...")
-                self.hash_ring.recover_node(node)
+                logger.info('Recovering node %s: replaying hinted operations', node_id)
+                report = self.replay_hints(node)
+            else:
+                # La sincronizzazione completa copre anche le scritture suggerite
+                self.hint_log.clear(node_id)
+            # I rollup calcolati mentre il nodo era giù vengono ricalcolati
+            self.rollups.requeue_suspect()
+            if self.cache:
+                self.cache.clear()
+            return report
+
+    def retention_cutoff(self, now=None):
+        """Epoch seconds before which measurements are expired, ``None`` without a retention policy."""
+        if not self.retention_seconds:
+            return None
+        return (time.time() if now is None else now) - self.retention_seconds
+
+    def enforce_retention(self, now=None):
+        """Drop the expired partitions of every alive node; dead nodes drop theirs when they recover.
+
+        A partition goes only once its whole window is older than ``retention_seconds``. The rollups
+        are kept, so aggregates outlive the raw measurements.
+        """
+        before = self.retention_cutoff(now)
+        report = {'before': before, 'partitions': 0, 'rows': 0}
+        if before is None:
+            return report
+        for node in list(self.nodes):
+            if not node.is_alive():
+                continue
+            try:
+                dropped = self._node_call(node, 'drop_partitions', before)
+            except Exception:
+                logger.exception('Retention failed on node %s', node.node_id)
+                continue
+            self.retention_dropped.inc(dropped['partitions'], node.node_id)
+            report['partitions'] += dropped['partitions']
+            report['rows'] += dropped['rows']
+        if report['partitions'] and self.cache:
+            self.cache.clear()
+        return report
+
+    def compact_cold_partitions(self, now=None):
+        """Compact the partitions of every alive node whose window ended more than ``cold_after`` seconds ago."""
+        report = {'before': None, 'partitions': 0, 'rows': 0, 'bytes': 0}
+        if not self.cold_after:
+            return report
+        report['before'] = (time.time() if now is None else now) - self.cold_after
+        for node in list(self.nodes):
+            if not node.is_alive():
+                continue
+            try:
+                compacted = self._node_call(node, 'compact_partitions', report['before'])
+            except Exception:
+                logger.exception('Compaction failed on node %s', node.node_id)
+                continue
+            self.partitions_compacted.inc(compacted['partitions'], node.node_id)
+            for field in ('partitions', 'rows', 'bytes'):
+                report[field] += compacted[field]
+        return report
+
+    def _retention_loop(self, interval):
+        while not self._retention_stop.wait(interval):
+            self.enforce_retention()
+            self.compact_cold_partitions()
+
+    def replay_hints(self, target):
+        """Deliver the hinted writes and deletes for ``target`` in batches of ``hint_batch_size``."""
+        report = {'hints_replayed': 0, 'rows_transferred': 0, 'rows_deleted': 0}
+        alive = {node.node_id: node for node in self.nodes if node.is_alive() and node.node_id != target.node_id}
+        while True:
+            hints = self.hint_log.pending(target.node_id, list(alive), self.hint_batch_size)
+            if not hints:
+                break
+            by_holder = {}
+            deletes = []
+            for _, holder, key, op in hints:
+                if op == 'del':
+                    deletes.append(key)
+                else:
+                    by_holder.setdefault(holder, set()).add(key)
+            rows = {}
+            for holder, keys in by_holder.items():
+                for row in alive[holder].rows_for_keys(keys):
+                    rows[row[0]] = row
+            deletes = [key for key in deletes if key not in rows]
+            target.apply_rows(list(rows.values()), deletes)
+
+            # Il nodo che ha custodito la chiave la elimina se non ne è replica naturale
+            for holder, keys in by_holder.items():
+                stale = [key for key in keys if alive[holder] not in self.hash_ring.get_nodes_for_key(key)]
+                alive[holder].apply_rows([], stale)
+
+            self.hint_log.remove([hint[0] for hint in hints])
+            report['hints_replayed'] += len(hints)
+            report['rows_transferred'] += len(rows)
+            report['rows_deleted'] += len(deletes)
+        return report
+
+    def hint_backlog(self):
+        """Return the number of pending hints per target node."""
+        return self.hint_log.backlog()
+
+    def _create_node(self, node_id):
+        if self.node_mode == 'process':
+            from .rpc import spawn_nodes
+            nodes, processes = spawn_nodes([node_id], *self._spawn_options)
+            self._node_processes.extend(processes)
+            return nodes[0]
+        node_class, port, node_options = self._spawn_options
+        return node_class(node_id, port + node_id, **node_options)
+
+    def _release_node(self, node):
+        if self.node_mode == 'process':
+            node.shutdown()
+        else:
+            node.close()
+
+    @staticmethod
+    def _owners(ring, nodes):
+        """``owners(key)`` of a placement: the ring replicas, or every node with full replication."""
+        if ring is not None:
+            return ring.get_nodes_for_key
+        nodes = tuple(nodes)
+        return lambda key: nodes
+
+    def _start_rebalance(self, operation, node_id, new_nodes, switch, strategy=None, replication_factor=None,
+                         joining=(), leaving=(), abort=None):
+        """Start the job moving data from the current placement to ``strategy`` over ``new_nodes``.
+
+        Without ``strategy`` the current one is kept, with the same replication factor.
+        """
+        old_nodes = list(self.nodes)
+        old_ring = self.hash_ring if self.strategy == 'consistent' else None
+        if strategy is None:
+            strategy = self.strategy
+            replication_factor = old_ring.replication_factor if old_ring else None
+        new_ring = None
+        if strategy == 'consistent':
+            new_ring = EnergyGuardRing(new_nodes, replication_factor=replication_factor, **self.ring_options)
+
+        source_ranges = None
+        if old_ring and new_ring:
+            changes = old_ring.ownership_changes(new_ring)
+            by_id = {node.node_id: node for node in [*old_nodes, *new_nodes]}
+            # Ogni nodo primo proprietario di un intervallo che cambia invia solo le righe di quegli intervalli
+            source_ranges = {}
+            for change in changes:
+                source_ranges.setdefault(change['before'][0], []).append((change['start'], change['end']))
+            sources = [by_id[node_id] for node_id in sorted(source_ranges)]
+            losers = {node_id for change in changes for node_id in set(change['before']) - set(change['after'])}
+            cleanup = [node for node in old_nodes if node.node_id in losers]
+            ranges, moved_share = len(changes), new_ring.range_share(changes)
+        elif new_ring:
+            # Da full: ogni nodo ha già tutte le chiavi, restano da cancellare quelle che non gli spettano
+            sources, cleanup = [], old_nodes
+            ranges, moved_share = None, 1.0
+        elif old_ring:
+            # Verso full: ogni chiave va copiata dal suo primo proprietario sugli altri nodi
+            sources, cleanup = old_nodes, []
+            ranges, moved_share = None, 1.0
+        else:
+            sources, cleanup = ([old_nodes[0]] if joining else []), []
+            ranges, moved_share = (1 if joining else 0), (1.0 if joining else 0.0)
+        cleanup = [node for node in cleanup if node not in leaving]
+
+        def install():
+            # L'ordine conta per le letture concorrenti, che non passano dal gate
+            if new_ring is not None:
+                self.hash_ring = new_ring
+                self.strategy = strategy
+            else:
+                self.strategy = strategy
+                self.hash_ring = None
+            # Nuova lista: chi la sta già scorrendo non vede il cambiamento a metà
+            self.nodes = list(new_nodes)
+            self.num_nodes = len(self.nodes)
+            if self.cache:
+                self.cache.clear()
+            switch()
+
+        def finish(job):
+            if job.state == 'done':
+                # I nodi usciti vengono chiusi solo dopo la pulizia, quando nessuna lettura li usa più
+                for node in leaving:
+                    self._release_node(node)
+            logger.info('Rebalance finished: %s', job.status())
+
+        options = self.rebalance_options
+        self._rebalance = Rebalance(operation, node_id, self._owners(old_ring, old_nodes),
+                                    self._owners(new_ring, new_nodes), install, self._gate, sources,
+                                    cleanup, wipe=joining, joining=joining, abort=abort, finish=finish,
+                                    batch_size=options.get('batch_size', 1000),
+                                    max_rows_per_second=options.get('max_rows_per_second'), ranges=ranges,
+                                    moved_share=moved_share, source_ranges=source_ranges,
+                                    hash_function=new_ring.hash_function if new_ring else 'md5')
+        return self._rebalance.start()
+
+    def _check_rebalance(self):
+        if self._rebalance is not None and self._rebalance.is_running():
+            raise ValueError('A rebalance is already running')
+        dead = [node.node_id for node in self.nodes if not node.is_alive()]
+        if dead:
+            raise ValueError(f'Cannot rebalance while nodes {dead} are down')
+
+    def add_node(self, weight=None, wait=False):
+        """Add a storage node and stream to it the key ranges it becomes responsible for.
+
+        The copy runs in the background while reads and writes continue; the new node takes over its
+        ranges only when the copy is complete. Returns the rebalance status (the final one with ``wait``).
+        """
+        with self._rebalance_lock:
+            self._check_rebalance()
+            node_id = self._next_node_id
+            self._next_node_id += 1
+            if weight is not None:
+                self.ring_options = {**self.ring_options,
+                                     'weights': {**self.ring_options.get('weights', {}), node_id: weight}}
+            node = self._create_node(node_id)
+            job = self._start_rebalance('add', node_id, self.nodes + [node], lambda: None, joining=[node],
+                                        abort=lambda: self._release_node(node))
+        return job.wait() if wait else job.status()
+
+    def remove_node(self, node_id, wait=False):
+        """Stream the key ranges of ``node_id`` to the nodes inheriting them, then drop it from the cluster."""
+        with self._rebalance_lock:
+            self._check_rebalance()
+            node = self.get_node(node_id)
+            if node is None:
+                raise ValueError(f'Unknown node: {node_id}')
+            if len(self.nodes) == 1:
+                raise ValueError('Cannot remove the last storage node')
+            job = self._start_rebalance('remove', node_id, [n for n in self.nodes if n is not node],
+                                        lambda: self.hint_log.clear(node_id), leaving=[node])
+        return job.wait() if wait else job.status()
+
+    def rebalance_status(self):
+        """Status of the running (or last) rebalance, ``None`` if none was started."""
+        return self._rebalance.status() if self._rebalance is not None else None
+
+    def close(self):
+        if self._rebalance is not None:
+            self._rebalance.stop()
+        self._retention_stop.set()
+        if self._retention_worker is not None:
+            self._retention_worker.join()
+        self.fanout.close()
+        self.rollups.close()
+        self.hint_log.close()
+        self.alert_manager.close()
+        for node in self.nodes:
+            self._release_node(node)
+        for process in self._node_processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
 
     def get_storage_status(self):
+        backlog = self.hint_backlog()
         return [
             {
                 'node_id': node.node_id,
                 'status': 'alive' if node.is_alive() else 'dead',
-                'port': node.port
+                'port': node.port,
+                'hint_backlog': backlog.get(node.node_id, 0),
+                'bloom': node.bloom_stats(),
+                'partitions': node.partition_stats()
             }
             for node in self.nodes
         ]
 
+    def get_cache_stats(self):
+        return self.cache.stats() if self.cache else None
+
     def get_responsible_nodes(self, key):
         if self.strategy == 'consistent' and self.hash_ring:
             return self.hash_ring.get_nodes_for_key(key)
         else:
             return None
+
+    def get_ring_report(self, sample_keys=None):
+        if self.strategy == 'consistent' and self.hash_ring:
+            return self.hash_ring.distribution_report(sample_keys)
+        return None
         
 class AlertManager:
-    def __init__(self):
+    """Threshold and rolling-window alerts kept in bounded per-sensor ring buffers.
+
+    Every alert gets an increasing ``id`` used as the ``since`` cursor. Each sensor keeps at most
+    ``buffer_size`` recent alerts, so memory stays flat during alert storms. With ``db_path`` the
+    alerts are also written to SQLite, trimmed to the same bound, and reloaded on startup.
+
+    With ``async_detection`` measurements passed to ``submit`` are checked by a background worker
+    fed by a queue of at most ``queue_size`` batches; a full queue applies backpressure to ingest.
+    """
+    COLUMNS = ('id', 'sensor_id', 'ts', 'value', 'threshold', 'timestamp', 'message', 'detector')
+
+    def __init__(self, buffer_size=1000, db_path=None, synchronous='NORMAL', async_detection=True,
+                 queue_size=10000, metrics=None):
         self.thresholds = {}  # {sensor_id: soglia}
-        self.alerts = []      # Lista delle allerte generate
+        self.detectors = {}   # {sensor_id: [Detector]}
+        self.buffer_size = buffer_size
+        self.alerts = {}      # {sensor_id: deque delle allerte più recenti, in ordine di id}
+        self._lock = threading.Lock()
+        self._detect_lock = threading.Lock()
+        self._next_id = 1
+        self._conn = None
+        if db_path:
+            self._open_db(db_path, synchronous)
+        self._queue = None
+        if async_detection:
+            self._queue = queue.Queue(queue_size)
+            self._worker = threading.Thread(target=self._detect_loop, name='alert-detection', daemon=True)
+            self._worker.start()
+        metrics = metrics or MetricsRegistry(enabled=False)
+        self.check_latency = metrics.histogram('energyguard_alert_check_seconds',
+                                               'Latency of one anomaly check pass over a batch')
+        self.alerts_raised = metrics.counter('energyguard_alerts_total', 'Alerts raised', ('detector',))
+        metrics.collected('energyguard_alert_queue_depth', 'Batches waiting for the detection worker', 'gauge',
+                          lambda: self._queue.qsize() if self._queue is not None else 0)
+
+    def _open_db(self, path, synchronous):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(f'PRAGMA synchronous={synchronous}')
+        with self._conn:
+            self._conn.execute(
+                '''CREATE TABLE IF NOT EXISTS alerts (id INTEGER PRIMARY KEY, sensor_id TEXT NOT NULL, ts INTEGER,
+                   value REAL, threshold REAL, timestamp TEXT, message TEXT, detector TEXT)''')
+            self._conn.execute('''CREATE INDEX IF NOT EXISTS idx_alerts_sensor_ts ON alerts (sensor_id, ts, id)''')
+            self._conn.execute('''CREATE INDEX IF NOT EXISTS idx_alerts_ts ON alerts (ts, id)''')
+            columns = [row[1] for row in self._conn.execute('''PRAGMA table_info(alerts)''')]
+            if 'detector' not in columns:
+                self._conn.execute('''ALTER TABLE alerts ADD COLUMN detector TEXT''')
+        # Ricarica nei buffer solo le allerte più recenti di ogni sensore
+        rows = self._conn.execute(
+            f'''SELECT {', '.join(self.COLUMNS)} FROM (
+                   SELECT *, ROW_NUMBER() OVER (PARTITION BY sensor_id ORDER BY id DESC) AS rank FROM alerts)
+               WHERE rank <= ? ORDER BY id''', (self.buffer_size,))
+        for row in rows:
+            alert = self._alert(row)
+            self._buffer(alert['sensor_id']).append(alert)
+            self._next_id = alert['id'] + 1
+
+    def _alert(self, row):
+        alert = dict(zip(self.COLUMNS, row))
+        alert['detector'] = alert['detector'] or 'threshold'
+        return alert
+
+    def _buffer(self, sensor_id):
+        buffer = self.alerts.get(sensor_id)
+        if buffer is None:
+            buffer = self.alerts[sensor_id] = collections.deque(maxlen=self.buffer_size)
+        return buffer
 
     def set_threshold(self, sensor_id, threshold):
         self.thresholds[sensor_id] = float(threshold)
 
+    def set_detector(self, sensor_id, kind, **params):
+        """Attach a rolling detector (see ``detectors.DETECTOR_TYPES``), replacing one of the same type."""
+        detector = create_detector(kind, **params)
+        with self._detect_lock:
+            others = [d for d in self.detectors.get(sensor_id, ()) if d.kind != kind]
+            self.detectors[sensor_id] = others + [detector]
+        return detector.describe()
+
+    def remove_detectors(self, sensor_id):
+        with self._detect_lock:
+            self.detectors.pop(sensor_id, None)
+
     def check_for_anomaly(self, sensor_id, value, timestamp):
-        try:
-            threshold = self.thresholds.get(sensor_id)
-            if threshold is not None and float(value) > threshold:
-                alert = {
-                    'sensor_id': sensor_id,
-                    'value': float(value),
-                    'threshold': threshold,
-                    'timestamp': timestamp,
-                    'message': 'Anomaly detected: value exceeds threshold'
-                }
-                self.alerts.append(alert)
-                print(f"[ALERT] {alert}")
-        except ValueError:
-            pass  # Ignora valori non numerici
-
-    def get_alerts(self):
-        return self.alerts
+        self.check_batch([(sensor_id, value, timestamp)])
+
+    def submit(self, measurements):
+        """Queue measurements for the detection worker, or check them inline without one."""
+        if not measurements or (not self.thresholds and not self.detectors):
+            return
+        if self._queue is None:
+            self.check_batch(measurements)
+        else:
+            self._queue.put(measurements)
+
+    def _detect_loop(self):
+        while True:
+            batches = [self._queue.get()]
+            # Accorpa i batch in coda: una valutazione vettoriale più lunga invece di tante piccole
+            while len(batches) < 64:
+                try:
+                    batches.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            measurements = [m for batch in batches if batch is not None for m in batch]
+            try:
+                self.check_batch(measurements)
+            except Exception as e:
+                logger.exception('Failed to check anomalies: %s', e)
+            for _ in batches:
+                self._queue.task_done()
+            if None in batches:
+                return
+
+    def drain(self):
+        """Wait until every submitted measurement has been checked."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def check_batch(self, measurements):
+        """Check a list of (sensor_id, value, timestamp) tuples in one pass."""
+        thresholds, detectors = self.thresholds, self.detectors
+        if not thresholds and not detectors:
+            return
+        groups = {}
+        for position, (sensor_id, value, timestamp) in enumerate(measurements):
+            if sensor_id not in thresholds and sensor_id not in detectors:
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue  # Ignora valori non numerici
+            groups.setdefault(sensor_id, []).append((position, value, timestamp))
+
+        start = time.perf_counter()
+        raised = []
+        with self._detect_lock:
+            for sensor_id, samples in groups.items():
+                raised.extend(self._check_sensor(sensor_id, samples))
+        self.check_latency.observe(time.perf_counter() - start)
+        if raised:
+            # Gli id seguono l'ordine di arrivo delle misurazioni, non il raggruppamento per sensore
+            raised.sort(key=lambda item: item[0])
+            self._record([alert for _, alert in raised])
+
+    def _check_sensor(self, sensor_id, samples):
+        values = [value for _, value, _ in samples]
+        stamps = [parse_timestamp(timestamp) for _, _, timestamp in samples]
+        flagged = []  # (indice del campione, detector, soglia)
+        threshold = self.thresholds.get(sensor_id)
+        if threshold is not None:
+            flagged.extend((i, 'threshold', threshold) for i, value in enumerate(values) if value > threshold)
+        sensor_detectors = self.detectors.get(sensor_id, ())
+        if numpy is not None and sensor_detectors and len(samples) >= VECTORIZE_MIN:
+            value_array = numpy.array(values, dtype=float)
+            ts_array = numpy.array([numpy.nan if ts is None else ts for ts in stamps], dtype=float)
+            for detector in sensor_detectors:
+                flagged.extend((int(i), detector.kind, None)
+                               for i in numpy.flatnonzero(detector.evaluate(ts_array, value_array)))
+        else:
+            for detector in sensor_detectors:
+                flagged.extend((i, detector.kind, None) for i, (ts, value) in enumerate(zip(stamps, values))
+                               if detector.update(ts, value))
+        alerts = []
+        for i, kind, threshold in flagged:
+            message = ('Anomaly detected: value exceeds threshold' if kind == 'threshold'
+                       else f'Anomaly detected by {kind} detector')
+            position, value, timestamp = samples[i]
+            alerts.append((position, {'sensor_id': sensor_id, 'value': value, 'threshold': threshold,
+                                      'timestamp': timestamp, 'ts': stamps[i], 'message': message,
+                                      'detector': kind}))
+        return alerts
+
+    def _record(self, raised):
+        with self._lock:
+            for alert in raised:
+                alert['id'] = self._next_id
+                self._next_id += 1
+                self._buffer(alert['sensor_id']).append(alert)
+                self.alerts_raised.inc(1, alert['detector'])
+                sampled_logger.info('Alert: %s', alert)
+            if self._conn is not None:
+                self._persist(raised)
+
+    def _persist(self, raised):
+        with self._conn:
+            self._conn.executemany(
+                '''INSERT INTO alerts (id, sensor_id, ts, value, threshold, timestamp, message, detector)
+                   VALUES (:id, :sensor_id, :ts, :value, :threshold, :timestamp, :message, :detector)''', raised)
+            # Stesso limite dei buffer in memoria: si scartano le allerte più vecchie di ogni sensore
+            for sensor_id in {alert['sensor_id'] for alert in raised}:
+                oldest = self.alerts[sensor_id][0]['id']
+                self._conn.execute('''DELETE FROM alerts WHERE sensor_id=? AND id<?''', (sensor_id, oldest))
+
+    def get_alerts(self, sensor_id=None, start=None, end=None, since=None, limit=None):
+        """Return alerts ordered by ``id``, optionally filtered by sensor, ``start <= ts < end`` and ``id > since``.
+
+        With persistence a time range is read from SQLite through the ``ts`` indexes instead of scanning
+        the buffers, which hold the same alerts.
+        """
+        if self._conn is not None and (start is not None or end is not None):
+            return self._query_alerts(sensor_id, start, end, since, limit)
+        with self._lock:
+            if sensor_id is not None:
+                buffers = [list(self.alerts.get(sensor_id, ()))]
+            else:
+                buffers = [list(buffer) for buffer in self.alerts.values()]
+        alerts = heapq.merge(*buffers, key=lambda alert: alert['id'])
+        if since is not None:
+            alerts = (alert for alert in alerts if alert['id'] > since)
+        if start is not None or end is not None:
+            alerts = (alert for alert in alerts if alert['ts'] is not None
+                      and (start is None or alert['ts'] >= start) and (end is None or alert['ts'] < end))
+        return list(itertools.islice(alerts, limit))
+
+    def _query_alerts(self, sensor_id, start, end, since, limit):
+        clauses, params = ['ts IS NOT NULL'], []
+        for clause, value in (('sensor_id = ?', sensor_id), ('ts >= ?', start), ('ts < ?', end), ('id > ?', since)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        sql = f'''SELECT {', '.join(self.COLUMNS)} FROM alerts WHERE {' AND '.join(clauses)} ORDER BY id'''
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._alert(row) for row in rows]
 
+    def close(self):
+        if self._queue is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._queue = None
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
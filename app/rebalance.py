@@ -0,0 +1,317 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class WriteGate:
+    """Readers-writer lock between the client writes (shared) and the cut-over of a rebalance (exclusive).
+
+    Holding the gate exclusively stops the writes while a rebalance re-copies the keys written during
+    its copy and installs the new placement. A waiting holder blocks new writes, so a steady write load
+    cannot starve it.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._shared = 0
+        self._exclusive = False
+
+    def acquire_shared(self, blocking=True):
+        with self._cond:
+            while self._exclusive:
+                if not blocking:
+                    return False
+                self._cond.wait()
+            self._shared += 1
+            return True
+
+    def release_shared(self):
+        with self._cond:
+            self._shared -= 1
+            if not self._shared:
+                self._cond.notify_all()
+
+    @contextmanager
+    def shared(self):
+        self.acquire_shared()
+        try:
+            yield
+        finally:
+            self.release_shared()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            self._exclusive = True
+            while self._shared:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+class RebalanceAborted(Exception):
+    """Raised inside the job when it is stopped before completing."""
+
+
+class Rebalance:
+    """Background job moving the keys whose replica set changes from the old to the new placement.
+
+    ``old_owners(key)`` and ``new_owners(key)`` return the replicas of a key before and after the
+    change. The job pages through the ``sources`` nodes in key order and copies each key, from its
+    first old owner only, to the new owners that did not hold it. With ``source_ranges`` (ring hash
+    ranges per source node id, as ``(start, end)`` pairs) each source still reads all its keys but
+    returns only those in the ranges whose ownership changes; without it every row is returned.
+
+    The copy runs without blocking writes: meanwhile the manager also writes to the new owners (see
+    :attr:`dual_write`), deletes from the ``joining`` nodes and reports the written keys through
+    :meth:`touch`, since a copied page can overwrite them with an older value. Those keys are copied
+    again from the old owners; the last such delta and ``switch()``, which installs the new placement,
+    run under the exclusive gate. The keys left on the nodes in ``cleanup`` that no longer own them
+    are then deleted. Reads consult both placements until the job ends (:attr:`dual_read`). ``wipe``
+    nodes are emptied first, so a reused data file cannot resurrect old rows.
+    """
+    # Giri di ricopia a scritture aperte prima dell'ultimo, a scritture ferme
+    DELTA_ROUNDS = 3
+
+    def __init__(self, operation, node_id, old_owners, new_owners, switch, gate, sources=(), cleanup=(), wipe=(),
+                 joining=(), abort=None, finish=None, batch_size=1000, max_rows_per_second=None, ranges=0,
+                 moved_share=None, source_ranges=None, hash_function='md5'):
+        self.operation = operation
+        self.node_id = node_id
+        self.old_owners = old_owners
+        self.new_owners = new_owners
+        self.sources = list(sources)
+        self.cleanup_nodes = list(cleanup)
+        self.wipe_nodes = list(wipe)
+        self.joining = list(joining)  # nodi che ricevono scritture ma non sono ancora nel cluster
+        self._switch = switch
+        self._abort = abort
+        self._finish = finish
+        self.gate = gate
+        self.batch_size = max(1, int(batch_size))
+        self.max_rows_per_second = max_rows_per_second
+        self.ranges = ranges
+        self.moved_share = moved_share
+        self.source_ranges = source_ranges
+        self.hash_function = hash_function
+
+        self.state = 'pending'
+        self.dual_write = False
+        self.dual_read = False
+        self.error = None
+        self.rows_total = None
+        self.rows_scanned = 0
+        self.rows_copied = 0
+        self.rows_deleted = 0
+        self.started_at = None
+        self.finished_at = None
+        self._copy_start = None
+        self._copy_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._touched = set()
+        self._touched_lock = threading.Lock()
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self.run, name='rebalance', daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.status()
+
+    def stop(self):
+        self._stop.set()
+        self.wait()
+
+    def is_running(self):
+        return self.state in ('pending', 'wiping', 'copying', 'switching', 'cleanup')
+
+    def run(self):
+        switched = False
+        try:
+            self.state = 'wiping'
+            for node in self.wipe_nodes:
+                self._scan(node, lambda rows: [key for key, _ in rows])
+            # Da qui le scritture raggiungono anche i nuovi proprietari; quelle iniziate prima, che hanno
+            # scritto solo sui vecchi, sono terminate
+            with self.gate.exclusive():
+                self.dual_write = self.dual_read = True
+            self.state = 'copying'
+            self.rows_total = sum(count for node in self.sources for _, count in node.bucket_digests().values())
+            self._copy_start = time.perf_counter()
+            for source in self.sources:
+                self._scan(source, self._copier(source), self._pager(source))
+            for _ in range(self.DELTA_ROUNDS):
+                if self._copy_delta() <= self.batch_size:
+                    break
+            self._copy_seconds = time.perf_counter() - self._copy_start
+            self.state = 'switching'
+            with self.gate.exclusive():
+                self._copy_delta()
+                self._switch()
+                self.dual_write = False
+                switched = True
+            self.state = 'cleanup'
+            for node in self.cleanup_nodes:
+                self._scan(node, lambda rows, node=node: [key for key, _ in rows if node not in self.new_owners(key)])
+            self.state = 'done'
+            logger.info('Rebalance (%s node %s) done: %d rows copied, %d deleted', self.operation, self.node_id,
+                        self.rows_copied, self.rows_deleted)
+        except Exception as e:
+            self.dual_write = False
+            self.error = str(e)
+            if isinstance(e, RebalanceAborted):
+                self.state = 'aborted'
+                logger.warning('Rebalance (%s node %s) stopped', self.operation, self.node_id)
+            else:
+                self.state = 'failed'
+                logger.exception('Rebalance (%s node %s) failed', self.operation, self.node_id)
+            # Prima dello scambio il vecchio posizionamento è ancora completo: si torna indietro
+            if self._abort and not switched:
+                self._abort()
+        finally:
+            self.dual_read = False
+            if self._copy_start is not None and not self._copy_seconds:
+                self._copy_seconds = time.perf_counter() - self._copy_start
+            self.finished_at = time.time()
+            if self._finish:
+                self._finish(self)
+
+    def touch(self, keys):
+        """Record keys written while copying: they are copied again before the switch."""
+        with self._touched_lock:
+            self._touched.update(keys)
+
+    def _copy_delta(self):
+        """Copy the touched keys again from their first old owner, deleting the vanished ones; return how many."""
+        with self._touched_lock:
+            keys, self._touched = self._touched, set()
+        by_source = {}
+        for key in keys:
+            before = self.old_owners(key)
+            if before:
+                by_source.setdefault(before[0].node_id, (before[0], []))[1].append(key)
+        for source, source_keys in by_source.values():
+            for i in range(0, len(source_keys), self.batch_size):
+                chunk = source_keys[i:i + self.batch_size]
+                rows = {row[0]: row for row in source.rows_for_keys(chunk)}
+                targets = {}
+                for key in chunk:
+                    before = self.old_owners(key)
+                    for node in self.new_owners(key):
+                        if node not in before:
+                            upserts, deletes = targets.setdefault(node.node_id, (node, [], []))[1:]
+                            if key in rows:
+                                upserts.append(rows[key])
+                            else:
+                                deletes.append(key)
+                for node, upserts, deletes in targets.values():
+                    if not node.is_alive():
+                        raise RuntimeError(f'Node {node.node_id} failed during the rebalance')
+                    node.apply_rows(upserts, deletes)
+                    self.rows_copied += len(upserts)
+        return len(keys)
+
+    def _pager(self, source):
+        """Return ``page(after)`` reading from ``source`` only the rows in its changed ranges, if known."""
+        if self.source_ranges is None:
+            return None
+        ranges = self.source_ranges.get(source.node_id, [])
+        return lambda after: source.rows_in_ranges(ranges, self.hash_function, after, self.batch_size)
+
+    def _copier(self, source):
+        """Return the page handler copying the keys ``source`` is the first old owner of to their new owners."""
+        def copy(rows):
+            targets = {}
+            for key, value in rows:
+                before = self.old_owners(key)
+                if not before or before[0] is not source:
+                    continue
+                for node in self.new_owners(key):
+                    if node not in before:
+                        targets.setdefault(node.node_id, (node, []))[1].append((key, value))
+            for node, pairs in targets.values():
+                if not node.is_alive():
+                    raise RuntimeError(f'Node {node.node_id} failed during the rebalance')
+                node.write_many(pairs)
+                self.rows_copied += len(pairs)
+            return ()
+        return copy
+
+    def _scan(self, node, handle, page=None):
+        """Page through ``node`` in key order; ``handle(rows)`` returns the keys of the page to delete from it.
+
+        ``page(after)`` returns ``(rows, last_key, scanned)`` like ``rows_in_ranges``; by default every row
+        is read with ``rows_page``.
+        """
+        after = None
+        phase_start, phase_rows = time.perf_counter(), 0
+        while True:
+            if self._stop.is_set():
+                raise RebalanceAborted('Rebalance stopped')
+            if not node.is_alive():
+                raise RuntimeError(f'Node {node.node_id} failed during the rebalance')
+            if page is None:
+                rows = node.rows_page(after, self.batch_size)
+                after = rows[-1][0] if len(rows) == self.batch_size else None
+                scanned = len(rows)
+            else:
+                rows, after, scanned = page(after)
+            deletes = handle(rows)
+            if deletes:
+                node.apply_rows([], deletes)
+                self.rows_deleted += len(deletes)
+            self.rows_scanned += scanned
+            phase_rows += scanned
+            if after is None:
+                return
+            self._throttle(phase_start, phase_rows)
+
+    def _throttle(self, phase_start, rows):
+        if not self.max_rows_per_second:
+            return
+        delay = rows / self.max_rows_per_second - (time.perf_counter() - phase_start)
+        if delay > 0:
+            self._stop.wait(delay)
+
+    def status(self):
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        copy_seconds = self._copy_seconds
+        if not copy_seconds and self._copy_start is not None:
+            copy_seconds = time.perf_counter() - self._copy_start
+        progress = None
+        if self.state in ('switching', 'cleanup', 'done'):
+            progress = 1.0
+        elif self.rows_total:
+            progress = min(1.0, self.rows_scanned / self.rows_total)
+        elif self.rows_total == 0:
+            progress = 1.0
+        return {
+            'operation': self.operation,
+            'node_id': self.node_id,
+            'state': self.state,
+            'ranges': self.ranges,
+            'moved_share': self.moved_share,
+            'rows_total': self.rows_total,
+            'rows_scanned': self.rows_scanned,
+            'rows_copied': self.rows_copied,
+            'rows_deleted': self.rows_deleted,
+            'progress': progress,
+            'rows_per_second': self.rows_copied / copy_seconds if copy_seconds else 0.0,
+            'scan_rows_per_second': self.rows_scanned / copy_seconds if copy_seconds else 0.0,
+            'elapsed_seconds': elapsed,
+            'error': self.error,
+        }
@@ -0,0 +1,208 @@
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+
+from .timeseries import split_key
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+# nome del parametro ?bucket= -> ampiezza in secondi
+RESOLUTIONS = {'1m': MINUTE, '1h': 3600, '1d': 86400}
+
+
+class RollupStore:
+    """Per-sensor count/sum/min/max rollups over minute, hour and day buckets.
+
+    Writes and deletes only mark their minute bucket as dirty (one persisted row per sensor and
+    minute, deduplicated in memory). The compactor recomputes dirty minutes from the stored
+    history through ``load(sensor_id, start, end)`` and derives the hour and day buckets from the
+    minute rows, so overwrites and deletes are reflected exactly. Minutes compacted while a node
+    was down are remembered and recomputed after recovery.
+    """
+
+    def __init__(self, path, load, synchronous='NORMAL', interval=1.0, degraded=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.load = load
+        self.degraded = degraded or (lambda: False)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._marked = set()  # (sensor_id, minute) già presenti nella tabella dirty
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(f'PRAGMA synchronous={synchronous}')
+        with self._conn:
+            self._conn.execute(
+                '''CREATE TABLE IF NOT EXISTS rollups (sensor_id TEXT NOT NULL, resolution INTEGER NOT NULL,
+                   bucket INTEGER NOT NULL, count INTEGER NOT NULL, sum REAL NOT NULL, min REAL NOT NULL,
+                   max REAL NOT NULL, PRIMARY KEY (sensor_id, resolution, bucket)) WITHOUT ROWID''')
+            # seq distingue un minuto marcato di nuovo durante la compattazione da quello appena elaborato
+            self._conn.execute(
+                '''CREATE TABLE IF NOT EXISTS dirty (sensor_id TEXT NOT NULL, minute INTEGER NOT NULL,
+                   seq INTEGER NOT NULL, PRIMARY KEY (sensor_id, minute)) WITHOUT ROWID''')
+            self._conn.execute(
+                '''CREATE TABLE IF NOT EXISTS suspect (sensor_id TEXT NOT NULL, minute INTEGER NOT NULL,
+                   PRIMARY KEY (sensor_id, minute)) WITHOUT ROWID''')
+        self._seq = self._conn.execute('''SELECT COALESCE(MAX(seq), 0) FROM dirty''').fetchone()[0]
+        self._marked.update(self._conn.execute('''SELECT sensor_id, minute FROM dirty'''))
+
+        self._stop = threading.Event()
+        self._compactor = None
+        if interval:
+            self._compactor = threading.Thread(target=self._compact_loop, name='rollup-compactor', daemon=True)
+            self._compactor.start()
+
+    def mark(self, keys):
+        """Mark the minute buckets of ``sensor:timestamp`` keys as dirty."""
+        marks = set()
+        for key in keys:
+            sensor_id, ts = split_key(key)
+            if ts is not None:
+                marks.add((sensor_id, ts - ts % MINUTE))
+        with self._lock:
+            marks -= self._marked
+            if not marks:
+                return
+            self._seq += 1
+            with self._conn:
+                self._conn.executemany(
+                    '''INSERT INTO dirty (sensor_id, minute, seq) VALUES (?, ?, ?)
+                       ON CONFLICT(sensor_id, minute) DO UPDATE SET seq=excluded.seq''',
+                    [(sensor_id, minute, self._seq) for sensor_id, minute in marks])
+            self._marked |= marks
+
+    @staticmethod
+    def _dirty_filter(sensor_id, start, end):
+        query, params = ''' WHERE 1''', []
+        if sensor_id is not None:
+            query += ''' AND sensor_id=?'''
+            params.append(sensor_id)
+        if start is not None:
+            query += ''' AND minute>=?'''
+            params.append(start - start % MINUTE)
+        if end is not None:
+            query += ''' AND minute<?'''
+            params.append(end)
+        return query, params
+
+    def pending(self, sensor_id=None, start=None, end=None):
+        """Return True when dirty minutes (of ``sensor_id`` in ``[start, end)``) are waiting for compaction."""
+        query, params = self._dirty_filter(sensor_id, start, end)
+        with self._lock:
+            return self._conn.execute('''SELECT 1 FROM dirty''' + query + ''' LIMIT 1''', params).fetchone() is not None
+
+    def compact(self, sensor_id=None, start=None, end=None):
+        """Recompute the dirty minutes (of ``sensor_id`` in ``[start, end)``) and the hour and day buckets
+        containing them; return the minutes done."""
+        query, params = self._dirty_filter(sensor_id, start, end)
+        with self._compact_lock:
+            degraded_before = self.degraded()
+            with self._lock:
+                snapshot = self._conn.execute('''SELECT sensor_id, minute, seq FROM dirty''' + query +
+                                              ''' ORDER BY sensor_id, minute''', params).fetchall()
+                # Le scritture che arrivano da qui in poi marcano di nuovo il loro minuto
+                self._marked.difference_update((sensor_id, minute) for sensor_id, minute, _ in snapshot)
+            for sensor_id, rows in itertools.groupby(snapshot, key=lambda row: row[0]):
+                rows = list(rows)
+                minutes = self._aggregate_minutes(sensor_id, [minute for _, minute, _ in rows])
+                degraded = degraded_before or self.degraded()
+                with self._lock, self._conn:
+                    self._store_minutes(sensor_id, minutes)
+                    self._conn.executemany('''DELETE FROM dirty WHERE sensor_id=? AND minute=? AND seq<=?''', rows)
+                    if degraded:
+                        self._conn.executemany('''INSERT OR IGNORE INTO suspect (sensor_id, minute) VALUES (?, ?)''',
+                                               [(sensor_id, minute) for _, minute, _ in rows])
+            return len(snapshot)
+
+    def _aggregate_minutes(self, sensor_id, minutes):
+        # Una scansione dello storico per ogni serie di minuti consecutivi
+        aggregates = {minute: None for minute in minutes}
+        runs = itertools.groupby(enumerate(minutes), key=lambda item: item[1] - item[0] * MINUTE)
+        for _, run in runs:
+            run = [minute for _, minute in run]
+            for ts, _, value in self.load(sensor_id, run[0], run[-1] + MINUTE):
+                if isinstance(value, str) or value is None:
+                    continue  # valori non numerici esclusi dagli aggregati
+                minute = ts - ts % MINUTE
+                current = aggregates[minute]
+                if current is None:
+                    aggregates[minute] = [1, value, value, value]
+                else:
+                    current[0] += 1
+                    current[1] += value
+                    current[2] = min(current[2], value)
+                    current[3] = max(current[3], value)
+        return aggregates
+
+    def _store_minutes(self, sensor_id, aggregates):
+        self._conn.executemany(
+            '''INSERT OR REPLACE INTO rollups (sensor_id, resolution, bucket, count, sum, min, max)
+               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            [(sensor_id, MINUTE, minute, *aggregate) for minute, aggregate in aggregates.items() if aggregate])
+        self._conn.executemany('''DELETE FROM rollups WHERE sensor_id=? AND resolution=? AND bucket=?''',
+                               [(sensor_id, MINUTE, minute) for minute, aggregate in aggregates.items()
+                                if not aggregate])
+        # Ore ricalcolate dai minuti, giorni dalle ore
+        for source, target in ((MINUTE, 3600), (3600, 86400)):
+            buckets = sorted({minute - minute % target for minute in aggregates})
+            for bucket in buckets:
+                row = self._conn.execute(
+                    '''SELECT SUM(count), SUM(sum), MIN(min), MAX(max) FROM rollups
+                       WHERE sensor_id=? AND resolution=? AND bucket>=? AND bucket<?''',
+                    (sensor_id, source, bucket, bucket + target)).fetchone()
+                if row[0]:
+                    self._conn.execute('''INSERT OR REPLACE INTO rollups (sensor_id, resolution, bucket, count, sum,
+                                          min, max) VALUES (?, ?, ?, ?, ?, ?, ?)''', (sensor_id, target, bucket, *row))
+                else:
+                    self._conn.execute('''DELETE FROM rollups WHERE sensor_id=? AND resolution=? AND bucket=?''',
+                                       (sensor_id, target, bucket))
+
+    def requeue_suspect(self):
+        """Mark again the minutes compacted while the cluster was degraded; return how many."""
+        with self._lock:
+            rows = self._conn.execute('''SELECT sensor_id, minute FROM suspect''').fetchall()
+            if not rows:
+                return 0
+            self._seq += 1
+            with self._conn:
+                self._conn.executemany(
+                    '''INSERT INTO dirty (sensor_id, minute, seq) VALUES (?, ?, ?)
+                       ON CONFLICT(sensor_id, minute) DO UPDATE SET seq=excluded.seq''',
+                    [(sensor_id, minute, self._seq) for sensor_id, minute in rows])
+                self._conn.execute('''DELETE FROM suspect''')
+            self._marked.update(rows)
+            return len(rows)
+
+    def aggregate(self, sensor_id, resolution, start=None, end=None):
+        """Return ``(bucket, count, sum, min, max)`` rows of a sensor with ``start <= bucket < end``."""
+        query = '''SELECT bucket, count, sum, min, max FROM rollups WHERE sensor_id=? AND resolution=?'''
+        params = [sensor_id, resolution]
+        if start is not None:
+            # Il bucket che contiene start è incluso
+            query += ''' AND bucket>=?'''
+            params.append(start - start % resolution)
+        if end is not None:
+            query += ''' AND bucket<?'''
+            params.append(end)
+        with self._lock:
+            return self._conn.execute(query + ''' ORDER BY bucket''', params).fetchall()
+
+    def _compact_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.compact()
+            except Exception as e:
+                logger.exception('Rollup compaction failed: %s', e)
+
+    def close(self):
+        self._stop.set()
+        if self._compactor:
+            self._compactor.join()
+        with self._lock:
+            self._conn.close()
@@ -1,6 +1,13 @@
-from flask import request, jsonify
+import itertools
+import json
+import os
+import time
+from flask import Response, request, jsonify, stream_with_context
 from functools import wraps
 from .models import MeasurementReplicationManager
+from .rollups import RESOLUTIONS
+from .timeseries import parse_timestamp
+from . import analytics, wire
 
 replication_manager = None  # sarà inizializzato una volta sola
 
@@ -9,15 +16,177 @@ nodes_db = 3
 port = 5000
 API_TOKEN = "your_api_token_here"
 
+UNAUTHORIZED = {'error': 'Unauthorized', 'message': 'Invalid API token'}
+
+
+# Verifica dell'header Authorization, condivisa dal server Flask e da quello ASGI
+def valid_api_token(authorization):
+    return authorization == f"Bearer {API_TOKEN}"
+
+
 # Decorator per richiedere un token API valido
 def require_api_token(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if request.headers.get('Authorization') != f"Bearer {API_TOKEN}":
-            return jsonify({'error': 'Unauthorized', 'message': 'Invalid API token'}), 403
+        if not valid_api_token(request.headers.get('Authorization')):
+            return jsonify(UNAUTHORIZED), 403
         return f(*args, **kwargs)
     return decorated_function
 
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonlines')
+REQUIRED_FIELDS = {'sensor_id', 'timestamp', 'value'}
+
+
+# Estrae la lista di misurazioni da un payload JSON (array o {"measurements": [...]}), NDJSON, MessagePack o packed
+def parse_batch_payload():
+    return decode_batch(request.get_data(), request.mimetype)
+
+
+# parse_batch_body con il tempo di decodifica registrato per formato
+def decode_batch(body, mimetype):
+    start = time.perf_counter()
+    batch = parse_batch_body(body, mimetype)
+    observe_serialization(start, mimetype, 'decode')
+    return batch
+
+
+def observe_serialization(start, mimetype, direction):
+    replication_manager.serialization_latency.observe(time.perf_counter() - start, wire.format_name(mimetype),
+                                                      direction)
+
+
+def parse_batch_body(body, mimetype):
+    items = None
+    if mimetype == wire.PACKED_MIMETYPE:
+        return [(f'{sensor_id}:{epoch}', value) for sensor_id, epoch, value in wire.unpack_records(body)]
+    if mimetype in wire.MSGPACK_MIMETYPES:
+        items = wire.unpackb(body)
+    elif mimetype in NDJSON_MIMETYPES:
+        items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    elif mimetype == 'application/json' or mimetype.endswith('+json'):
+        try:
+            items = json.loads(body)
+        except ValueError:
+            items = None
+    if isinstance(items, dict):
+        items = items.get('measurements')
+    if not isinstance(items, list):
+        raise ValueError('Expected a JSON array, {"measurements": [...]}, NDJSON, MessagePack or packed body')
+    batch = []
+    for index, item in enumerate(items):
+        # In MessagePack ogni misurazione può essere anche una tupla [sensor_id, timestamp, value]
+        if isinstance(item, list) and len(item) == 3 and mimetype in wire.MSGPACK_MIMETYPES:
+            batch.append((f'{item[0]}:{item[1]}', item[2]))
+            continue
+        if not isinstance(item, dict) or not REQUIRED_FIELDS.issubset(item):
+            raise ValueError(f'Item {index}: sensor_id, timestamp and value are required')
+        batch.append((f"{item['sensor_id']}:{item['timestamp']}", item['value']))
+    return batch
+
+
+# Corpo binario di /ingest (una mappa MessagePack o un solo record packed); None se il corpo è JSON
+def parse_binary_measurement(body, mimetype):
+    if mimetype in wire.MSGPACK_MIMETYPES:
+        data = wire.unpackb(body)
+        return data if isinstance(data, dict) else {}
+    if mimetype == wire.PACKED_MIMETYPE:
+        records = wire.unpack_records(body)
+        if len(records) != 1:
+            raise ValueError('Expected exactly one packed record')
+        sensor_id, epoch, value = records[0]
+        return {'sensor_id': sensor_id, 'timestamp': epoch, 'value': value}
+    return None
+
+
+# Risposta JSON o MessagePack secondo l'header Accept
+def encoded_response(payload, status=200):
+    start = time.perf_counter()
+    if wire.negotiate(request.headers.get('Accept'), RESPONSE_MIMETYPES) == wire.MSGPACK_MIMETYPE:
+        response = Response(wire.packb(payload), status=status, mimetype=wire.MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(payload)
+        response.status_code = status
+    observe_serialization(start, response.mimetype, 'encode')
+    return response
+
+
+RESPONSE_MIMETYPES = (wire.JSON_MIMETYPE, wire.MSGPACK_MIMETYPE)
+LISTING_MIMETYPES = RESPONSE_MIMETYPES + (wire.PACKED_MIMETYPE,)
+
+
+# Legge i parametri from/to (epoch o ISO 8601) e limit della query string
+def parse_range_args():
+    bounds = []
+    for name in ('from', 'to'):
+        raw = request.args.get(name)
+        value = parse_timestamp(raw) if raw is not None else None
+        if raw is not None and value is None:
+            raise ValueError(f'Invalid {name} timestamp: {raw}')
+        bounds.append(value)
+    limit = request.args.get('limit')
+    if limit is not None:
+        limit = parse_limit(limit)
+    return bounds[0], bounds[1], limit
+
+
+def parse_limit(raw):
+    if not raw.isdigit() or int(raw) == 0:
+        raise ValueError(f'Invalid limit: {raw}')
+    return int(raw)
+
+
+# Il client chiede lo streaming NDJSON con ?format=ndjson o con l'header Accept
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best in NDJSON_MIMETYPES
+
+
+def ndjson_response(items):
+    def generate():
+        for item in items:
+            yield json.dumps(item) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+# Cursore dello storico: "<ts>:<key>" (ts vuoto per le righe senza timestamp)
+def encode_history_cursor(ts, key):
+    return f"{'' if ts is None else ts}:{key}"
+
+
+def decode_history_cursor(cursor):
+    ts, sep, key = cursor.partition(':')
+    if not sep or (ts and not ts.lstrip('-').isdigit()):
+        raise ValueError(f'Invalid cursor: {cursor}')
+    return (int(ts) if ts else None), key
+
+
+# Ampiezza in secondi (?step=, ?window=): un intero positivo o una delle risoluzioni dei rollup
+def parse_seconds(name, default=None):
+    raw = request.args.get(name, default)
+    if raw is None:
+        raise ValueError(f'Missing {name}')
+    if raw in RESOLUTIONS:
+        return RESOLUTIONS[raw]
+    if not raw.isdigit() or int(raw) == 0:
+        raise ValueError(f'Invalid {name}: {raw}')
+    return int(raw)
+
+
+def parse_percentiles(raw):
+    try:
+        percentiles = [float(q) for q in raw.split(',')]
+    except ValueError:
+        percentiles = None
+    if not percentiles or not all(0 <= q <= 100 for q in percentiles):
+        raise ValueError(f'Invalid percentiles: {raw}')
+    return percentiles
+
+
+def series_payload(timestamps, values, **fields):
+    return {'status': 'success', **fields, 'timestamps': timestamps.tolist(), 'values': values.tolist()}
+
+
 # Funzione per registrare le routes con l'app Flask
 def register_routes(app, config):
     global nodes_db, port, API_TOKEN, replication_manager
@@ -27,7 +196,68 @@ def register_routes(app, config):
     API_TOKEN = config.get('API_TOKEN')
 
     if replication_manager is None:
-        replication_manager = MeasurementReplicationManager(num_nodes=nodes_db, port=port)
+        node_options = {
+            'data_dir': config.get('data_dir', 'data'),
+            'pool_size': config.get('sqlite_pool_size', 4),
+            'bloom_capacity': config.get('bloom_capacity', 100000),
+            'bloom_error_rate': config.get('bloom_error_rate', 0.01),
+            'journal_mode': config.get('sqlite_journal_mode', 'WAL'),
+            'synchronous': config.get('sqlite_synchronous', 'NORMAL'),
+            'partition_seconds': config.get('partition_seconds', 86400),
+        }
+        storage_backend = config.get('storage_backend', 'sqlite')
+        if storage_backend == 'wal':
+            node_options['memtable_limit'] = config.get('memtable_limit', 10000)
+            node_options['flush_interval'] = config.get('memtable_flush_interval', 1.0)
+        fanout_options = {
+            'max_workers': config.get('fanout_workers', 8),
+            'write_quorum': config.get('write_quorum'),
+            'read_quorum': config.get('read_quorum', 1),
+            'read_mode': config.get('read_mode', 'sequential'),
+            'hedge_delay': config.get('hedge_delay_ms', 5) / 1000,
+        }
+        ring_options = {
+            'vnodes': config.get('ring_vnodes', 1),
+            'hash_function': config.get('ring_hash', 'md5'),
+            # Le chiavi JSON sono stringhe: i pesi sono indicizzati per node_id intero
+            'weights': {int(node_id): weight for node_id, weight in (config.get('ring_weights') or {}).items()},
+        }
+        alert_options = {
+            'buffer_size': config.get('alert_buffer_size', 1000),
+            'db_path': os.path.join(node_options['data_dir'], 'alerts.db') if config.get('alert_persist') else None,
+            'synchronous': node_options['synchronous'],
+            'async_detection': config.get('alert_async_detection', True),
+            'queue_size': config.get('alert_queue_size', 10000),
+        }
+        cache_options = None
+        if config.get('cache_enabled', True):
+            cache_options = {
+                'max_entries': config.get('cache_max_entries', 10000),
+                'max_bytes': config.get('cache_max_bytes', 16 * 1024 * 1024),
+                'ttl': config.get('cache_ttl_seconds'),
+            }
+        replication_manager = MeasurementReplicationManager(num_nodes=nodes_db, port=port,
+                                                            node_options=node_options,
+                                                            fanout_options=fanout_options,
+                                                            ring_options=ring_options,
+                                                            hint_batch_size=config.get('hint_batch_size', 500),
+                                                            storage_backend=storage_backend,
+                                                            node_mode=config.get('node_mode', 'inprocess'),
+                                                            node_host=config.get('node_host', '127.0.0.1'),
+                                                            node_port_base=config.get('node_port_base'),
+                                                            rpc_pool_size=config.get('rpc_pool_size', 8),
+                                                            alert_options=alert_options,
+                                                            rollup_interval=config.get('rollup_interval', 1.0),
+                                                            cache_options=cache_options,
+                                                            metrics_enabled=config.get('metrics_enabled', True),
+                                                            rebalance_options={
+                                                                'batch_size': config.get('rebalance_batch_size', 1000),
+                                                                'max_rows_per_second':
+                                                                    config.get('rebalance_max_rows_per_second'),
+                                                            },
+                                                            retention_seconds=config.get('retention_seconds'),
+                                                            retention_interval=config.get('retention_interval', 60),
+                                                            cold_after=config.get('cold_after_seconds'))
 
     
     # Endpoint di default per verificare lo stato del servizio
@@ -39,7 +269,14 @@ def register_routes(app, config):
     @app.route('/ingest', methods=['POST'])
     @require_api_token
     def ingest_measurement():
-        data = request.json
+        start = time.perf_counter()
+        try:
+            data = parse_binary_measurement(request.get_data(), request.mimetype)
+        except ValueError as e:
+            return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
+        if data is None:
+            data = request.json
+        observe_serialization(start, request.mimetype, 'decode')
         required = {'sensor_id', 'timestamp', 'value'}
         if not data or not required.issubset(data):
             return jsonify({'error': 'Invalid input',
@@ -50,8 +287,23 @@ def register_routes(app, config):
             value = data['value']
             key = f"{sensor_id}:{timestamp}"
             replication_manager.store_measurement(key, value)
-            return jsonify({'status': 'success',
-                            'message': f'Measurement {key} stored successfully'})
+            return encoded_response({'status': 'success',
+                                     'message': f'Measurement {key} stored successfully'})
+        except Exception as e:
+            return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+
+    # Endpoint per salvare un lotto di misurazioni (JSON array o NDJSON)
+    @app.route('/ingest/batch', methods=['POST'])
+    @require_api_token
+    def ingest_batch():
+        try:
+            batch = parse_batch_payload()
+        except ValueError as e:
+            return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
+        try:
+            stored = replication_manager.store_measurements(batch)
+            return encoded_response({'status': 'success', 'stored': stored,
+                                     'message': f'{stored} measurements stored successfully'})
         except Exception as e:
             return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
 
@@ -71,6 +323,26 @@ def register_routes(app, config):
         except Exception as e:
             return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
 
+    # Endpoint per aggiungere a un sensore un rilevatore su finestra mobile (ewma, zscore, rate, minmax)
+    @app.route('/set_detector', methods=['POST'])
+    @require_api_token
+    def set_detector():
+        data = request.json
+        if not data or 'sensor_id' not in data or 'type' not in data:
+            return jsonify({'error': 'Invalid input', 'message': 'sensor_id and type are required'}), 400
+        params = data.get('params') or {}
+        try:
+            detector = replication_manager.alert_manager.set_detector(data['sensor_id'], data['type'], **params)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
+        return jsonify({'status': 'success', 'sensor_id': data['sensor_id'], 'detector': detector})
+
+    # Metriche in formato testo Prometheus: istogrammi di latenza, contatori e stato di nodi, suggerimenti e cache
+    @app.route('/metrics', methods=['GET'])
+    @require_api_token
+    def metrics():
+        return Response(replication_manager.metrics.render(), mimetype='text/plain; version=0.0.4')
+
     # Endpoint per leggere una misurazione energetica
     @app.route('/measurement/<sensor_key>', methods=['GET'])
     @require_api_token
@@ -78,7 +350,8 @@ def register_routes(app, config):
         try:
             result = replication_manager.retrieve_measurement(sensor_key)
             if result['value'] is not None:
-                return jsonify({'key': sensor_key, 'value': result['value'], 'message': result['message'], 'status': 'success'})
+                return encoded_response({'key': sensor_key, 'value': result['value'], 'message': result['message'],
+                                         'status': 'success'})
             else:
                 return jsonify({'error': 'Measurement not found', 'message': result['message']}), 404
         except Exception as e:
@@ -111,11 +384,46 @@ def register_routes(app, config):
     @require_api_token
     def recover_node(node_id):
         try:
-            replication_manager.recover_node(node_id)
-            return jsonify({'status': 'success', 'message': f'Node {node_id} recovered'})
+            report = replication_manager.recover_node(node_id)
+            return jsonify({'status': 'success', 'message': f'Node {node_id} recovered', 'sync': report})
+        except Exception as e:
+            return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+
+    # Aggiunta di un nodo a caldo: gli intervalli che gli spettano vengono copiati in background
+    @app.route('/add_node', methods=['POST'])
+    @require_api_token
+    def add_node():
+        data = request.get_json(silent=True) or {}
+        weight = data.get('weight')
+        if weight is not None and (isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight <= 0):
+            return jsonify({'error': 'Invalid input', 'message': 'weight must be a positive number'}), 400
+        try:
+            rebalance = replication_manager.add_node(weight)
+            return jsonify({'status': 'success', 'message': f"Adding node {rebalance['node_id']}",
+                            'rebalance': rebalance}), 202
+        except ValueError as e:
+            return jsonify({'error': 'Conflict', 'message': str(e)}), 409
+        except Exception as e:
+            return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+
+    # Rimozione di un nodo: i suoi intervalli passano agli altri nodi prima che esca dal cluster
+    @app.route('/remove_node/<int:node_id>', methods=['POST'])
+    @require_api_token
+    def remove_node(node_id):
+        try:
+            rebalance = replication_manager.remove_node(node_id)
+            return jsonify({'status': 'success', 'message': f'Removing node {node_id}', 'rebalance': rebalance}), 202
+        except ValueError as e:
+            return jsonify({'error': 'Conflict', 'message': str(e)}), 409
         except Exception as e:
             return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
 
+    # Avanzamento e velocità di trasferimento dell'ultimo ribilanciamento
+    @app.route('/rebalance_status', methods=['GET'])
+    @require_api_token
+    def rebalance_status():
+        return jsonify({'status': 'success', 'rebalance': replication_manager.rebalance_status()})
+
     # Endpoint per ottenere lo stato dei nodi
     @app.route('/nodes_status', methods=['GET'])
     @require_api_token
@@ -125,6 +433,15 @@ def register_routes(app, config):
         except Exception as e:
             return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
 
+    # Contatori della cache di lettura (hit/miss/evizioni) per dimensionarla
+    @app.route('/cache_stats', methods=['GET'])
+    @require_api_token
+    def cache_stats():
+        stats = replication_manager.get_cache_stats()
+        if stats is None:
+            return jsonify({'error': 'Cache disabled', 'message': 'The read cache is not enabled'}), 400
+        return jsonify({'status': 'success', 'cache': stats})
+
     # Endpoint per impostare la strategia di replica
     @app.route('/configure_replication', methods=['POST'])
     @require_api_token
@@ -134,9 +451,18 @@ def register_routes(app, config):
             return jsonify({'error': 'Invalid input', 'message': 'Replication strategy is required'}), 400
         strategy = data.get('strategy')
         replication_factor = data.get('replication_factor')
+        if strategy not in replication_manager.STRATEGIES:
+            return jsonify({'error': 'Invalid input', 'message': f'Unsupported replication strategy: {strategy}'}), 400
+        if replication_factor is not None and (isinstance(replication_factor, bool)
+                                               or not isinstance(replication_factor, int) or replication_factor < 1):
+            return jsonify({'error': 'Invalid input', 'message': 'replication_factor must be a positive integer'}), 400
         try:
-            replication_manager.set_replication_strategy(strategy, replication_factor)
-            return jsonify({'status': 'success', 'message': f'Strategy set to {strategy} with factor {replication_factor}'})
+            # I dati vengono spostati in background: l'avanzamento è in /rebalance_status
+            rebalance = replication_manager.set_replication_strategy(strategy, replication_factor)
+            return jsonify({'status': 'success', 'message': f'Strategy set to {strategy} with factor {replication_factor}',
+                            'rebalance': rebalance}), 202
+        except ValueError as e:
+            return jsonify({'error': 'Conflict', 'message': str(e)}), 409
         except Exception as e:
             return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
 
@@ -161,31 +487,192 @@ def register_routes(app, config):
         except Exception as e:
             return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
     
+    # Endpoint per il report di distribuzione delle chiavi sull'anello
+    @app.route('/ring_report', methods=['GET'])
+    @require_api_token
+    def ring_report():
+        try:
+            report = replication_manager.get_ring_report()
+            if report is None:
+                return jsonify({'error': 'Strategy error', 'message': 'Consistent hashing is not active'}), 400
+            return jsonify({'status': 'success', 'report': report})
+        except Exception as e:
+            return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+
+    # Allerte filtrabili per sensore (?sensor_id=), intervallo [from, to) e cursore ?since=<id>
     @app.route('/alerts', methods=['GET'])
     @require_api_token
     def get_alerts():
         try:
-            alerts = replication_manager.alert_manager.get_alerts()
-            return jsonify({'status': 'success', 'alerts': alerts})
+            start, end, limit = parse_range_args()
+            since = request.args.get('since')
+            if since is not None and not since.isdigit():
+                raise ValueError(f'Invalid since cursor: {since}')
+        except ValueError as e:
+            return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
+        try:
+            alerts = replication_manager.alert_manager.get_alerts(
+                request.args.get('sensor_id'), start, end, int(since) if since else None,
+                limit + 1 if limit else None)
+            if limit is None:
+                return jsonify({'status': 'success', 'alerts': alerts})
+            next_cursor = alerts[limit - 1]['id'] if len(alerts) > limit else None
+            return jsonify({'status': 'success', 'alerts': alerts[:limit], 'next_cursor': next_cursor})
         except Exception as e:
             return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
 
+    # Elenco delle misurazioni: paginazione keyset (?limit=&cursor=) o streaming NDJSON
     @app.route('/measurements', methods=['GET'])
     @require_api_token
     def get_all_measurements_route():
         try:
-            measurements = replication_manager.get_all_measurements()
-            return jsonify({'status': 'success', 'measurements': measurements})
+            limit = request.args.get('limit')
+            limit = parse_limit(limit) if limit is not None else None
+        except ValueError as e:
+            return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
+        try:
+            rows = replication_manager.iter_measurements(request.args.get('cursor'))
+            if wants_ndjson():
+                return ndjson_response({'key': key, 'value': value} for key, value in itertools.islice(rows, limit))
+            mimetype = wire.negotiate(request.headers.get('Accept'), LISTING_MIMETYPES)
+            if limit is None:
+                page, next_cursor = list(rows), None
+            else:
+                page = list(itertools.islice(rows, limit + 1))
+                next_cursor = page[limit - 1][0] if len(page) > limit else None
+                page = page[:limit]
+            if mimetype == wire.PACKED_MIMETYPE:
+                # Il cursore viaggia nell'header, il corpo contiene solo i record
+                try:
+                    body = wire.pack_records(wire.to_record(key, value) for key, value in page)
+                except ValueError as e:
+                    return jsonify({'error': 'Not acceptable', 'message': str(e)}), 406
+                response = Response(body, mimetype=wire.PACKED_MIMETYPE)
+                if next_cursor is not None:
+                    response.headers['X-Next-Cursor'] = next_cursor
+                return response
+            payload = {'status': 'success', 'measurements': dict(page)}
+            if limit is not None:
+                payload['next_cursor'] = next_cursor
+            return encoded_response(payload)
+        except Exception as e:
+            return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+
+    # Aggregati per minuto, ora o giorno (?bucket=1m|1h|1d) letti dalle tabelle di rollup
+    @app.route('/sensor/<sensor_id>/aggregate', methods=['GET'])
+    @require_api_token
+    def get_sensor_aggregate(sensor_id):
+        try:
+            start, end, _ = parse_range_args()
+            bucket = request.args.get('bucket', '1h')
+            if bucket not in RESOLUTIONS:
+                raise ValueError(f"Invalid bucket: {bucket} (expected one of {', '.join(RESOLUTIONS)})")
+        except ValueError as e:
+            return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
+        try:
+            buckets = replication_manager.aggregate_sensor_history(sensor_id, bucket, start, end)
+            return jsonify({'status': 'success', 'sensor_id': sensor_id, 'bucket': bucket, 'aggregates': buckets})
         except Exception as e:
             return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
 
+    # Storico di un sensore: scansione per intervallo [from, to) eseguita dai nodi di storage
     @app.route('/sensor/<sensor_id>/history', methods=['GET'])
     @require_api_token
     def get_sensor_history(sensor_id):
         try:
-            prefix = f"{sensor_id}:"
-            all_measurements = replication_manager.get_all_measurements()
-            filtered = {k: v for k, v in all_measurements.items() if k.startswith(prefix)}
-            return jsonify({'status': 'success', 'measurements': filtered})
+            start, end, limit = parse_range_args()
+            cursor = request.args.get('cursor')
+            after = decode_history_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
+        try:
+            if wants_ndjson():
+                rows = replication_manager.iter_sensor_history(sensor_id, start, end, after)
+                return ndjson_response({'key': key, 'timestamp': ts, 'value': value}
+                                       for ts, key, value in itertools.islice(rows, limit))
+            if limit is None:
+                rows = replication_manager.get_sensor_history(sensor_id, start, end, after=after)
+                return jsonify({'status': 'success', 'measurements': {key: value for _, key, value in rows}})
+            rows = replication_manager.get_sensor_history(sensor_id, start, end, limit + 1, after)
+            next_cursor = encode_history_cursor(*rows[limit - 1][:2]) if len(rows) > limit else None
+            return jsonify({'status': 'success', 'measurements': {key: value for _, key, value in rows[:limit]},
+                            'next_cursor': next_cursor})
+        except Exception as e:
+            return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+
+    # Analisi vettoriali sugli array dello storico, calcolate dal server invece di trasferire le misurazioni
+    @app.route('/sensor/<sensor_id>/resample', methods=['GET'])
+    @require_api_token
+    def get_sensor_resample(sensor_id):
+        try:
+            start, end, _ = parse_range_args()
+            step = parse_seconds('step', '1h')
+            how = request.args.get('how', 'mean')
+            if how not in analytics.AGGREGATIONS:
+                raise ValueError(f"Invalid aggregation: {how} (expected one of {', '.join(analytics.AGGREGATIONS)})")
+        except ValueError as e:
+            return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
+        try:
+            timestamps, values = replication_manager.sensor_arrays(sensor_id, start, end)
+            timestamps, values = analytics.resample(timestamps, values, step, how)
+            return encoded_response(series_payload(timestamps, values, sensor_id=sensor_id, step=step, how=how))
+        except Exception as e:
+            return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+
+    @app.route('/sensor/<sensor_id>/percentile', methods=['GET'])
+    @require_api_token
+    def get_sensor_percentile(sensor_id):
+        try:
+            start, end, _ = parse_range_args()
+            percentiles = parse_percentiles(request.args.get('q', '50'))
+        except ValueError as e:
+            return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
+        try:
+            _, values = replication_manager.sensor_arrays(sensor_id, start, end)
+            results = analytics.percentile(values, percentiles)
+            return encoded_response({'status': 'success', 'sensor_id': sensor_id, 'count': len(values),
+                                     'percentiles': [{'q': q, 'value': value}
+                                                     for q, value in zip(percentiles, results)]})
         except Exception as e:
-            return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
\ No newline at end of file
+            return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+
+    @app.route('/sensor/<sensor_id>/moving_average', methods=['GET'])
+    @require_api_token
+    def get_sensor_moving_average(sensor_id):
+        try:
+            start, end, _ = parse_range_args()
+            window = parse_seconds('window')
+        except ValueError as e:
+            return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
+        try:
+            # La finestra deve vedere anche i campioni che precedono l'intervallo richiesto
+            load_start = start - window if start is not None else None
+            timestamps, values = replication_manager.sensor_arrays(sensor_id, load_start, end)
+            timestamps, values = analytics.moving_average(timestamps, values, window)
+            if start is not None:
+                first = int(analytics.numpy.searchsorted(timestamps, start))
+                timestamps, values = timestamps[first:], values[first:]
+            return encoded_response(series_payload(timestamps, values, sensor_id=sensor_id, window=window))
+        except Exception as e:
+            return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+
+    # Somma per intervallo delle medie di un gruppo di sensori (?sensors=a,b,c), es. il consumo totale
+    @app.route('/sensors/total', methods=['GET'])
+    @require_api_token
+    def get_sensors_total():
+        try:
+            start, end, _ = parse_range_args()
+            step = parse_seconds('step', '1h')
+            sensor_ids = [sensor_id for sensor_id in request.args.get('sensors', '').split(',') if sensor_id]
+            if not sensor_ids:
+                raise ValueError('Missing sensors')
+        except ValueError as e:
+            return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
+        try:
+            series = [replication_manager.sensor_arrays(sensor_id, start, end) for sensor_id in sensor_ids]
+            timestamps, totals, sensors = analytics.total(series, step)
+            payload = series_payload(timestamps, totals, sensors=sensor_ids, step=step)
+            payload['counts'] = sensors.tolist()
+            return encoded_response(payload)
+        except Exception as e:
+            return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
@@ -0,0 +1,323 @@
+import json
+import multiprocessing
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from .analytics import empty_series, numpy, require_numpy
+from .merkle import build_tree, sync_node
+from .models import MeasurementReplicationManager, StorageNode
+
+# Ogni messaggio è un frame: lunghezza (4 byte big-endian) + corpo JSON
+FRAME_HEADER = struct.Struct('!I')
+
+# Metodi di StorageNode invocabili da remoto
+EXPOSED_METHODS = (
+    'write', 'write_many', 'read', 'delete', 'key_exists', 'scan_sensor', 'rows_page', 'rows_in_ranges',
+    'get_all_keys', 'bucket_digests', 'rows_in_buckets', 'rows_for_keys', 'row_hashes_in_buckets', 'apply_rows',
+    'fail', 'rebuild_bloom', 'bloom_stats', 'partition_stats', 'drop_partitions', 'compact_partitions',
+    'sensor_arrays',
+)
+
+
+class RemoteNodeError(Exception):
+    """Raised on the client when the storage node process reports an error."""
+
+
+def send_message(sock, message):
+    body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(FRAME_HEADER.pack(len(body)) + body)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_message(sock):
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    body = _recv_exact(sock, FRAME_HEADER.unpack(header)[0])
+    if body is None:
+        return None
+    return json.loads(body)
+
+
+# --- Lato server: un processo per nodo di storage ---
+
+class _NodeRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Connessione keep-alive: più richieste sulla stessa socket finché il client non la chiude
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            if message is None:
+                return
+            method, args = message
+            try:
+                reply = [True, self.server.dispatch(method, args)]
+            except Exception as e:
+                reply = [False, f'{type(e).__name__}: {e}']
+            try:
+                send_message(self.request, reply)
+            except (ConnectionError, OSError):
+                return
+
+
+class NodeServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, node, host, port):
+        super().__init__((host, port), _NodeRequestHandler)
+        self.node = node
+
+    def dispatch(self, method, args):
+        if method == 'mark_alive':
+            self.node.alive = True
+            return None
+        if method == 'shutdown':
+            self.node.close()
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return None
+        if method not in EXPOSED_METHODS:
+            raise AttributeError(f'Method {method} is not exposed')
+        if method == 'sensor_arrays':
+            # Gli array numpy viaggiano come liste JSON
+            return [array.tolist() for array in self.node.sensor_arrays(*args)]
+        return getattr(self.node, method)(*args)
+
+
+def serve_node(storage_backend, node_id, host, port, node_options):
+    """Process entry point: open the node storage and serve it on ``host:port``."""
+    node_class = MeasurementReplicationManager._node_class(storage_backend)
+    node = node_class(node_id, port, **node_options)
+    with NodeServer(node, host, port) as server:
+        server.serve_forever()
+
+
+# --- Lato client ---
+
+class RemoteStorageNode:
+    """Client stub with the StorageNode interface, forwarding calls to a node process.
+
+    Sockets are kept alive and reused through a small pool, one request in flight per socket.
+    """
+
+    def __init__(self, node_id, host, port, pool_size=8, connect_timeout=10.0):
+        self.node_id = node_id
+        self.host = host
+        self.port = port
+        self.alive = True
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._pool_lock = threading.Lock()
+        self._opened = 0
+        self._wait_until_ready(connect_timeout)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _wait_until_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._pool.put(self._connect())
+                self._opened = 1
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            if self._opened < self.pool_size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except OSError:
+                    self._opened -= 1
+                    raise
+        return self._pool.get()
+
+    def _discard(self, sock):
+        sock.close()
+        with self._pool_lock:
+            self._opened -= 1
+
+    def _call(self, method, *args):
+        sock = self._acquire()
+        try:
+            send_message(sock, [method, args])
+            reply = recv_message(sock)
+        except (ConnectionError, OSError):
+            self._discard(sock)
+            raise
+        if reply is None:
+            self._discard(sock)
+            raise ConnectionError(f'Storage node {self.node_id} closed the connection')
+        self._pool.put(sock)
+        ok, result = reply
+        if not ok:
+            raise RemoteNodeError(result)
+        return result
+
+    def close(self):
+        with self._pool_lock:
+            while True:
+                try:
+                    sock = self._pool.get_nowait()
+                except queue.Empty:
+                    break
+                sock.close()
+                self._opened -= 1
+
+    def shutdown(self):
+        try:
+            self._call('shutdown')
+        except (ConnectionError, OSError):
+            pass
+        self.close()
+
+    # --- Interfaccia StorageNode ---
+
+    def write(self, key, value):
+        if self.alive:
+            self._call('write', key, value)
+
+    def write_many(self, rows):
+        if self.alive and rows:
+            self._call('write_many', rows)
+
+    def read(self, key):
+        if self.alive:
+            return self._call('read', key)
+
+    def delete(self, key):
+        if self.alive:
+            self._call('delete', key)
+
+    def key_exists(self, key):
+        if self.alive:
+            return self._call('key_exists', key)
+
+    def scan_sensor(self, sensor_id, start=None, end=None, limit=None, after=None):
+        if not self.alive:
+            return []
+        return [tuple(row) for row in self._call('scan_sensor', sensor_id, start, end, limit, after)]
+
+    def rows_page(self, after_key=None, limit=1000):
+        if not self.alive:
+            return []
+        return [tuple(row) for row in self._call('rows_page', after_key, limit)]
+
+    def rows_in_ranges(self, ranges, hash_function='md5', after_key=None, limit=1000):
+        if not self.alive:
+            return [], None, 0
+        rows, last_key, scanned = self._call('rows_in_ranges', [list(r) for r in ranges], hash_function,
+                                             after_key, limit)
+        return [tuple(row) for row in rows], last_key, scanned
+
+    def sensor_arrays(self, sensor_id, start=None, end=None):
+        require_numpy()
+        if not self.alive:
+            return empty_series()
+        timestamps, values = self._call('sensor_arrays', sensor_id, start, end)
+        return numpy.array(timestamps, dtype=numpy.int64), numpy.array(values, dtype=numpy.float64)
+
+    # La paginazione è la stessa dei nodi locali, sopra rows_page e scan_sensor remoti
+    iter_rows = StorageNode.iter_rows
+    iter_sensor = StorageNode.iter_sensor
+
+    def get_all_keys(self):
+        return [tuple(row) for row in self._call('get_all_keys')]
+
+    def get_all_data(self):
+        return self.get_all_keys()
+
+    def bucket_digests(self):
+        return {int(bucket): tuple(value) for bucket, value in self._call('bucket_digests').items()}
+
+    def merkle_tree(self):
+        return build_tree(self.bucket_digests())
+
+    def rows_in_buckets(self, buckets):
+        return [tuple(row) for row in self._call('rows_in_buckets', list(buckets))]
+
+    def rows_for_keys(self, keys):
+        return [tuple(row) for row in self._call('rows_for_keys', list(keys))]
+
+    def row_hashes_in_buckets(self, buckets):
+        return self._call('row_hashes_in_buckets', list(buckets))
+
+    def apply_rows(self, rows, deletes=()):
+        if rows or deletes:
+            self._call('apply_rows', [list(row) for row in rows], list(deletes))
+
+    def fail(self):
+        self._call('fail')
+        self.alive = False
+
+    def recover(self, active_nodes, strategy='full', retention_before=None):
+        if not self.alive:
+            self._call('mark_alive')
+            self.alive = True
+            if retention_before is not None:
+                self._call('drop_partitions', retention_before)
+            report = self.sync_with_active_nodes(active_nodes) if strategy == 'full' else None
+            self._call('rebuild_bloom')
+            return report
+        return None
+
+    def is_alive(self):
+        return self.alive
+
+    def bloom_stats(self):
+        return self._call('bloom_stats')
+
+    def partition_stats(self):
+        return self._call('partition_stats')
+
+    def drop_partitions(self, before):
+        return self._call('drop_partitions', before)
+
+    def compact_partitions(self, before):
+        return self._call('compact_partitions', before)
+
+    def sync_with_active_nodes(self, active_nodes):
+        peers = [node for node in active_nodes if node.is_alive() and node.node_id != self.node_id]
+        return sync_node(self, peers)
+
+
+def spawn_nodes(node_ids, storage_backend, node_options, host, port_base, pool_size=8):
+    """Start one process per storage node id and return ``(stubs, processes)``; node ``i`` listens on ``port_base + i``."""
+    # spawn: il processo padre può avere thread attivi (pool di fan-out, server Flask)
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    for i in node_ids:
+        process = context.Process(target=serve_node, args=(storage_backend, i, host, port_base + i, node_options),
+                                  name=f'storage-node-{i}', daemon=True)
+        process.start()
+        processes.append(process)
+    stubs = [RemoteStorageNode(i, host, port_base + i, pool_size) for i in node_ids]
+    return stubs, processes
@@ -0,0 +1,259 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+
+try:
+    import numpy
+except ImportError:  # dipendenza opzionale: senza numpy le partizioni restano righe SQLite
+    numpy = None
+
+from .timeseries import numeric_value
+
+MAGIC = b'EGSEG\0\0\0'
+VERSION = 1
+# magic, versione, numero di blocchi, offset dell'indice dei blocchi, offset della directory dei sensori
+HEADER = struct.Struct('<8sIIQQ')
+BLOCK_SIZE = 4096
+# Le chiavi in un segmento sono "sensore:epoch" con epoch di 10 cifre: l'ordine delle stringhe
+# coincide con quello numerico e la chiave si ricostruisce da sensore e timestamp
+MIN_TS, MAX_TS = 10 ** 9, 10 ** 10
+MAX_EXACT_INT = 2 ** 53
+
+if numpy is not None:
+    # Una voce per blocco, letta dal file mappato senza copie
+    BLOCK_DTYPE = numpy.dtype([('first_ts', '<i8'), ('last_ts', '<i8'), ('first_delta', '<i8'),
+                               ('first_bits', '<u8'), ('offset', '<u8'), ('count', '<u4'),
+                               ('ts_width', 'u1'), ('value_width', 'u1'), ('shift', 'u1'), ('pad', 'u1')])
+
+
+def segment_eligible(key, sensor_id, ts, value):
+    """True when a stored row can move to a segment and be rebuilt from it unchanged."""
+    if sensor_id is None or ts is None or not MIN_TS <= ts < MAX_TS or key != f'{sensor_id}:{ts}':
+        return False
+    if isinstance(value, float):
+        return value == value  # NaN non è rappresentabile in SQLite
+    return isinstance(value, int) and -MAX_EXACT_INT <= value <= MAX_EXACT_INT
+
+
+def stored_values(values):
+    """Convert float64 samples back to the values SQLite stored (integral values as int, as ``numeric_value``)."""
+    integral = numpy.isfinite(values) & (numpy.floor(values) == values) & (values >= -2.0 ** 63) & (values < 2.0 ** 63)
+    if not integral.any():
+        return values.tolist()
+    converted = values.astype(object)
+    converted[integral] = values[integral].astype(numpy.int64).astype(object)
+    return converted.tolist()
+
+
+def _bit_length(values):
+    # L'OR di tutti i valori ha la lunghezza in bit del massimo
+    return int(numpy.bitwise_or.reduce(values)).bit_length() if len(values) else 0
+
+
+def _pack(values, width):
+    """Pack unsigned 64-bit ``values`` on ``width`` bits each."""
+    if not width or not len(values):
+        return b''
+    bits = (values[:, None] >> numpy.arange(width, dtype=numpy.uint64)) & numpy.uint64(1)
+    return numpy.packbits(bits.astype(numpy.uint8).ravel(), bitorder='little').tobytes()
+
+
+def _unpack(buffer, count, width):
+    if not width or count <= 0:
+        return numpy.zeros(max(count, 0), dtype=numpy.uint64)
+    # Ogni valore sta in due parole consecutive da 64 bit: due letture, due shift e una maschera
+    size = _packed_size(count, width)
+    padded = numpy.zeros((size + 7) // 8 + 1, dtype=numpy.uint64)
+    padded.view(numpy.uint8)[:size] = buffer[:size]
+    positions = numpy.arange(count, dtype=numpy.uint64) * numpy.uint64(width)
+    words = positions >> numpy.uint64(6)
+    offsets = positions & numpy.uint64(63)
+    high = (padded[words + numpy.uint64(1)] << (numpy.uint64(63) - offsets)) << numpy.uint64(1)
+    return ((padded[words] >> offsets) | high) & numpy.uint64((1 << width) - 1)
+
+
+def _packed_size(count, width):
+    return (max(count, 0) * width + 7) // 8
+
+
+def encode_block(ts, values):
+    """Encode up to ``BLOCK_SIZE`` sorted samples; return ``(index fields, data bytes)``.
+
+    Timestamps are stored as delta-of-delta and values as the XOR with the previous value (Gorilla).
+    Instead of per-sample control bits the block shares one bit width for each column, so it
+    decodes with a handful of vectorized operations.
+    """
+    deltas = numpy.diff(ts)
+    first_delta = int(deltas[0]) if len(deltas) else 0
+    dods = numpy.diff(deltas)
+    # Zigzag: i delta-of-delta negativi diventano interi senza segno piccoli
+    dods = ((dods << 1) ^ (dods >> 63)).astype(numpy.uint64)
+    ts_width = _bit_length(dods)
+
+    bits = values.view(numpy.uint64)
+    xors = bits[1:] ^ bits[:-1]
+    combined = int(numpy.bitwise_or.reduce(xors)) if len(xors) else 0
+    # Finestra di bit significativi comune al blocco: zeri iniziali e finali condivisi
+    shift = (combined & -combined).bit_length() - 1 if combined else 0
+    value_width = combined.bit_length() - shift if combined else 0
+    data = _pack(dods, ts_width) + _pack(xors >> numpy.uint64(shift), value_width)
+    return (int(ts[0]), int(ts[-1]), first_delta, int(bits[0]), 0, len(ts), ts_width, value_width, shift, 0), data
+
+
+def decode_block(entry, buffer):
+    """Decode one block from its index ``entry`` and the ``uint8`` view of its data."""
+    count = int(entry['count'])
+    ts_width, value_width = int(entry['ts_width']), int(entry['value_width'])
+    ts_bytes = _packed_size(count - 2, ts_width)
+    dods = _unpack(buffer[:ts_bytes], count - 2, ts_width)
+    dods = (dods >> numpy.uint64(1)).astype(numpy.int64) ^ -(dods & numpy.uint64(1)).astype(numpy.int64)
+    ts = numpy.empty(count, dtype=numpy.int64)
+    ts[0] = entry['first_ts']
+    if count > 1:
+        deltas = numpy.empty(count - 1, dtype=numpy.int64)
+        deltas[0] = entry['first_delta']
+        numpy.cumsum(dods, out=deltas[1:])
+        deltas[1:] += entry['first_delta']
+        numpy.cumsum(deltas, out=ts[1:])
+        ts[1:] += ts[0]
+
+    bits = numpy.empty(count, dtype=numpy.uint64)
+    bits[0] = entry['first_bits']
+    bits[1:] = _unpack(buffer[ts_bytes:ts_bytes + _packed_size(count - 1, value_width)], count - 1, value_width)
+    bits[1:] <<= numpy.uint64(int(entry['shift']))
+    numpy.bitwise_xor.accumulate(bits, out=bits)
+    return ts, bits.view(numpy.float64)
+
+
+def write_segment(path, series):
+    """Write ``{sensor_id: (timestamps, values)}`` (sorted by time) as a segment file; return its size.
+
+    The file is written aside and renamed, so a crash never leaves a truncated segment at ``path``.
+    """
+    # Sensori nell'ordine delle loro chiavi, così le pagine per chiave si leggono in sequenza
+    sensors = sorted(series, key=lambda sensor_id: f'{sensor_id}:')
+    entries, directory = [], []
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\0' * HEADER.size)
+        for sensor_id in sensors:
+            ts = numpy.asarray(series[sensor_id][0], dtype=numpy.int64)
+            values = numpy.asarray(series[sensor_id][1], dtype=numpy.float64)
+            directory.append([sensor_id, len(entries), (len(ts) + BLOCK_SIZE - 1) // BLOCK_SIZE, len(ts)])
+            for i in range(0, len(ts), BLOCK_SIZE):
+                fields, data = encode_block(ts[i:i + BLOCK_SIZE], values[i:i + BLOCK_SIZE])
+                fields = fields[:4] + (f.tell(),) + fields[5:]
+                entries.append(fields)
+                f.write(data)
+        # Indice allineato a 8 byte per la vista numpy
+        f.write(b'\0' * (-f.tell() % 8))
+        index_offset = f.tell()
+        f.write(numpy.array(entries, dtype=BLOCK_DTYPE).tobytes())
+        directory_offset = f.tell()
+        f.write(json.dumps(directory, separators=(',', ':')).encode('utf-8'))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries), index_offset, directory_offset))
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.seek(0, os.SEEK_END)
+    os.replace(tmp_path, path)
+    return size
+
+
+class Segment:
+    """Read-only columnar segment of one partition, memory-mapped.
+
+    The block index is a NumPy view of the mapping and block data is decoded straight from it;
+    only the blocks overlapping the requested time range are decoded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, blocks, index_offset, directory_offset = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a segment file')
+        self.nbytes = len(self._mmap)
+        self.index = numpy.frombuffer(self._mmap, BLOCK_DTYPE, blocks, index_offset)
+        self._data = numpy.frombuffer(self._mmap, numpy.uint8, index_offset)
+        directory = json.loads(self._mmap[directory_offset:].decode('utf-8'))
+        self.sensors = {sensor_id: (first, count, rows) for sensor_id, first, count, rows in directory}
+        self.order = [sensor_id for sensor_id, _, _, _ in directory]
+        self.rows = sum(rows for _, _, rows in self.sensors.values())
+
+    def close(self):
+        self.index = self._data = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # array decodificati ancora in uso: la mappatura si chiude con l'ultimo riferimento
+
+    def _decode(self, i):
+        entry = self.index[i]
+        return decode_block(entry, self._data[int(entry['offset']):])
+
+    def _blocks(self, sensor_id):
+        first, count, _ = self.sensors.get(sensor_id, (0, 0, 0))
+        return first, self.index[first:first + count]
+
+    def arrays(self, sensor_id, start=None, end=None):
+        """Return ``(timestamps int64, values float64)`` of a sensor with ``start <= ts < end``."""
+        first, blocks = self._blocks(sensor_id)
+        selected = numpy.ones(len(blocks), dtype=bool)
+        if start is not None:
+            selected &= blocks['last_ts'] >= start
+        if end is not None:
+            selected &= blocks['first_ts'] < end
+        decoded = [self._decode(first + i) for i in numpy.flatnonzero(selected)]
+        if not decoded:
+            return numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.float64)
+        ts = numpy.concatenate([block_ts for block_ts, _ in decoded])
+        values = numpy.concatenate([block_values for _, block_values in decoded])
+        low = 0 if start is None else numpy.searchsorted(ts, start)
+        high = len(ts) if end is None else numpy.searchsorted(ts, end)
+        return ts[low:high], values[low:high]
+
+    def lookup(self, sensor_id, ts):
+        """Return the stored value of ``sensor_id`` at ``ts``, ``None`` when absent."""
+        first, blocks = self._blocks(sensor_id)
+        i = numpy.searchsorted(blocks['first_ts'], ts, side='right') - 1
+        if i < 0 or ts > blocks['last_ts'][i]:
+            return None
+        block_ts, values = self._decode(first + i)
+        j = numpy.searchsorted(block_ts, ts)
+        if j < len(block_ts) and block_ts[j] == ts:
+            return numeric_value(float(values[j]))
+        return None
+
+    def series(self):
+        """Yield ``(sensor_id, timestamps, values)`` for every sensor, in key order."""
+        for sensor_id in self.order:
+            yield (sensor_id, *self.arrays(sensor_id))
+
+    def rows_page(self, after_key=None, limit=1000):
+        """Return up to ``limit`` ``(key, value)`` pairs with key greater than ``after_key``, in key order."""
+        rows = []
+        for sensor_id in self.order:
+            prefix = f'{sensor_id}:'
+            if after_key is None or after_key < prefix:
+                after_ts = None
+            elif after_key.startswith(prefix):
+                after_ts = after_key[len(prefix):]
+            else:
+                continue  # tutte le chiavi del sensore precedono after_key
+            first, blocks = self._blocks(sensor_id)
+            start = 0
+            if after_ts is not None:
+                start = max(0, bisect.bisect_right(blocks['first_ts'].tolist(), after_ts, key=str) - 1)
+            for i in range(first + start, first + len(blocks)):
+                ts, values = self._decode(i)
+                ts = ts.tolist()
+                skip = bisect.bisect_right(ts, after_ts, key=str) if after_ts is not None else 0
+                after_ts = None
+                rows.extend(zip([f'{prefix}{t}' for t in ts[skip:]], stored_values(values[skip:])))
+                if len(rows) >= limit:
+                    return rows[:limit]
+        return rows
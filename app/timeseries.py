@@ -0,0 +1,72 @@
+import math
+import re
+from datetime import datetime, timezone
+
+_NUMERIC_TEXT = re.compile(r'^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$')
+_INTEGER_TEXT = re.compile(r'^\s*[+-]?\d+\s*$')
+# Epoch numerici da 10^11 in su (anno 5138 in secondi, 1973 in millisecondi) sono millisecondi
+MILLISECOND_EPOCH = 10 ** 11
+# Epoch rappresentabili come INTEGER di SQLite, con margine per la fine della loro partizione
+MAX_EPOCH = 2 ** 62
+
+
+def parse_timestamp(value):
+    """Convert an epoch number or an ISO 8601 string to integer epoch seconds.
+
+    Epoch numbers of ``MILLISECOND_EPOCH`` or more (in absolute value) are taken as milliseconds and
+    truncated to seconds. Naive ISO timestamps are interpreted as UTC. Returns ``None`` when ``value``
+    cannot be parsed or its magnitude reaches ``MAX_EPOCH``.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        epoch = int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        pass
+    else:
+        if abs(epoch) >= MILLISECOND_EPOCH:
+            epoch //= 1000
+        return epoch if abs(epoch) < MAX_EPOCH else None
+    text = str(value).strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def split_key(key):
+    """Split a ``sensor:timestamp`` key into ``(sensor_id, epoch)``.
+
+    Keys without a sensor prefix return ``(None, None)``; an unparsable timestamp gives ``(sensor_id, None)``.
+    """
+    sensor_id, sep, timestamp = key.partition(':')
+    if not sep:
+        return None, None
+    return sensor_id, parse_timestamp(timestamp)
+
+
+def numeric_value(value):
+    """Return ``value`` as SQLite stores it in a NUMERIC column.
+
+    Numeric text becomes int or float, floats with an exact integer value become int, other values are unchanged.
+    """
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str):
+        if _INTEGER_TEXT.match(value):
+            number = int(value)
+            if -2 ** 63 <= number < 2 ** 63:
+                return number
+            value = float(number)
+        elif _NUMERIC_TEXT.match(value):
+            value = float(value)
+        else:
+            return value
+    if isinstance(value, float) and math.isfinite(value) and value.is_integer() and -2 ** 63 <= value < 2 ** 63:
+        return int(value)
+    return value
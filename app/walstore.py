@@ -0,0 +1,265 @@
+import glob
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+
+from .models import StorageNode
+from .timeseries import numeric_value
+
+logger = logging.getLogger(__name__)
+
+OP_PUT = 1
+OP_DELETE = 2
+# crc32 del payload, operazione, lunghezza chiave, lunghezza valore
+RECORD_HEADER = struct.Struct('!IBHI')
+_TOMBSTONE = object()
+_MISSING = object()
+
+
+def encode_record(op, key, value=None):
+    key_bytes = key.encode('utf-8')
+    value_bytes = json.dumps(value).encode('utf-8') if op == OP_PUT else b''
+    payload = bytes((op,)) + key_bytes + value_bytes
+    return RECORD_HEADER.pack(zlib.crc32(payload), op, len(key_bytes), len(value_bytes)) + key_bytes + value_bytes
+
+
+def read_records(path):
+    """Yield ``(op, key, value)`` records of a WAL segment, stopping at the first torn or corrupt record."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        crc, op, key_len, value_len = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        end = start + key_len + value_len
+        if end > len(data):
+            return
+        key_bytes = data[start:start + key_len]
+        value_bytes = data[start + key_len:end]
+        if zlib.crc32(bytes((op,)) + key_bytes + value_bytes) != crc:
+            return
+        value = json.loads(value_bytes) if op == OP_PUT else None
+        yield op, key_bytes.decode('utf-8'), value
+        offset = end
+
+
+class WalStorageNode(StorageNode):
+    """Storage node that appends writes to a write-ahead log and buffers them in a memtable.
+
+    The memtable is flushed to SQLite in key order with one bulk transaction when it reaches
+    ``memtable_limit`` entries or every ``flush_interval`` seconds; flushed WAL segments are deleted.
+    Segments left behind by a crash are replayed into SQLite on startup. WAL durability follows the
+    ``synchronous`` level: FULL fsyncs every append, NORMAL hands it to the OS, OFF keeps it buffered.
+    """
+
+    def __init__(self, node_id, port, data_dir='data', memtable_limit=10000, flush_interval=1.0, **options):
+        # La memtable esiste già quando StorageNode prepara il filtro di Bloom
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._memtable = {}
+        self._immutable = {}
+        super().__init__(node_id, port, data_dir=data_dir, **options)
+        self.memtable_limit = memtable_limit
+        self.flush_interval = flush_interval
+        self.wal_dir = os.path.join(data_dir, f'wal_{node_id}')
+        os.makedirs(self.wal_dir, exist_ok=True)
+
+        self._segment_seq = 0
+        self._segment = None
+        self._replay()
+        self._open_segment()
+
+        self._stop = threading.Event()
+        self._flusher = None
+        if flush_interval:
+            self._flusher = threading.Thread(target=self._flush_loop, name=f'wal-flush-{node_id}', daemon=True)
+            self._flusher.start()
+
+    # --- WAL ---
+
+    def _segment_paths(self):
+        return sorted(glob.glob(os.path.join(self.wal_dir, '*.log')))
+
+    def _open_segment(self):
+        self._segment_seq += 1
+        path = os.path.join(self.wal_dir, f'{self._segment_seq:012d}.log')
+        self._segment = open(path, 'ab')
+
+    def _replay(self):
+        paths = self._segment_paths()
+        if paths:
+            self._segment_seq = int(os.path.basename(paths[-1]).split('.')[0])
+        table = {}
+        for path in paths:
+            for op, key, value in read_records(path):
+                table[key] = value if op == OP_PUT else _TOMBSTONE
+        if table:
+            self._write_to_sqlite(table)
+        for path in paths:
+            os.remove(path)
+
+    def _append(self, records):
+        self._segment.write(b''.join(records))
+        if self.synchronous != 'OFF':
+            self._segment.flush()
+            if self.synchronous in ('FULL', 'EXTRA'):
+                os.fsync(self._segment.fileno())
+
+    # --- Memtable ---
+
+    def _write_to_sqlite(self, table):
+        rows, deletes = [], []
+        for key in sorted(table):
+            value = table[key]
+            if value is _TOMBSTONE:
+                deletes.append(key)
+            else:
+                rows.append(self._row(key, value))
+        StorageNode.apply_rows(self, rows, deletes)
+
+    def flush(self):
+        """Move the memtable to SQLite and drop the WAL segments it covers."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._memtable:
+                    return 0
+                self._immutable, self._memtable = self._memtable, {}
+                flushed_segment = self._segment
+                self._open_segment()
+            flushed_segment.close()
+            count = len(self._immutable)
+            self._write_to_sqlite(self._immutable)
+            with self._lock:
+                self._immutable = {}
+            for path in self._segment_paths():
+                if path < self._segment.name:
+                    os.remove(path)
+            return count
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception('WAL flush of node %s failed: %s', self.node_id, e)
+
+    def _lookup(self, key):
+        with self._lock:
+            for table in (self._memtable, self._immutable):
+                if key in table:
+                    return table[key]
+        return _MISSING
+
+    def _unflushed_keys(self):
+        with self._lock:
+            return [key for table in (self._memtable, self._immutable) for key, value in table.items()
+                    if value is not _TOMBSTONE]
+
+    def rebuild_bloom(self):
+        # Nessun riversamento durante la scansione: le chiavi sono in SQLite o ancora nella memtable
+        with self._flush_lock:
+            super().rebuild_bloom()
+
+    def close(self):
+        self._stop.set()
+        if self._flusher:
+            self._flusher.join()
+        self.flush()
+        with self._lock:
+            self._segment.close()
+        super().close()
+
+    # --- Operazioni del nodo ---
+
+    def write(self, key, value):
+        self.write_many([(key, value)])
+
+    def write_many(self, rows):
+        if not self.alive or not rows:
+            return
+        rows = [(key, numeric_value(value)) for key, value in rows]
+        self._remember([key for key, _ in rows])
+        records = [encode_record(OP_PUT, key, value) for key, value in rows]
+        with self._lock:
+            self._append(records)
+            self._memtable.update(rows)
+            full = len(self._memtable) >= self.memtable_limit
+        if full:
+            self.flush()
+
+    def delete(self, key):
+        if self.alive and self.might_contain(key):
+            with self._lock:
+                self._append([encode_record(OP_DELETE, key)])
+                self._memtable[key] = _TOMBSTONE
+                full = len(self._memtable) >= self.memtable_limit
+            if full:
+                self.flush()
+
+    def read(self, key):
+        if self.alive:
+            value = self._lookup(key)
+            if value is _MISSING:
+                return super().read(key)
+            return None if value is _TOMBSTONE else value
+
+    def key_exists(self, key):
+        if self.alive:
+            value = self._lookup(key)
+            if value is _MISSING:
+                return super().key_exists(key)
+            return value is not _TOMBSTONE
+
+    # Le scansioni leggono da SQLite: prima si svuota la memtable
+
+    def scan_sensor(self, *args, **kwargs):
+        self.flush()
+        return super().scan_sensor(*args, **kwargs)
+
+    def sensor_arrays(self, *args, **kwargs):
+        self.flush()
+        return super().sensor_arrays(*args, **kwargs)
+
+    def rows_page(self, *args, **kwargs):
+        self.flush()
+        return super().rows_page(*args, **kwargs)
+
+    def get_all_keys(self):
+        self.flush()
+        return super().get_all_keys()
+
+    def bucket_digests(self):
+        self.flush()
+        return super().bucket_digests()
+
+    def rows_in_buckets(self, buckets):
+        self.flush()
+        return super().rows_in_buckets(buckets)
+
+    def rows_for_keys(self, keys):
+        self.flush()
+        return super().rows_for_keys(keys)
+
+    def row_hashes_in_buckets(self, buckets):
+        self.flush()
+        return super().row_hashes_in_buckets(buckets)
+
+    def apply_rows(self, rows, deletes=()):
+        self.flush()
+        super().apply_rows(rows, deletes)
+
+    def partition_stats(self):
+        self.flush()
+        return super().partition_stats()
+
+    def drop_partitions(self, before):
+        # Senza flush le righe scadute ancora in memtable ricreerebbero la partizione
+        self.flush()
+        return super().drop_partitions(before)
+
+    def compact_partitions(self, before):
+        self.flush()
+        return super().compact_partitions(before)
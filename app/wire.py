@@ -0,0 +1,131 @@
+import struct
+
+try:
+    import msgpack
+except ImportError:  # dipendenza opzionale: senza msgpack restano disponibili JSON e il formato packed
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack', 'application/vnd.msgpack')
+PACKED_MIMETYPE = 'application/vnd.energyguard.packed'
+
+# magic, numero di sensori e di record; segue la tabella dei sensor_id (lunghezza + UTF-8) e i record a
+# lunghezza fissa (indice del sensore, epoch int64, valore float64), little endian
+PACKED_HEADER = struct.Struct('<4sII')
+PACKED_MAGIC = b'EGP1'
+SENSOR_LENGTH = struct.Struct('<H')
+RECORD = struct.Struct('<Iqd')
+
+
+def normalize_mimetype(content_type):
+    return (content_type or '').split(';')[0].strip().lower()
+
+
+def format_name(mimetype):
+    """Short name of a body format, used as a metric label."""
+    mimetype = normalize_mimetype(mimetype)
+    if mimetype in MSGPACK_MIMETYPES:
+        return 'msgpack'
+    if mimetype == PACKED_MIMETYPE:
+        return 'packed'
+    if mimetype.endswith('ndjson') or mimetype == 'application/jsonlines':
+        return 'ndjson'
+    return 'json'
+
+
+def negotiate(accept, offered):
+    """Return the type of ``offered`` preferred by the ``Accept`` header; the first one when nothing matches.
+
+    Wildcards select the first offered type, so clients that do not ask for a binary format keep getting JSON.
+    """
+    choices = []
+    for position, part in enumerate((accept or '').split(',')):
+        mimetype, *params = [item.strip() for item in part.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, raw = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(raw)
+                except ValueError:
+                    quality = 0.0
+        if mimetype and quality > 0:
+            choices.append((-quality, position, mimetype.lower()))
+    for _, _, mimetype in sorted(choices):
+        if mimetype in MSGPACK_MIMETYPES and MSGPACK_MIMETYPE in offered:
+            return MSGPACK_MIMETYPE
+        if mimetype in offered:
+            return mimetype
+        if mimetype in ('*/*', 'application/*'):
+            break
+    return offered[0]
+
+
+def packb(obj):
+    if msgpack is None:
+        raise ValueError('MessagePack support requires the msgpack package')
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpackb(data):
+    if msgpack is None:
+        raise ValueError('MessagePack support requires the msgpack package')
+    try:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError, ValueError, TypeError) as e:
+        raise ValueError(f'Invalid MessagePack body: {e}')
+
+
+def to_record(key, value):
+    """Convert a stored ``sensor:epoch`` measurement to a packed ``(sensor_id, epoch, value)`` record.
+
+    Raises ``ValueError`` when the key has no integer epoch or the value is not numeric, since the
+    fixed layout could not reproduce them.
+    """
+    sensor_id, sep, timestamp = key.partition(':')
+    if not sep or not timestamp.lstrip('-').isdigit() or str(int(timestamp)) != timestamp:
+        raise ValueError(f'Key {key} is not in sensor:epoch form')
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f'Value of {key} is not numeric')
+    return sensor_id, int(timestamp), float(value)
+
+
+def pack_records(records):
+    """Encode ``(sensor_id, epoch, value)`` tuples in the fixed binary layout."""
+    sensors, body = {}, []
+    for sensor_id, epoch, value in records:
+        index = sensors.setdefault(str(sensor_id), len(sensors))
+        body.append(RECORD.pack(index, int(epoch), float(value)))
+    table = []
+    for sensor_id in sensors:
+        encoded = sensor_id.encode('utf-8')
+        table.append(SENSOR_LENGTH.pack(len(encoded)) + encoded)
+    return b''.join([PACKED_HEADER.pack(PACKED_MAGIC, len(sensors), len(body)), *table, *body])
+
+
+def unpack_records(data):
+    """Decode a body written by ``pack_records``; raises ``ValueError`` when it is malformed."""
+    data = memoryview(data)
+    if len(data) < PACKED_HEADER.size:
+        raise ValueError('Packed body too short')
+    magic, num_sensors, count = PACKED_HEADER.unpack_from(data)
+    if magic != PACKED_MAGIC:
+        raise ValueError('Packed body has an unknown header')
+    sensors, offset = [], PACKED_HEADER.size
+    try:
+        for _ in range(num_sensors):
+            (length,) = SENSOR_LENGTH.unpack_from(data, offset)
+            offset += SENSOR_LENGTH.size
+            if offset + length > len(data):
+                raise ValueError('Truncated packed body')
+            sensors.append(str(data[offset:offset + length], 'utf-8'))
+            offset += length
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f'Truncated packed body: {e}')
+    if len(data) - offset != count * RECORD.size:
+        raise ValueError('Packed body length does not match its record count')
+    try:
+        return [(sensors[index], epoch, value) for index, epoch, value in RECORD.iter_unpack(data[offset:])]
+    except IndexError:
+        raise ValueError('Packed record refers to an unknown sensor')
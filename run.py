@@ -8,8 +8,49 @@ def load_config(path='config/config.json'):
     default = {
         'host': '127.0.0.1',
         'port': 5000,
+        'server': 'flask',
         'nodes_db': 3,
-        'API_TOKEN': 'your_api_token_here'
+        'API_TOKEN': 'your_api_token_here',
+        'data_dir': 'data',
+        'storage_backend': 'sqlite',
+        'memtable_limit': 10000,
+        'memtable_flush_interval': 1.0,
+        'node_mode': 'inprocess',
+        'node_host': '127.0.0.1',
+        'node_port_base': 5001,
+        'rpc_pool_size': 8,
+        'bloom_capacity': 100000,
+        'bloom_error_rate': 0.01,
+        'sqlite_pool_size': 4,
+        'sqlite_journal_mode': 'WAL',
+        'sqlite_synchronous': 'NORMAL',
+        'partition_seconds': 86400,
+        'retention_seconds': None,
+        'retention_interval': 60,
+        'cold_after_seconds': None,
+        'fanout_workers': 8,
+        'write_quorum': None,
+        'read_quorum': 1,
+        'read_mode': 'sequential',
+        'hedge_delay_ms': 5,
+        'ring_vnodes': 64,
+        'ring_hash': 'md5',
+        'ring_weights': {},
+        'alert_buffer_size': 1000,
+        'alert_persist': False,
+        'alert_async_detection': True,
+        'alert_queue_size': 10000,
+        'rollup_interval': 1.0,
+        'cache_enabled': True,
+        'cache_max_entries': 10000,
+        'cache_max_bytes': 16777216,
+        'cache_ttl_seconds': 60,
+        'hint_batch_size': 500,
+        'rebalance_batch_size': 1000,
+        'rebalance_max_rows_per_second': 50000,
+        'metrics_enabled': True,
+        'log_level': 'INFO',
+        'log_sample_every': 100
     }
     if not os.path.exists(path):
         os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -23,10 +64,20 @@ def load_config(path='config/config.json'):
             return default
 
 
+def serve(config):
+    host, port = config.get('host', '127.0.0.1'), config.get('port', 5000)
+    # "asgi": stesse route su Starlette + uvicorn, con gli endpoint principali asincroni
+    if config.get('server', 'flask') == 'asgi':
+        import uvicorn
+        from app.asgi import create_asgi_app
+        uvicorn.run(create_asgi_app(config), host=host, port=port, log_level='warning')
+    else:
+        app = create_app(config)
+        app.run(host=host, port=port)
+
+
 def main():
-    config = load_config()
-    app = create_app(config)
-    app.run(host=config.get('host', '127.0.0.1'), port=config.get('port', 5000))
+    serve(load_config())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,60 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models import StorageNode
+from app.walstore import WalStorageNode
+
+BACKENDS = {
+    'sqlite': StorageNode,
+    'wal': WalStorageNode,
+}
+
+
+def run_backend(name, writes, batch_size, synchronous):
+    """Sustained write throughput of one node, including the final flush of buffered data."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        node = BACKENDS[name](0, 5000, data_dir=data_dir, synchronous=synchronous)
+        start = time.perf_counter()
+        for i in range(0, writes, batch_size):
+            rows = [(f'sensor{j % 100}:{1751738400 + j}', j * 0.25) for j in range(i, min(i + batch_size, writes))]
+            if batch_size == 1:
+                node.write(*rows[0])
+            else:
+                node.write_many(rows)
+        if isinstance(node, WalStorageNode):
+            node.flush()
+        elapsed = time.perf_counter() - start
+        node.close()
+    return {'writes': writes, 'batch_size': batch_size, 'seconds': elapsed, 'writes_per_second': writes / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput di scrittura sostenuto: SQLite vs WAL + memtable')
+    parser.add_argument('--writes', type=int, default=20000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100])
+    parser.add_argument('--synchronous', default='NORMAL')
+    parser.add_argument('--output', help='file JSON in cui salvare i risultati')
+    args = parser.parse_args()
+
+    results = []
+    for batch_size in args.batch_sizes:
+        for name in BACKENDS:
+            result = {'backend': name, **run_backend(name, args.writes, batch_size, args.synchronous)}
+            results.append(result)
+            print(f"{name:>6} batch={batch_size:<5} {result['writes_per_second']:10.0f} writes/s "
+                  f"({result['seconds']:.2f}s)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
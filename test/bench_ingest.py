@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app import routes
+
+API_TOKEN = 'bench_token'
+
+# "before": una connessione per operazione con journal rollback e fsync completo (comportamento originale)
+# "after": pool di connessioni persistenti con WAL e synchronous=NORMAL
+SCENARIOS = {
+    'before': {'sqlite_pool_size': 0, 'sqlite_journal_mode': 'DELETE', 'sqlite_synchronous': 'FULL'},
+    'after': {'sqlite_pool_size': 4, 'sqlite_journal_mode': 'WAL', 'sqlite_synchronous': 'NORMAL'},
+}
+
+
+def run_scenario(options, requests_count, nodes_db):
+    with tempfile.TemporaryDirectory() as data_dir:
+        routes.replication_manager = None
+        config = {'port': 5000, 'nodes_db': nodes_db, 'API_TOKEN': API_TOKEN, 'data_dir': data_dir, **options}
+        app = create_app(config)
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {API_TOKEN}'}
+
+        latencies = []
+        start = time.perf_counter()
+        for i in range(requests_count):
+            payload = {'sensor_id': f'sensor{i % 10}', 'timestamp': f'2025-07-05T18:{i // 60 % 60:02d}:{i % 60:02d}.{i}',
+                       'value': i * 0.5}
+            t0 = time.perf_counter()
+            response = client.post('/ingest', json=payload, headers=headers)
+            latencies.append(time.perf_counter() - t0)
+            if response.status_code != 200:
+                raise RuntimeError(f'Ingest failed: {response.status_code} {response.get_data(as_text=True)}')
+        elapsed = time.perf_counter() - start
+
+        routes.replication_manager.close()
+        routes.replication_manager = None
+
+    latencies.sort()
+    return {
+        'requests': requests_count,
+        'seconds': elapsed,
+        'requests_per_second': requests_count / elapsed,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark before/after del percorso /ingest')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--output', help='file JSON in cui salvare i risultati')
+    args = parser.parse_args()
+
+    results = {}
+    for name, options in SCENARIOS.items():
+        results[name] = run_scenario(options, args.requests, args.nodes)
+        r = results[name]
+        print(f"{name:>6}: {r['requests_per_second']:8.1f} req/s  "
+              f"mean {r['mean_ms']:.3f} ms  p50 {r['p50_ms']:.3f} ms  p99 {r['p99_ms']:.3f} ms")
+    print(f"speedup: {results['after']['requests_per_second'] / results['before']['requests_per_second']:.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models import StorageNode
+
+BASE = 1751673600  # inizio di un giorno UTC
+
+
+def generate(sensors, samples, interval, jitter, seed=0):
+    """Meter-like series: a random walk rounded to two decimals, one sample every ``interval`` seconds."""
+    rng = random.Random(seed)
+    rows = []
+    for sensor in range(sensors):
+        value = 230.0
+        for i in range(samples):
+            value += rng.gauss(0, 0.5)
+            ts = BASE + i * interval + (rng.randint(-jitter, jitter) if jitter else 0)
+            rows.append((f'meter{sensor}:{ts}', round(value, 2)))
+    return rows
+
+
+def sqlite_bytes(node):
+    """Bytes of the partition tables and their indexes (the digests are needed by both layouts)."""
+    with node._connection() as conn:
+        return conn.execute('''SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'measurements_%'
+                               OR name LIKE 'idx_measurements_%' OR name LIKE 'sqlite_autoindex_measurements_%'
+                               ''').fetchone()[0] or 0
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def scan_rows(node, sensors):
+    return sum(len(node.scan_sensor(f'meter{sensor}')) for sensor in range(sensors))
+
+
+def scan_arrays(node, sensors):
+    """Samples of every sensor as numpy arrays: from the segments, or from the SQLite rows."""
+    import numpy
+
+    total = 0
+    for sensor in range(sensors):
+        sensor_id = f'meter{sensor}'
+        if node._segments:
+            for segment in node._segments.values():
+                timestamps, values = segment.arrays(sensor_id)
+                total += len(values)
+        else:
+            for table, _, _ in node.partitions():
+                with node._connection() as conn:
+                    rows = conn.execute(f'''SELECT ts, value FROM {table} WHERE sensor_id=? ORDER BY ts''',
+                                        (sensor_id,)).fetchall()
+                if rows:
+                    values = numpy.array(rows, dtype=numpy.float64)
+                    total += len(values)
+    return total
+
+
+def run(sensors, samples, interval, jitter, repeat):
+    rows = generate(sensors, samples, interval, jitter)
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        hot = StorageNode(0, 5000, data_dir=data_dir, bloom_capacity=0)
+        cold = StorageNode(1, 5001, data_dir=data_dir, bloom_capacity=0)
+        for node in (hot, cold):
+            for i in range(0, len(rows), 10000):
+                node.write_many(rows[i:i + 10000])
+        start = time.perf_counter()
+        report = cold.compact_partitions(BASE + samples * interval + 86400)
+        compaction = time.perf_counter() - start
+
+        for layout, node in (('sqlite', hot), ('segments', cold)):
+            size = sqlite_bytes(node) + sum(segment.nbytes for segment in node._segments.values())
+            scanned, scan_seconds = timed(lambda: scan_rows(node, sensors), repeat)
+            decoded, array_seconds = timed(lambda: scan_arrays(node, sensors), repeat)
+            assert scanned == decoded == len(rows)
+            results.append({'layout': layout, 'samples': len(rows), 'bytes': size,
+                            'bytes_per_sample': size / len(rows),
+                            'scan_rows_per_second': scanned / scan_seconds,
+                            'array_samples_per_second': decoded / array_seconds})
+        results[-1]['compaction_seconds'] = compaction
+        results[-1]['compacted_partitions'] = report['partitions']
+        hot.close()
+        cold.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Byte per campione e velocità di scansione: righe SQLite vs '
+                                                 'segmenti colonnari compressi')
+    parser.add_argument('--sensors', type=int, default=10)
+    parser.add_argument('--samples', type=int, default=50000, help='campioni per sensore')
+    parser.add_argument('--interval', type=int, default=10, help='secondi tra due campioni')
+    parser.add_argument('--jitter', type=int, default=1, help='scostamento casuale massimo dei timestamp (s)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='file JSON in cui salvare i risultati')
+    args = parser.parse_args()
+
+    results = run(args.sensors, args.samples, args.interval, args.jitter, args.repeat)
+    for result in results:
+        print(f"{result['layout']:>9} {result['bytes_per_sample']:7.2f} B/sample "
+              f"{result['scan_rows_per_second']:12.0f} rows/s (scan_sensor) "
+              f"{result['array_samples_per_second']:12.0f} samples/s (arrays)")
+    sqlite, segments = results
+    print(f"segments: {sqlite['bytes'] / segments['bytes']:.1f}x smaller, compaction "
+          f"{segments['compaction_seconds']:.2f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, ROOT)
+
+from app.client import EnergyGuardClient
+
+API_TOKEN = 'bench_token'
+HEADERS = {'Authorization': f'Bearer {API_TOKEN}'}
+
+
+def start_server(server, port, data_dir, options):
+    """Start run.serve() in a subprocess and wait until it answers."""
+    config = {'host': '127.0.0.1', 'port': port, 'server': server, 'nodes_db': 3, 'API_TOKEN': API_TOKEN,
+              'data_dir': data_dir, 'rollup_interval': 0, **options}
+    script = f'import json, sys; sys.path.insert(0, {ROOT!r}); from run import serve; serve(json.loads(sys.argv[1]))'
+    process = subprocess.Popen([sys.executable, '-c', script, json.dumps(config)], cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=0.5).read()
+            return process
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{server} server did not start on port {port}')
+
+
+class HttpConnection:
+    """Minimal keep-alive HTTP/1.1 client: the load generator must not be the bottleneck."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        head = (f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: {HEADERS["Authorization"]}\r\n'
+                f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n')
+        self.writer.write(head.encode('ascii') + payload)
+        await self.writer.drain()
+        status_line, *lines = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        headers = dict(line.split(':', 1) for line in lines if ':' in line)
+        headers = {name.strip().lower(): value.strip() for name, value in headers.items()}
+        await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close' or status_line.startswith('HTTP/1.0'):
+            self.close()
+        return int(status_line.split()[1])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def load(port, concurrency, duration, read_ratio, keys):
+    """Closed-loop load: ``concurrency`` clients issue requests back to back for ``duration`` seconds."""
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id):
+        nonlocal errors
+        connection = HttpConnection(port)
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            t0 = time.perf_counter()
+            if (i * 7919 + worker_id) % 100 < read_ratio * 100:
+                status = await connection.request('GET', f'/measurement/{keys[(i * 31 + worker_id) % len(keys)]}')
+            else:
+                status = await connection.request('POST', '/ingest', {'sensor_id': f'load{worker_id}',
+                                                                      'timestamp': 1751738400 + i, 'value': i})
+            latencies.append(time.perf_counter() - t0)
+            if status != 200:
+                errors += 1
+        connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def run_server(server, port, concurrency_levels, duration, read_ratio, options):
+    with tempfile.TemporaryDirectory() as data_dir:
+        process = start_server(server, port, data_dir, options)
+        try:
+            keys = [f'seed:{1751738400 + i}' for i in range(1000)]
+            with EnergyGuardClient(f'http://127.0.0.1:{port}', API_TOKEN, 'packed', timeout=30) as client:
+                client.ingest_batch([('seed', 1751738400 + i, i) for i in range(1000)])
+            return [{'server': server, **asyncio.run(load(port, c, duration, read_ratio, keys))}
+                    for c in concurrency_levels]
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Carico su server Flask e ASGI: richieste/s e latenza p99')
+    parser.add_argument('--servers', nargs='+', default=['flask', 'asgi'], choices=['flask', 'asgi'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--duration', type=float, default=5.0, help='secondi per livello di concorrenza')
+    parser.add_argument('--read-ratio', type=float, default=0.8, help='quota di GET /measurement sul totale')
+    parser.add_argument('--port', type=int, default=5600)
+    parser.add_argument('--read-mode', default='parallel', choices=['sequential', 'parallel', 'hedged'])
+    parser.add_argument('--output', help='file JSON in cui salvare i risultati')
+    args = parser.parse_args()
+
+    options = {'read_mode': args.read_mode, 'cache_enabled': False}
+    results = []
+    for server in args.servers:
+        for result in run_server(server, args.port, args.concurrency, args.duration, args.read_ratio, options):
+            results.append(result)
+            print(f"{server:>6} c={result['concurrency']:<4} {result['requests_per_second']:8.0f} req/s "
+                  f"p50={result['p50_ms']:7.2f}ms p99={result['p99_ms']:7.2f}ms errors={result['errors']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
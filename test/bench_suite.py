@@ -0,0 +1,188 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, ROOT)
+
+from app.models import MeasurementReplicationManager
+
+SENSORS = 100
+BASE_TS = 1751738400
+# Parametri che identificano un caso: servono a plot_result.py per confrontare esecuzioni diverse
+CASE_PARAMS = ('keys', 'nodes', 'strategy', 'replication_factor', 'read_ratio', 'threads', 'backend')
+
+
+def dataset_key(index):
+    """Key of the ``index``-th measurement: ``SENSORS`` sensors, one sample per second each."""
+    return f'sensor{index % SENSORS}:{BASE_TS + index // SENSORS}'
+
+
+def percentiles(samples):
+    """Latency summary in milliseconds of ``samples`` (seconds)."""
+    if not samples:
+        return None
+    samples = sorted(samples)
+
+    def at(fraction):
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+    return {'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99), 'p999': at(0.999), 'max': samples[-1] * 1000,
+            'mean': sum(samples) / len(samples) * 1000}
+
+
+def load_dataset(manager, keys, batch_size):
+    """Store ``keys`` measurements through the batch path; return the elapsed seconds."""
+    start = time.perf_counter()
+    for first in range(0, keys, batch_size):
+        manager.store_measurements([(dataset_key(i), i * 0.25) for i in range(first, min(first + batch_size, keys))])
+    return time.perf_counter() - start
+
+
+def run_mix(manager, keys, ops, read_ratio, threads=1, seed=0):
+    """Closed loop of ``ops`` single reads and overwrites of existing keys split across ``threads`` threads."""
+    reads, writes = [], []
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        own_reads, own_writes = [], []
+        barrier.wait()
+        for _ in range(ops // threads + (worker_id < ops % threads)):
+            key = dataset_key(rng.randrange(keys))
+            if rng.random() < read_ratio:
+                start = time.perf_counter()
+                manager.retrieve_measurement(key)
+                own_reads.append(time.perf_counter() - start)
+            else:
+                start = time.perf_counter()
+                manager.store_measurement(key, rng.random() * 100)
+                own_writes.append(time.perf_counter() - start)
+        reads.extend(own_reads)
+        writes.extend(own_writes)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {'ops': ops, 'seconds': elapsed, 'ops_per_second': ops / elapsed if elapsed else 0.0,
+            'latency_ms': percentiles(reads + writes), 'read_latency_ms': percentiles(reads),
+            'write_latency_ms': percentiles(writes)}
+
+
+def run_fail_recover(manager, keys, writes, seed=0):
+    """Fail node 0, overwrite ``writes`` keys while it is down and time its recovery (hint replay and sync)."""
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    manager.fail_node(0)
+    fail_seconds = time.perf_counter() - start
+    for _ in range(writes):
+        manager.store_measurement(dataset_key(rng.randrange(keys)), rng.random() * 100)
+    start = time.perf_counter()
+    manager.recover_node(0)
+    return {'fail_ms': fail_seconds * 1000, 'writes_while_down': writes,
+            'recover_seconds': time.perf_counter() - start}
+
+
+def run_setup(keys, nodes, strategy, replication_factor, read_ratios, ops, threads=1, backend='sqlite',
+              batch_size=10000, fail_writes=0, seed=0):
+    """Load one dataset and run every read/write mix on it; return one result per mix."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        manager = MeasurementReplicationManager(
+            num_nodes=nodes, strategy=strategy, replication_factor=replication_factor, storage_backend=backend,
+            node_options={'data_dir': data_dir}, rollup_interval=0, alert_options={'async_detection': False})
+        try:
+            load_seconds = load_dataset(manager, keys, batch_size)
+            results = []
+            for read_ratio in read_ratios:
+                case = {'keys': keys, 'nodes': nodes, 'strategy': strategy,
+                        'replication_factor': replication_factor, 'read_ratio': read_ratio, 'threads': threads,
+                        'backend': backend, 'load_seconds': load_seconds,
+                        'load_keys_per_second': keys / load_seconds if load_seconds else 0.0}
+                case.update(run_mix(manager, keys, ops, read_ratio, threads, seed))
+                results.append(case)
+            if fail_writes:
+                results[-1]['fail_recover'] = run_fail_recover(manager, keys, fail_writes, seed)
+            return results
+        finally:
+            manager.close()
+
+
+def setups(args):
+    """Valid (keys, nodes, strategy, replication_factor) combinations; full replication ignores the factor."""
+    seen = set()
+    for keys, nodes, strategy, factor in itertools.product(args.keys, args.nodes, args.strategies,
+                                                           args.replication_factors):
+        factor = None if strategy == 'full' else factor
+        if factor is not None and factor > nodes:
+            continue
+        if (keys, nodes, strategy, factor) not in seen:
+            seen.add((keys, nodes, strategy, factor))
+            yield keys, nodes, strategy, factor
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del cluster: throughput e percentili di latenza')
+    parser.add_argument('--keys', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='dimensioni del dataset (da 10^3 a 10^7 chiavi)')
+    parser.add_argument('--nodes', type=int, nargs='+', default=[3])
+    parser.add_argument('--strategies', nargs='+', default=['full', 'consistent'], choices=['full', 'consistent'])
+    parser.add_argument('--replication-factors', type=int, nargs='+', default=[2])
+    parser.add_argument('--read-ratios', type=float, nargs='+', default=[0.5, 0.95],
+                        help='quota di letture nel carico misto')
+    parser.add_argument('--ops', type=int, default=5000, help='operazioni misurate per ogni mix')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--backend', default='sqlite', choices=['sqlite', 'wal'])
+    parser.add_argument('--batch-size', type=int, default=10000, help='misurazioni per lotto nel caricamento')
+    parser.add_argument('--fail-writes', type=int, default=100,
+                        help='scritture con un nodo giù prima del recupero cronometrato (0 = salta)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='file JSON in cui salvare i risultati')
+    args = parser.parse_args()
+
+    results = []
+    for keys, nodes, strategy, factor in setups(args):
+        for result in run_setup(keys, nodes, strategy, factor, args.read_ratios, args.ops, args.threads,
+                                args.backend, args.batch_size, args.fail_writes, args.seed):
+            results.append(result)
+            latency = result['latency_ms']
+            print(f"keys={keys:<9} nodes={nodes} {strategy:>10} rf={factor} reads={result['read_ratio']:.2f} "
+                  f"{result['ops_per_second']:9.0f} ops/s p50={latency['p50']:7.3f}ms p99={latency['p99']:7.3f}ms "
+                  f"load={result['load_keys_per_second']:9.0f} keys/s")
+            if 'fail_recover' in result:
+                print(f"{'':>10} recover after {result['fail_recover']['writes_while_down']} writes: "
+                      f"{result['fail_recover']['recover_seconds']:.3f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'settings': vars(args), 'results': results}, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,124 @@
+import argparse
 import json
-import matplotlib.pyplot as plt
+import os
+import sys
 
-# Carica i risultati dal file JSON
-with open("results_full.json") as f:
-    results_full = json.load(f)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-with open("results_consistent.json") as f:
-    results_consistent = json.load(f)
+from bench_suite import CASE_PARAMS
 
-# Operazioni da plottare
-operations = ['Write', 'Read', 'Fail', 'Recover']
-full = [results_full[op] for op in operations]
-consistent = [results_consistent[op] for op in operations]
 
-x = range(len(operations))
-width = 0.35
+def load_results(path):
+    """Results list of a file written by ``bench_suite.py --output``."""
+    with open(path) as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or 'results' not in data:
+        raise ValueError(f'{path} is not a bench_suite.py result file')
+    return data['results']
 
-fig, ax = plt.subplots()
-ax.bar([i - width/2 for i in x], full, width, label='Full')
-ax.bar([i + width/2 for i in x], consistent, width, label='Consistent')
 
-ax.set_xticks(x)
-ax.set_xticklabels(operations)
-ax.set_ylabel('Time (seconds)')
-ax.set_title('Performance Comparison')
-ax.legend()
-ax.grid(axis='y', linestyle='--', alpha=0.7)
+def case_key(result):
+    return tuple(result.get(param) for param in CASE_PARAMS)
 
-plt.tight_layout()
-plt.show()
+
+def describe(key, skip=()):
+    return ' '.join(f'{param}={value}' for param, value in zip(CASE_PARAMS, key) if param not in skip)
+
+
+def compare(baseline, current, threshold=0.1):
+    """Match the cases of two runs; a case regresses when throughput drops or p99 grows by more than ``threshold``."""
+    previous = {case_key(result): result for result in baseline}
+    rows = []
+    for result in current:
+        before = previous.get(case_key(result))
+        if before is None:
+            continue
+        throughput_change = result['ops_per_second'] / before['ops_per_second'] - 1
+        p99_change = result['latency_ms']['p99'] / before['latency_ms']['p99'] - 1
+        rows.append({'case': describe(case_key(result)), 'throughput_change': throughput_change,
+                     'p99_change': p99_change,
+                     'regression': throughput_change < -threshold or p99_change > threshold})
+    return rows
+
+
+def series(results, x):
+    """Group results by every case parameter except ``x``; each group is sorted along ``x``."""
+    groups = {}
+    for result in results:
+        key = describe(case_key(result), skip=(x,))
+        groups.setdefault(key, []).append(result)
+    return {key: sorted(rows, key=lambda result: result[x]) for key, rows in groups.items()}
+
+
+def plot_scaling(results, x='keys', output=None):
+    import matplotlib.pyplot as plt
+
+    fig, (throughput_ax, latency_ax) = plt.subplots(1, 2, figsize=(12, 5))
+    for label, rows in series(results, x).items():
+        xs = [result[x] for result in rows]
+        throughput_ax.plot(xs, [result['ops_per_second'] for result in rows], marker='o', label=label)
+        latency_ax.plot(xs, [result['latency_ms']['p99'] for result in rows], marker='o', label=label)
+    for ax, ylabel in ((throughput_ax, 'Throughput (ops/s)'), (latency_ax, 'p99 latency (ms)')):
+        if x == 'keys':
+            ax.set_xscale('log')
+        ax.set_xlabel(x)
+        ax.set_ylabel(ylabel)
+        ax.grid(linestyle='--', alpha=0.7)
+    latency_ax.legend(fontsize='small')
+    fig.suptitle(f'Scaling with {x}')
+    fig.tight_layout()
+    finish(plt, output)
+
+
+def plot_comparison(rows, output=None):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, max(3, len(rows) * 0.4)))
+    positions = range(len(rows))
+    ax.barh([i - 0.2 for i in positions], [row['throughput_change'] * 100 for row in rows], 0.4, label='Throughput')
+    ax.barh([i + 0.2 for i in positions], [row['p99_change'] * 100 for row in rows], 0.4, label='p99 latency')
+    ax.set_yticks(list(positions))
+    ax.set_yticklabels([row['case'] for row in rows], fontsize='small')
+    ax.axvline(0, color='black', linewidth=0.8)
+    ax.set_xlabel('Change vs baseline (%)')
+    ax.legend()
+    ax.grid(axis='x', linestyle='--', alpha=0.7)
+    fig.tight_layout()
+    finish(plt, output)
+
+
+def finish(plt, output):
+    if output:
+        plt.savefig(output)
+    else:
+        plt.show()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Curve di scalabilità e confronto tra esecuzioni di bench_suite.py')
+    parser.add_argument('results', help='file JSON prodotto da bench_suite.py --output')
+    parser.add_argument('--baseline', help='esecuzione di riferimento con cui confrontare i risultati')
+    parser.add_argument('--threshold', type=float, default=0.1, help='variazione relativa considerata regressione')
+    parser.add_argument('--x', default='keys', choices=[param for param in CASE_PARAMS if param != 'backend'])
+    parser.add_argument('--output', help='file immagine del grafico (default: finestra interattiva)')
+    parser.add_argument('--no-plot', action='store_true', help='solo confronto testuale, senza matplotlib')
+    args = parser.parse_args()
+
+    results = load_results(args.results)
+    regressions = 0
+    if args.baseline:
+        rows = compare(load_results(args.baseline), results, args.threshold)
+        for row in rows:
+            regressions += row['regression']
+            print(f"{'REGRESSION' if row['regression'] else 'ok':>10} {row['case']} "
+                  f"throughput {row['throughput_change']:+.1%} p99 {row['p99_change']:+.1%}")
+        if not args.no_plot and rows:
+            plot_comparison(rows, args.output)
+    elif not args.no_plot:
+        plot_scaling(results, args.x, args.output)
+    # Uscita non nulla in caso di regressioni, per usarlo come controllo automatico
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models import AlertManager
+
+
+class TestAlertManager(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'alerts.db')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _storm(self, manager, sensors, count):
+        for sensor_id in sensors:
+            manager.set_threshold(sensor_id, 10)
+        manager.check_batch([(sensor_id, 20 + i, str(1751738400 + i)) for i in range(count) for sensor_id in sensors])
+
+    def test_buffers_are_bounded_per_sensor(self):
+        manager = AlertManager(buffer_size=50)
+        self._storm(manager, ['a', 'b'], 1000)
+        self.assertEqual({sensor_id: len(buffer) for sensor_id, buffer in manager.alerts.items()}, {'a': 50, 'b': 50})
+        alerts = manager.get_alerts(sensor_id='a')
+        self.assertEqual([alert['value'] for alert in alerts], [float(20 + i) for i in range(950, 1000)])
+
+    def test_filters_and_since_cursor(self):
+        manager = AlertManager()
+        self._storm(manager, ['a', 'b'], 10)
+        window = manager.get_alerts(sensor_id='b', start=1751738402, end=1751738405)
+        self.assertEqual([alert['ts'] for alert in window], [1751738402, 1751738403, 1751738404])
+
+        page = manager.get_alerts(limit=3)
+        self.assertEqual([alert['sensor_id'] for alert in page], ['a', 'b', 'a'])
+        rest = manager.get_alerts(since=page[-1]['id'])
+        self.assertEqual(len(rest), 17)
+        self.assertEqual([alert['id'] for alert in page + rest], sorted(alert['id'] for alert in page + rest))
+
+    def test_persisted_time_ranges_are_read_from_sqlite(self):
+        memory, persisted = AlertManager(buffer_size=50), AlertManager(buffer_size=50, db_path=self.db_path)
+        self.addCleanup(persisted.close)
+        for manager in (memory, persisted):
+            self._storm(manager, ['a', 'b', 'c'], 200)
+        queries = [{'start': 1751738560}, {'sensor_id': 'b', 'start': 1751738570, 'end': 1751738580},
+                   {'end': 1751738560}, {'start': 1751738560, 'since': 400, 'limit': 7}]
+        for query in queries:
+            self.assertEqual(persisted.get_alerts(**query), memory.get_alerts(**query), query)
+        self.assertEqual(len(persisted.get_alerts(start=1751738560)), 120)
+        # La lettura usa la tabella, non i buffer
+        persisted.alerts.clear()
+        self.assertEqual(len(persisted.get_alerts(sensor_id='c', start=1751738590)), 10)
+
+    def test_persisted_alerts_survive_restart_within_bound(self):
+        manager = AlertManager(buffer_size=20, db_path=self.db_path)
+        self._storm(manager, ['a'], 100)
+        last_id = manager.get_alerts()[-1]['id']
+        manager.close()
+
+        manager = AlertManager(buffer_size=20, db_path=self.db_path)
+        self.assertEqual(manager._conn.execute('SELECT COUNT(*) FROM alerts').fetchone()[0], 20)
+        alerts = manager.get_alerts(sensor_id='a')
+        self.assertEqual([alert['id'] for alert in alerts], list(range(last_id - 19, last_id + 1)))
+        self._storm(manager, ['a'], 1)
+        self.assertEqual(manager.get_alerts()[-1]['id'], last_id + 1)
+        manager.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import analytics, create_app, routes
+from app.analytics import numpy
+from app.models import MeasurementReplicationManager
+
+API_TOKEN = 'test_token'
+DAY = 86400
+BASE = 1751673600  # inizio di un giorno UTC
+
+
+@unittest.skipIf(numpy is None, 'numpy non installato')
+class TestAnalytics(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.default_rng(1)
+        self.ts = numpy.sort(rng.choice(numpy.arange(BASE, BASE + 20000), 3000, replace=False))
+        self.values = numpy.round(rng.normal(50, 10, len(self.ts)), 2)
+
+    def test_merge_keeps_first_sample_per_timestamp(self):
+        ts, values = analytics.merge_samples([(numpy.array([5, 1]), numpy.array([50.0, 10.0])),
+                                              (numpy.array([1, 3, 5]), numpy.array([-1.0, 30.0, -5.0]))])
+        self.assertEqual((ts.tolist(), values.tolist()), ([1, 3, 5], [10.0, 30.0, 50.0]))
+        self.assertEqual(ts.dtype, numpy.int64)
+
+    def test_resample_matches_python_grouping(self):
+        buckets = {}
+        for ts, value in zip(self.ts.tolist(), self.values.tolist()):
+            buckets.setdefault(ts - ts % 900, []).append(value)
+        expected = {'mean': lambda v: sum(v) / len(v), 'sum': sum, 'min': min, 'max': max, 'count': len,
+                    'first': lambda v: v[0], 'last': lambda v: v[-1]}
+        for how, function in expected.items():
+            starts, result = analytics.resample(self.ts, self.values, 900, how)
+            self.assertEqual(starts.tolist(), sorted(buckets))
+            numpy.testing.assert_allclose(result, [function(buckets[start]) for start in sorted(buckets)])
+        with self.assertRaises(ValueError):
+            analytics.resample(self.ts, self.values, 900, 'median')
+
+    def test_moving_average_and_percentile(self):
+        _, averages = analytics.moving_average(self.ts, self.values, 600)
+        for i in range(0, len(self.ts), 97):
+            window = self.values[(self.ts > self.ts[i] - 600) & (self.ts <= self.ts[i])]
+            self.assertAlmostEqual(averages[i], window.mean())
+        ordered = sorted(self.values.tolist())
+        self.assertEqual(analytics.percentile(self.values, [0, 100]), [ordered[0], ordered[-1]])
+        self.assertIsNone(analytics.percentile(numpy.empty(0), 50))
+
+    def test_total_sums_bucket_means_across_sensors(self):
+        meters = [(numpy.array([0, 30, 60]), numpy.array([1.0, 3.0, 10.0])),
+                  (numpy.array([65, 130]), numpy.array([5.0, 7.0])),
+                  analytics.empty_series()]
+        buckets, totals, sensors = analytics.total(meters, 60)
+        self.assertEqual(buckets.tolist(), [0, 60, 120])
+        self.assertEqual(totals.tolist(), [2.0, 15.0, 7.0])
+        self.assertEqual(sensors.tolist(), [1, 2, 1])
+
+
+@unittest.skipIf(numpy is None, 'numpy non installato')
+class TestSensorArrays(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = MeasurementReplicationManager(num_nodes=3, strategy='consistent', replication_factor=2,
+                                                     node_options={'data_dir': self.tmp.name}, rollup_interval=0)
+        self.rows = [(f'm1:{BASE + i * 60}', round(i * 0.1, 1) if i % 3 else i) for i in range(3 * DAY // 60)]
+        # Valori non numerici e chiavi senza timestamp non sono campioni
+        self.manager.store_measurements(self.rows + [(f'm1:{BASE + 7}', 'off'), ('m1:x', 1)])
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmp.cleanup()
+
+    def test_arrays_match_history_across_hot_and_compacted_partitions(self):
+        expected = [(ts, float(value)) for ts, _, value in self.manager.get_sensor_history('m1', BASE + 1000)
+                    if isinstance(value, (int, float))]
+        compacted = sum(node.compact_partitions(BASE + DAY)['rows'] for node in self.manager.nodes)
+        self.assertGreater(compacted, 0)
+        self.manager.store_measurement(f'm1:{BASE + 120}', 99)
+        self.manager.fail_node(2)
+        ts, values = self.manager.sensor_arrays('m1', BASE + 1000)
+        self.assertEqual(list(zip(ts.tolist(), values.tolist())), expected)
+        ts, values = self.manager.sensor_arrays('m1', end=BASE + 180)
+        self.assertEqual(values.tolist(), [0.0, 0.1, 99.0])
+
+
+@unittest.skipIf(numpy is None, 'numpy non installato')
+class TestAnalyticsApi(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        routes.replication_manager = None
+        self.app = create_app({'port': 5000, 'nodes_db': 3, 'API_TOKEN': API_TOKEN, 'data_dir': self.tmp.name})
+        self.client = self.app.test_client()
+        self.headers = {'Authorization': f'Bearer {API_TOKEN}'}
+        batch = [{'sensor_id': f'p{j}', 'timestamp': BASE + i * 60, 'value': (j + 1) * (i % 10)}
+                 for j in range(2) for i in range(240)]
+        self.client.post('/ingest/batch', json=batch, headers=self.headers)
+
+    def tearDown(self):
+        routes.replication_manager.close()
+        routes.replication_manager = None
+        self.tmp.cleanup()
+
+    def get(self, path):
+        response = self.client.get(path, headers=self.headers)
+        return response.status_code, response.get_json()
+
+    def test_resample_and_moving_average(self):
+        status, body = self.get(f'/sensor/p0/resample?step=1h&how=max&from={BASE + 3600}')
+        self.assertEqual(status, 200)
+        self.assertEqual((body['timestamps'], body['values']), ([BASE + 3600 * h for h in range(1, 4)], [9.0] * 3))
+        status, body = self.get(f'/sensor/p1/moving_average?window=600&from={BASE + 600}&to={BASE + 1200}')
+        # Ogni finestra di 10 minuti contiene una volta ciascun valore 0..9
+        self.assertEqual(body['values'], [9.0] * 10)
+        self.assertEqual(self.get('/sensor/p1/resample?how=median')[0], 400)
+        self.assertEqual(self.get('/sensor/p1/moving_average')[0], 400)
+
+    def test_percentile_and_group_total(self):
+        status, body = self.get('/sensor/p1/percentile?q=0,50,100')
+        self.assertEqual([p['value'] for p in body['percentiles']], [0.0, 9.0, 18.0])
+        self.assertEqual(body['count'], 240)
+        self.assertEqual(self.get('/sensor/p1/percentile?q=101')[0], 400)
+        status, body = self.get('/sensors/total?sensors=p0,p1,missing&step=3600')
+        self.assertEqual(body['values'], [13.5] * 4)
+        self.assertEqual(body['counts'], [2] * 4)
+        self.assertEqual(self.get('/sensors/total')[0], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app import routes
+from app import wire
+
+API_TOKEN = 'test_token'
+
+
+class TestApi(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        routes.replication_manager = None
+        self.app = create_app({'port': 5000, 'nodes_db': 3, 'API_TOKEN': API_TOKEN, 'data_dir': self.tmp.name})
+        self.client = self.app.test_client()
+        self.headers = {'Authorization': f'Bearer {API_TOKEN}'}
+
+    def tearDown(self):
+        routes.replication_manager.close()
+        routes.replication_manager = None
+        self.tmp.cleanup()
+
+    def test_ingest_batch_json(self):
+        batch = [{'sensor_id': 's1', 'timestamp': f'2025-07-05T18:00:0{i}', 'value': i} for i in range(5)]
+        response = self.client.post('/ingest/batch', json=batch, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['stored'], 5)
+        response = self.client.get('/measurement/s1:2025-07-05T18:00:03', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_out_of_range_timestamps_are_stored_undated(self):
+        for timestamp in ('1e30', '99999999999999999999999', -2 ** 70):
+            response = self.client.post('/ingest', json={'sensor_id': 'far', 'timestamp': timestamp, 'value': 1},
+                                        headers=self.headers)
+            self.assertEqual(response.status_code, 200, timestamp)
+            response = self.client.get(f'/measurement/far:{timestamp}', headers=self.headers)
+            self.assertEqual(response.get_json()['value'], 1)
+        self.assertEqual(self.client.get('/sensor/far/history?from=1e30', headers=self.headers).status_code, 400)
+
+    def test_ingest_batch_ndjson_with_alerts(self):
+        self.client.post('/set_threshold', json={'sensor_id': 's2', 'threshold': 10}, headers=self.headers)
+        lines = [json.dumps({'sensor_id': 's2', 'timestamp': f't{i}', 'value': v}) for i, v in enumerate([5, 15, 25])]
+        response = self.client.post('/ingest/batch', data='\n'.join(lines),
+                                    content_type='application/x-ndjson', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        routes.replication_manager.alert_manager.drain()
+        alerts = self.client.get('/alerts', headers=self.headers).get_json()['alerts']
+        self.assertEqual([a['value'] for a in alerts], [15.0, 25.0])
+
+    def test_alerts_filtered_and_paginated(self):
+        self.client.post('/set_threshold', json={'sensor_id': 'h1', 'threshold': 0}, headers=self.headers)
+        self.client.post('/set_threshold', json={'sensor_id': 'h2', 'threshold': 0}, headers=self.headers)
+        batch = [{'sensor_id': sensor_id, 'timestamp': 1751738400 + i, 'value': i + 1}
+                 for i in range(5) for sensor_id in ('h1', 'h2')]
+        self.client.post('/ingest/batch', json=batch, headers=self.headers)
+        routes.replication_manager.alert_manager.drain()
+
+        body = self.client.get('/alerts?sensor_id=h2&from=1751738401&to=1751738404',
+                               headers=self.headers).get_json()
+        self.assertEqual([a['value'] for a in body['alerts']], [2.0, 3.0, 4.0])
+
+        url = '/alerts?sensor_id=h1&limit=2'
+        body = self.client.get(url, headers=self.headers).get_json()
+        seen = [a['value'] for a in body['alerts']]
+        while body['next_cursor'] is not None:
+            body = self.client.get(f"{url}&since={body['next_cursor']}", headers=self.headers).get_json()
+            seen.extend(a['value'] for a in body['alerts'])
+        self.assertEqual(seen, [1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(self.client.get('/alerts?since=x', headers=self.headers).status_code, 400)
+
+    def test_rolling_detector_runs_off_the_write_path(self):
+        response = self.client.post('/set_detector', json={'sensor_id': 'z1', 'type': 'zscore',
+                                                           'params': {'window': 20, 'k': 4}}, headers=self.headers)
+        self.assertEqual(response.get_json()['detector'], {'type': 'zscore', 'window': 20, 'k': 4.0})
+        values = [10 + (i % 3) for i in range(40)] + [100] + [10 + (i % 3) for i in range(10)]
+        batch = [{'sensor_id': 'z1', 'timestamp': 1751738400 + i, 'value': v} for i, v in enumerate(values)]
+        self.client.post('/ingest/batch', json=batch, headers=self.headers)
+        routes.replication_manager.alert_manager.drain()
+        alerts = self.client.get('/alerts?sensor_id=z1', headers=self.headers).get_json()['alerts']
+        self.assertEqual([(a['detector'], a['ts']) for a in alerts], [('zscore', 1751738440)])
+        response = self.client.post('/set_detector', json={'sensor_id': 'z1', 'type': 'fourier'}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_sensor_aggregate(self):
+        batch = [{'sensor_id': 'a1', 'timestamp': 1751738400 + i * 30, 'value': i} for i in range(240)]
+        self.client.post('/ingest/batch', json=batch, headers=self.headers)
+        body = self.client.get('/sensor/a1/aggregate?bucket=1h&from=1751738400&to=1751745600',
+                               headers=self.headers).get_json()
+        self.assertEqual([(b['bucket'], b['count'], b['min'], b['max'], b['avg']) for b in body['aggregates']],
+                         [(1751738400, 120, 0, 119, 59.5), (1751742000, 120, 120, 239, 179.5)])
+        response = self.client.get('/sensor/a1/aggregate?bucket=5m', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_sensor_history_range_under_consistent_hashing(self):
+        self.client.post('/configure_replication', json={'strategy': 'consistent', 'replication_factor': 2},
+                         headers=self.headers)
+        batch = [{'sensor_id': 'm1', 'timestamp': 1751738400 + i, 'value': i} for i in range(10)]
+        batch.append({'sensor_id': 'm2', 'timestamp': 1751738401, 'value': 99})
+        self.client.post('/ingest/batch', json=batch, headers=self.headers)
+
+        response = self.client.get('/sensor/m1/history?from=1751738402&to=2025-07-05T18:00:08&limit=3',
+                                   headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['measurements'],
+                         {'m1:1751738402': 2, 'm1:1751738403': 3, 'm1:1751738404': 4})
+        response = self.client.get('/sensor/m1/history?from=yesterday', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_measurements_pagination_and_ndjson(self):
+        self.client.post('/configure_replication', json={'strategy': 'consistent', 'replication_factor': 2},
+                         headers=self.headers)
+        batch = [{'sensor_id': 'p', 'timestamp': 1751738400 + i, 'value': i} for i in range(25)]
+        self.client.post('/ingest/batch', json=batch, headers=self.headers)
+
+        keys, cursor = [], None
+        while True:
+            url = '/measurements?limit=10' + (f'&cursor={cursor}' if cursor else '')
+            page = self.client.get(url, headers=self.headers).get_json()
+            keys.extend(page['measurements'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(keys, sorted(f'p:{1751738400 + i}' for i in range(25)))
+
+        response = self.client.get('/sensor/p/history?format=ndjson&from=1751738420', headers=self.headers)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([line['value'] for line in lines], [20, 21, 22, 23, 24])
+
+        page = self.client.get('/sensor/p/history?limit=20', headers=self.headers).get_json()
+        rest = self.client.get(f"/sensor/p/history?limit=20&cursor={page['next_cursor']}",
+                               headers=self.headers).get_json()
+        self.assertEqual(len(page['measurements']) + len(rest['measurements']), 25)
+        self.assertIsNone(rest['next_cursor'])
+
+    def test_binary_ingest_and_bulk_read(self):
+        msgpack_headers = {**self.headers, 'Content-Type': wire.MSGPACK_MIMETYPE, 'Accept': wire.MSGPACK_MIMETYPE}
+        body = wire.packb({'sensor_id': 'b', 'timestamp': 1751738400, 'value': 1.5})
+        response = self.client.post('/ingest', data=body, headers=msgpack_headers)
+        self.assertEqual(response.mimetype, wire.MSGPACK_MIMETYPE)
+        self.assertEqual(wire.unpackb(response.data)['status'], 'success')
+
+        body = wire.packb([['b', 1751738401, 2.5], {'sensor_id': 'b', 'timestamp': 1751738402, 'value': 3}])
+        response = self.client.post('/ingest/batch', data=body, headers=msgpack_headers)
+        self.assertEqual(wire.unpackb(response.data)['stored'], 2)
+        # Una mappa con un array come chiave non è un corpo valido
+        response = self.client.post('/ingest', data=b'\x81\x91\x01\x01', headers=msgpack_headers)
+        self.assertEqual(response.status_code, 400)
+
+        body = wire.pack_records([('b', 1751738403 + i, i / 4) for i in range(3)])
+        response = self.client.post('/ingest/batch', data=body,
+                                    headers={**self.headers, 'Content-Type': wire.PACKED_MIMETYPE})
+        self.assertEqual(response.get_json()['stored'], 3)
+        response = self.client.post('/ingest/batch', data=body[:-1],
+                                    headers={**self.headers, 'Content-Type': wire.PACKED_MIMETYPE})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/measurement/b:1751738401', headers=msgpack_headers)
+        self.assertEqual(wire.unpackb(response.data)['value'], 2.5)
+
+        response = self.client.get('/measurements?limit=4', headers={**self.headers, 'Accept': wire.PACKED_MIMETYPE})
+        self.assertEqual(response.mimetype, wire.PACKED_MIMETYPE)
+        self.assertEqual(wire.unpack_records(response.data),
+                         [('b', 1751738400, 1.5), ('b', 1751738401, 2.5), ('b', 1751738402, 3.0), ('b', 1751738403, 0.0)])
+        rest = self.client.get(f"/measurements?cursor={response.headers['X-Next-Cursor']}",
+                               headers={**self.headers, 'Accept': wire.PACKED_MIMETYPE})
+        self.assertEqual(len(wire.unpack_records(rest.data)), 2)
+        self.assertNotIn('X-Next-Cursor', rest.headers)
+
+        # Le chiavi con timestamp ISO non sono rappresentabili nel formato a record fissi
+        self.client.post('/ingest', json={'sensor_id': 'b', 'timestamp': '2025-07-05T18:00:00', 'value': 1},
+                         headers=self.headers)
+        response = self.client.get('/measurements', headers={**self.headers, 'Accept': wire.PACKED_MIMETYPE})
+        self.assertEqual(response.status_code, 406)
+        response = self.client.get('/measurements', headers={**self.headers, 'Accept': wire.MSGPACK_MIMETYPE})
+        self.assertEqual(len(wire.unpackb(response.data)['measurements']), 7)
+
+    def test_metrics_endpoint(self):
+        self.client.post('/ingest', json={'sensor_id': 'm', 'timestamp': 1751738400, 'value': 1}, headers=self.headers)
+        self.client.post('/ingest/batch', data=wire.packb([['m', 1751738401, 2]]),
+                         headers={**self.headers, 'Content-Type': wire.MSGPACK_MIMETYPE})
+        self.client.get('/measurement/m:1751738400', headers=self.headers)
+        routes.replication_manager.fail_node(2)
+        # Una migrazione non parte con un nodo giù: il posizionamento resta quello attuale
+        response = self.client.post('/configure_replication', json={'strategy': 'consistent', 'replication_factor': 3},
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 409)
+        self.client.post('/ingest', json={'sensor_id': 'm', 'timestamp': 1751738402, 'value': 3}, headers=self.headers)
+
+        response = self.client.get('/metrics', headers=self.headers)
+        self.assertEqual(response.mimetype, 'text/plain')
+        text = response.get_data(as_text=True)
+        for line in ('energyguard_operation_seconds_count{operation="store"} 2',
+                     'energyguard_operation_seconds_count{operation="store_batch"} 1',
+                     'energyguard_operation_seconds_count{operation="retrieve"} 1',
+                     'energyguard_node_operation_seconds_count{operation="write",node="0"} 2',
+                     'energyguard_serialization_seconds_count{format="msgpack",direction="decode"} 1',
+                     'energyguard_node_up{node="2"} 0',
+                     'energyguard_cache_misses_total 1'):
+            self.assertIn(line, text)
+        self.assertIn('energyguard_ring_lookup_seconds_count', text)
+        self.assertIn('energyguard_hint_backlog{node="2"}', text)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_add_and_remove_node(self):
+        self.client.post('/configure_replication', json={'strategy': 'consistent', 'replication_factor': 2},
+                         headers=self.headers)
+        batch = [{'sensor_id': 'r', 'timestamp': 1751738400 + i, 'value': i} for i in range(50)]
+        self.client.post('/ingest/batch', json=batch, headers=self.headers)
+        routes.replication_manager._rebalance.wait()
+
+        response = self.client.post('/add_node', json={'weight': 2}, headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()['rebalance']['node_id'], 3)
+        routes.replication_manager._rebalance.wait()
+        status = self.client.get('/rebalance_status', headers=self.headers).get_json()['rebalance']
+        self.assertEqual(status['state'], 'done')
+        nodes = self.client.get('/nodes_status', headers=self.headers).get_json()['nodes']
+        self.assertEqual([node['node_id'] for node in nodes], [0, 1, 2, 3])
+
+        self.assertEqual(self.client.post('/remove_node/9', headers=self.headers).status_code, 409)
+        self.assertEqual(self.client.post('/configure_replication', json={'strategy': 'ring'},
+                                          headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.post('/add_node', json={'weight': 0}, headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.post('/remove_node/0', headers=self.headers).status_code, 202)
+        routes.replication_manager._rebalance.wait()
+        for i in range(50):
+            response = self.client.get(f'/measurement/r:{1751738400 + i}', headers=self.headers)
+            self.assertEqual(response.get_json()['value'], i)
+
+    def test_ingest_batch_rejects_incomplete_items(self):
+        response = self.client.post('/ingest/batch', json=[{'sensor_id': 's1'}], headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
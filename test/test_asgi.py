@@ -0,0 +1,77 @@
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import routes
+from app import wire
+
+API_TOKEN = 'test_token'
+HAS_ASGI = all(importlib.util.find_spec(name) for name in ('starlette', 'a2wsgi', 'httpx'))
+
+
+@unittest.skipUnless(HAS_ASGI, 'starlette, a2wsgi and httpx are required for the ASGI server')
+class TestAsgiApi(unittest.TestCase):
+
+    def setUp(self):
+        from starlette.testclient import TestClient
+        from app.asgi import create_asgi_app
+        self.tmp = tempfile.TemporaryDirectory()
+        routes.replication_manager = None
+        app = create_asgi_app({'port': 5000, 'nodes_db': 3, 'API_TOKEN': API_TOKEN, 'data_dir': self.tmp.name,
+                               'read_mode': 'parallel'})
+        self.client = TestClient(app)
+        self.client.__enter__()
+        self.headers = {'Authorization': f'Bearer {API_TOKEN}'}
+
+    def tearDown(self):
+        self.client.__exit__(None, None, None)
+        routes.replication_manager = None
+        self.tmp.cleanup()
+
+    def test_token_is_required_on_async_and_mounted_routes(self):
+        for method, path in (('post', '/ingest'), ('get', '/measurement/s:1'), ('get', '/nodes_status')):
+            response = getattr(self.client, method)(path, headers={'Authorization': 'Bearer wrong'})
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(response.json(), routes.UNAUTHORIZED)
+
+    def test_async_ingest_read_delete(self):
+        response = self.client.post('/ingest', json={'sensor_id': 's', 'timestamp': 1751738400, 'value': 4.5},
+                                    headers=self.headers)
+        self.assertEqual(response.json()['message'], 'Measurement s:1751738400 stored successfully')
+        self.assertEqual(self.client.get('/measurement/s:1751738400', headers=self.headers).json()['value'], 4.5)
+        self.assertEqual(self.client.post('/ingest', json={'sensor_id': 's'}, headers=self.headers).status_code, 400)
+
+        lines = '\n'.join(json.dumps({'sensor_id': 's', 'timestamp': 1751738401 + i, 'value': i}) for i in range(3))
+        response = self.client.post('/ingest/batch', content=lines,
+                                    headers={**self.headers, 'Content-Type': 'application/x-ndjson'})
+        self.assertEqual(response.json()['stored'], 3)
+        # Le route non riscritte sono servite dall'app Flask montata
+        history = self.client.get('/sensor/s/history', headers=self.headers).json()['measurements']
+        self.assertEqual(len(history), 4)
+
+        self.assertEqual(self.client.delete('/delete/s:1751738400', headers=self.headers).status_code, 200)
+        self.assertEqual(self.client.get('/measurement/s:1751738400', headers=self.headers).status_code, 404)
+        self.assertEqual(self.client.delete('/delete/s:1751738400', headers=self.headers).status_code, 404)
+
+    def test_async_routes_speak_msgpack(self):
+        headers = {**self.headers, 'Content-Type': wire.MSGPACK_MIMETYPE, 'Accept': wire.MSGPACK_MIMETYPE}
+        body = wire.packb({'sensor_id': 's', 'timestamp': 1751738400, 'value': 4.5})
+        self.assertEqual(wire.unpackb(self.client.post('/ingest', content=body, headers=headers).content)['status'],
+                         'success')
+        body = wire.pack_records([('s', 1751738401, 5.5)])
+        response = self.client.post('/ingest/batch', content=body,
+                                    headers={**headers, 'Content-Type': wire.PACKED_MIMETYPE})
+        self.assertEqual(wire.unpackb(response.content)['stored'], 1)
+        response = self.client.get('/measurement/s:1751738401', headers=headers)
+        self.assertEqual(response.headers['Content-Type'], wire.MSGPACK_MIMETYPE)
+        self.assertEqual(wire.unpackb(response.content)['value'], 5.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
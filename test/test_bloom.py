@@ -0,0 +1,77 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.bloom import BloomFilter
+from app.models import StorageNode
+from app.walstore import WalStorageNode
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_no_false_negatives_and_bounded_false_positives(self):
+        bloom = BloomFilter(10000, 0.01)
+        bloom.update(f'present:{i}' for i in range(10000))
+        self.assertTrue(all(f'present:{i}' in bloom for i in range(10000)))
+        false_positives = sum(f'absent:{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 250)
+
+
+class TestNodeBloomFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_negative_lookups_skip_sqlite(self):
+        node = StorageNode(0, 5000, data_dir=self.tmp.name)
+        node.write_many([(f's:{i}', i) for i in range(100)])
+        self.assertTrue(node.key_exists('s:5'))
+        misses = [node.key_exists(f'x:{i}') or node.read(f'x:{i}') for i in range(100)]
+        self.assertFalse(any(misses))
+        self.assertGreater(node.bloom_stats()['negatives'], 190)
+        node.close()
+
+    def test_filter_reloaded_on_restart_and_rebuilt_when_stale(self):
+        node = StorageNode(0, 5000, data_dir=self.tmp.name)
+        node.write('s:1', 1)
+        node.write('s:1', 2)  # una riscrittura conta due inserimenti nel filtro, una ricostruzione uno
+        node.close()
+
+        node = StorageNode(0, 5000, data_dir=self.tmp.name)
+        self.assertEqual(node.bloom.count, 2)
+        node.close()
+
+        # Una modifica fuori dal nodo cambia l'impronta della tabella: il filtro salvato non vale più
+        conn = sqlite3.connect(node.db_path)
+        with conn:
+            conn.execute(StorageNode.INSERT_SQL.format(table=node._partition(2)[0]), node._row('s:2', 3))
+        conn.close()
+        node = StorageNode(0, 5000, data_dir=self.tmp.name)
+        self.assertEqual(node.bloom.count, 2)
+        self.assertTrue(node.key_exists('s:2'))
+        node.close()
+
+    def test_recovery_rebuild_keeps_unflushed_wal_keys(self):
+        node = WalStorageNode(0, 5000, data_dir=self.tmp.name, flush_interval=0)
+        node.write_many([(f's:{i}', i) for i in range(10)])
+        node.flush()
+        node.write('s:new', 1)
+        node.delete('s:0')
+        node.fail()
+        node.recover([node], strategy='consistent')
+        self.assertTrue(node.key_exists('s:new'))
+        self.assertFalse(node.might_contain('s:0') and node.key_exists('s:0'))
+        self.assertEqual([node.read(f's:{i}') for i in range(1, 10)], list(range(1, 10)))
+        node.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.cache import MISSING, MeasurementCache, entry_size
+from app.models import MeasurementReplicationManager
+
+
+class TestMeasurementCache(unittest.TestCase):
+
+    def _fill(self, cache, key, value):
+        cache.fill(key, value, cache.reserve())
+
+    def test_lru_eviction_by_entries_and_bytes(self):
+        cache = MeasurementCache(max_entries=3)
+        for i in range(3):
+            self._fill(cache, f'k{i}', i)
+        cache.get('k0')
+        self._fill(cache, 'k3', 3)
+        self.assertIs(cache.get('k1'), MISSING)
+        self.assertEqual([cache.get(k) for k in ('k0', 'k2', 'k3')], [0, 2, 3])
+
+        cache = MeasurementCache(max_bytes=entry_size('k0', 1.5) * 2)
+        for i in range(5):
+            self._fill(cache, f'k{i}', 1.5)
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['evictions']), (2, 3))
+        self.assertLessEqual(stats['bytes'], cache.max_bytes)
+
+    def test_ttl_expiry(self):
+        cache = MeasurementCache(ttl=0.01)
+        self._fill(cache, 'k', 1)
+        self.assertEqual(cache.get('k'), 1)
+        time.sleep(0.02)
+        self.assertIs(cache.get('k'), MISSING)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_fill_after_invalidation_is_dropped(self):
+        cache = MeasurementCache()
+        token = cache.reserve()
+        cache.invalidate(['k'])  # scrittura concorrente alla lettura
+        cache.fill('k', 'old', token)
+        self.assertIs(cache.get('k'), MISSING)
+        token = cache.reserve()
+        cache.clear()
+        cache.fill('k', 'old', token)
+        self.assertIs(cache.get('k'), MISSING)
+
+
+class TestReadThroughCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = MeasurementReplicationManager(num_nodes=3, node_options={'data_dir': self.tmp.name},
+                                                     cache_options={'max_entries': 100}, rollup_interval=0)
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmp.cleanup()
+
+    def test_invalidated_by_store_delete_and_recovery(self):
+        self.manager.store_measurement('s:1', 1)
+        self.assertEqual(self.manager.retrieve_measurement('s:1')['value'], 1)
+        self.assertEqual(self.manager.retrieve_measurement('s:1'), {'value': 1, 'message': 'Retrieved from cache'})
+
+        self.manager.store_measurements([('s:1', 2)])
+        self.assertEqual(self.manager.retrieve_measurement('s:1')['value'], 2)
+        self.manager.delete_measurement('s:1')
+        self.assertIsNone(self.manager.retrieve_measurement('s:1')['value'])
+
+        self.manager.store_measurement('s:2', 5)
+        self.manager.retrieve_measurement('s:2')
+        self.manager.fail_node(0)
+        self.manager.recover_node(0)
+        self.assertEqual(self.manager.get_cache_stats()['entries'], 0)
+        stats = self.manager.get_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import asyncio
+import importlib.util
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from werkzeug.serving import make_server
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app import routes
+from app.client import AsyncEnergyGuardClient, EnergyGuardClient, EnergyGuardError
+
+API_TOKEN = 'test_token'
+
+
+class FlakyMiddleware:
+    """Answers 503 to the first ``failures`` requests, then forwards to the app.
+
+    The first ``lost`` requests are served but still answered with 503, as if the reply had been lost.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.failures = 0
+        self.lost = 0
+        self.requests = 0
+
+    def __call__(self, environ, start_response):
+        self.requests += 1
+        if self.lost:
+            self.lost -= 1
+            b''.join(self.app(environ, lambda *args: None))
+        elif not self.failures:
+            return self.app(environ, start_response)
+        else:
+            self.failures -= 1
+        start_response('503 Service Unavailable', [('Content-Type', 'application/json')])
+        return [b'{"message": "busy"}']
+
+
+class TestClient(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        routes.replication_manager = None
+        app = create_app({'port': 5000, 'nodes_db': 3, 'API_TOKEN': API_TOKEN, 'data_dir': self.tmp.name})
+        self.flaky = FlakyMiddleware(app)
+        self.server = make_server('127.0.0.1', 0, self.flaky, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        routes.replication_manager.close()
+        routes.replication_manager = None
+        self.tmp.cleanup()
+
+    def test_results_are_returned_in_every_wire_format(self):
+        for offset, wire_format in enumerate(('json', 'msgpack', 'packed')):
+            with EnergyGuardClient(self.base_url, API_TOKEN, wire_format, flush_interval=0) as client:
+                ts = 1751738400 + offset * 10
+                self.assertEqual(client.ingest('c', ts, 1.5)['status'], 'success')
+                self.assertEqual(client.ingest_batch([('c', ts + 1, 2), ('c', ts + 2, 3)])['stored'], 2)
+                self.assertEqual(client.get_measurement(f'c:{ts + 1}')['value'], 2)
+                self.assertIsNone(client.get_measurement('c:0'))
+                page = client.get_measurements(limit=2)
+                self.assertIsNotNone(page['next_cursor'])
+        with self.assertRaises(EnergyGuardError) as error:
+            EnergyGuardClient(self.base_url, 'wrong').get_nodes_status()
+        self.assertEqual(error.exception.status_code, 403)
+        self.assertFalse(EnergyGuardClient(self.base_url, 'wrong').check_initialization())
+
+    def test_batching_by_size_and_time(self):
+        client = EnergyGuardClient(self.base_url, API_TOKEN, 'msgpack', batch_size=10, flush_interval=0.2)
+        try:
+            for i in range(25):
+                client.add('b', 1751738400 + i, i)
+            self.assertEqual(client.stats['flushed'], 20)
+            deadline = time.monotonic() + 5
+            while client.stats['flushed'] < 25 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(client.stats['batches'], 3)
+            client.add('b', 1751738500, 1)
+        finally:
+            client.close()
+        self.assertEqual(client.stats['flushed'], 26)
+        self.assertEqual(routes.replication_manager.retrieve_measurement('b:1751738424')['value'], 24)
+
+    def test_retries_with_backoff(self):
+        client = EnergyGuardClient(self.base_url, API_TOKEN, retries=2, backoff=0.01)
+        self.flaky.failures = 2
+        self.assertEqual(client.ingest('r', 1751738400, 1)['status'], 'success')
+        self.assertEqual(client.stats['retries'], 2)
+        self.flaky.failures = 3
+        with self.assertRaises(EnergyGuardError) as error:
+            client.get_nodes_status()
+        self.assertEqual(error.exception.status_code, 503)
+        client.close()
+
+    def test_only_idempotent_requests_are_retried(self):
+        client = EnergyGuardClient(self.base_url, API_TOKEN, retries=2, backoff=0.01)
+        client.ingest('r', 1751738400, 1)
+        # La prima cancellazione va a buon fine ma la risposta si perde: il 404 del secondo tentativo è un successo
+        self.flaky.lost = 1
+        self.assertEqual(client.delete_measurement('r:1751738400')['status'], 'success')
+        with self.assertRaises(EnergyGuardError) as error:
+            client.delete_measurement('r:1751738400')
+        self.assertEqual(error.exception.status_code, 404)
+        # Un nodo aggiunto non viene aggiunto una seconda volta
+        self.flaky.lost = 1
+        with self.assertRaises(EnergyGuardError):
+            client.add_node()
+        self.assertEqual(len(routes.replication_manager.nodes), 4)
+        # Neppure una migrazione di strategia, che parte in background come l'aggiunta di un nodo
+        routes.replication_manager._rebalance.wait()
+        self.flaky.lost = 1
+        with self.assertRaises(EnergyGuardError):
+            client.set_replication_strategy('consistent', 2)
+        self.assertEqual(client.stats['retries'], 1)
+        self.assertEqual(routes.replication_manager._rebalance.wait()['state'], 'done')
+        client.close()
+
+    @unittest.skipUnless(importlib.util.find_spec('httpx'), 'httpx is required for the async client')
+    def test_async_client(self):
+        async def scenario():
+            async with AsyncEnergyGuardClient(self.base_url, API_TOKEN, 'packed', batch_size=50,
+                                              flush_interval=0.1, backoff=0.01) as client:
+                self.flaky.failures = 1
+                await asyncio.gather(*(client.ingest('a', 1751738400 + i, i) for i in range(10)))
+                for i in range(60):
+                    await client.add('a', 1751738500 + i, i)
+                self.assertEqual(client.stats['flushed'], 50)
+                await asyncio.sleep(0.3)
+                self.assertEqual(client.stats['flushed'], 60)
+                self.assertIsNone(await client.get_measurement('a:1'))
+                return (await client.get_measurements())['records']
+        records = asyncio.run(scenario())
+        self.assertEqual(len(records), 70)
+
+
+if __name__ == '__main__':
+    unittest.main()
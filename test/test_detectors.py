@@ -0,0 +1,63 @@
+import math
+import os
+import random
+import sys
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.detectors import create_detector, numpy
+
+DETECTORS = [
+    ('ewma', {'alpha': 0.2, 'k': 2.5}),
+    ('zscore', {'window': 20, 'k': 2.5}),
+    ('rate', {'max_rate': 3}),
+    ('minmax', {'window': 10, 'max_range': 9}),
+]
+
+
+class TestDetectors(unittest.TestCase):
+
+    def _stream(self):
+        rng = random.Random(7)
+        ts = 1751738400
+        for _ in range(25):
+            batch = []
+            for _ in range(rng.randint(1, 80)):
+                ts += rng.choice([1, 2, 5])
+                spike = 20 if rng.random() < 0.03 else 0
+                batch.append((ts if rng.random() > 0.1 else None, rng.gauss(10, 2) + spike))
+            yield batch
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_vectorized_evaluation_matches_incremental_updates(self):
+        for kind, params in DETECTORS:
+            incremental, vectorized = create_detector(kind, **params), create_detector(kind, **params)
+            expected, actual = [], []
+            for batch in self._stream():
+                expected.extend(incremental.update(ts, value) for ts, value in batch)
+                ts = numpy.array([math.nan if ts is None else ts for ts, _ in batch])
+                actual.extend(bool(flag) for flag in vectorized.evaluate(ts, numpy.array([v for _, v in batch])))
+            self.assertEqual(actual, expected, kind)
+            self.assertTrue(any(expected), kind)
+
+    def test_detectors_flag_spikes(self):
+        ewma = create_detector('ewma', alpha=0.1, k=3, warmup=5)
+        flags = [ewma.update(None, 10 + (i % 2)) for i in range(30)] + [ewma.update(None, 50)]
+        self.assertEqual(flags.index(True), 30)
+
+        rate = create_detector('rate', max_rate=2)
+        self.assertEqual([rate.update(ts, v) for ts, v in [(0, 10), (10, 20), (11, 30)]], [False, False, True])
+
+        minmax = create_detector('minmax', window=3, max_range=5)
+        flags = [minmax.update(None, v) for v in [1, 2, 9, 3, 4, 5]]
+        self.assertEqual(flags, [False, False, True, True, True, False])
+
+    def test_unknown_detector(self):
+        with self.assertRaises(ValueError):
+            create_detector('fourier')
+
+
+if __name__ == '__main__':
+    unittest.main()
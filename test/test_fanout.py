@@ -0,0 +1,87 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.fanout import ReplicaFanout, QuorumError
+
+
+class SlowNode:
+    def __init__(self, node_id, delay, value=None, fail=False):
+        self.node_id = node_id
+        self.delay = delay
+        self.value = value
+        self.fail = fail
+
+    def call(self):
+        time.sleep(self.delay)
+        if self.fail:
+            raise IOError(f'node {self.node_id} down')
+        return self.value
+
+
+class TestReplicaFanout(unittest.TestCase):
+
+    def setUp(self):
+        self.fanout = ReplicaFanout(max_workers=4, hedge_delay=0.01)
+
+    def tearDown(self):
+        self.fanout.close()
+
+    def test_write_returns_after_quorum(self):
+        nodes = [SlowNode(0, 0.0), SlowNode(1, 0.0), SlowNode(2, 0.5)]
+        start = time.perf_counter()
+        acks = self.fanout.write(nodes, lambda n: n.call(), quorum=2)
+        self.assertEqual(acks, 2)
+        self.assertLess(time.perf_counter() - start, 0.4)
+
+    def test_write_quorum_not_reached(self):
+        nodes = [SlowNode(0, 0.0), SlowNode(1, 0.0, fail=True)]
+        with self.assertRaises(QuorumError):
+            self.fanout.write(nodes, lambda n: n.call())
+
+    def test_parallel_read_skips_empty_replica(self):
+        nodes = [SlowNode(0, 0.0), SlowNode(1, 0.01, value='v')]
+        node, value = self.fanout.read(nodes, lambda n: n.call(), mode='parallel')
+        self.assertEqual((node.node_id, value), (1, 'v'))
+
+    def test_hedged_read_uses_backup_replica(self):
+        nodes = [SlowNode(0, 0.5, value='slow'), SlowNode(1, 0.0, value='fast')]
+        start = time.perf_counter()
+        node, value = self.fanout.read(nodes, lambda n: n.call(), mode='hedged')
+        self.assertEqual(value, 'fast')
+        self.assertLess(time.perf_counter() - start, 0.4)
+
+    def test_sequential_read_skips_failed_replica(self):
+        nodes = [SlowNode(0, 0.0, fail=True), SlowNode(1, 0.0), SlowNode(2, 0.0, 'value')]
+        for read in (self.fanout.read, lambda *args: asyncio.run(self.fanout.aread(*args))):
+            node, value = read(nodes, lambda n: n.call())
+            self.assertEqual((node.node_id, value), (2, 'value'))
+            self.assertEqual(read(nodes[:2], lambda n: n.call()), (None, None))
+            with self.assertRaises(QuorumError):
+                read(nodes[:1], lambda n: n.call())
+
+    def test_async_read_follows_the_read_mode(self):
+        nodes = [SlowNode(0, 0.3, 'slow'), SlowNode(1, 0.0, 'fast')]
+        self.assertEqual(asyncio.run(self.fanout.aread(nodes, lambda n: n.call()))[1], 'slow')
+        for mode in ('parallel', 'hedged'):
+            start = time.perf_counter()
+            node, value = asyncio.run(self.fanout.aread(nodes, lambda n: n.call(), mode=mode))
+            self.assertEqual((node.node_id, value), (1, 'fast'))
+            self.assertLess(time.perf_counter() - start, 0.25)
+        hedged = ReplicaFanout(max_workers=4, read_mode='hedged', hedge_delay=0.01)
+        self.addCleanup(hedged.close)
+        self.assertEqual(asyncio.run(hedged.aread(nodes, lambda n: n.call()))[1], 'fast')
+
+    def test_async_write(self):
+        nodes = [SlowNode(i, 0.0) for i in range(3)]
+        acks = asyncio.run(self.fanout.awrite(nodes, lambda n: n.call()))
+        self.assertEqual(acks, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
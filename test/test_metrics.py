@@ -0,0 +1,63 @@
+import logging
+import os
+import sys
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.logs import SampledLogger
+from app.metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_exposition(self):
+        registry = MetricsRegistry()
+        latency = registry.histogram('op_seconds', 'Operation latency', ('operation',), buckets=(0.001, 0.01))
+        for seconds in (0.0005, 0.002, 0.002, 5):
+            latency.observe(seconds, 'write')
+        lines = registry.render().splitlines()
+        self.assertEqual(lines[:2], ['# HELP op_seconds Operation latency', '# TYPE op_seconds histogram'])
+        self.assertIn('op_seconds_bucket{operation="write",le="0.001"} 1', lines)
+        self.assertIn('op_seconds_bucket{operation="write",le="0.01"} 3', lines)
+        self.assertIn('op_seconds_bucket{operation="write",le="+Inf"} 4', lines)
+        self.assertIn('op_seconds_count{operation="write"} 4', lines)
+        self.assertEqual(latency.snapshot('write')[0], [1, 2, 1])
+
+    def test_counters_and_collected_values(self):
+        registry = MetricsRegistry()
+        failures = registry.counter('failures_total', 'Failures', ('node',))
+        failures.inc(1, 0)
+        failures.inc(2, 0)
+        registry.collected('backlog', 'Backlog', 'gauge', lambda: {0: 3, 1: 0}, ('node',))
+        registry.collected('label', 'Escaping', 'gauge', lambda: {'a"b': 1}, ('name',))
+        text = registry.render()
+        self.assertIn('failures_total{node="0"} 3', text)
+        self.assertIn('# TYPE backlog gauge\nbacklog{node="0"} 3\nbacklog{node="1"} 0', text)
+        self.assertIn('label{name="a\\"b"} 1', text)
+        with self.assertRaises(ValueError):
+            registry.counter('failures_total', 'Again')
+
+    def test_disabled_registry_records_nothing(self):
+        registry = MetricsRegistry(enabled=False)
+        registry.histogram('op_seconds', 'Latency').observe(0.1)
+        registry.counter('failures_total', 'Failures').inc()
+        self.assertEqual(registry.render().strip(), '')
+
+    def test_sampled_logger(self):
+        logger = logging.getLogger('app.test_sampling')
+        logger.setLevel(logging.INFO)
+        with self.assertLogs(logger, logging.INFO) as captured:
+            sampled = SampledLogger(logger, every=10)
+            for i in range(25):
+                sampled.info('event %s', i)
+        self.assertEqual([record.getMessage() for record in captured.records],
+                         [f'event {i} (sampled 1/10)' for i in (0, 10, 20)])
+        logger.setLevel(logging.WARNING)
+        sampled.info('dropped')  # sotto il livello: non conta per il campionamento
+        self.assertEqual(next(sampled._calls), 25)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.energyguardring import EnergyGuardRing, range_filter
+from app.models import MeasurementReplicationManager, StorageNode
+
+KEYS = [f'sensor{i % 20}:{1751738400 + i}' for i in range(3000)]
+
+
+class TestOwnershipChanges(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.nodes = [StorageNode(i, 5000 + i, data_dir=self.tmp.name) for i in range(4)]
+
+    def tearDown(self):
+        for node in self.nodes:
+            node.close()
+        self.tmp.cleanup()
+
+    def test_changed_ranges_cover_exactly_the_moved_keys(self):
+        old = EnergyGuardRing(self.nodes[:3], replication_factor=2, vnodes=16)
+        new = EnergyGuardRing(self.nodes, replication_factor=2, vnodes=16)
+        changes = old.ownership_changes(new)
+        self.assertTrue(changes)
+        for change in changes:
+            self.assertIn(3, change['after'])
+            self.assertNotIn(3, change['before'])
+
+        def in_changes(key):
+            position = new._hash(key)
+            space = 2 ** new.hash_bits
+            return any((position - c['start']) % space < ((c['end'] - c['start']) % space or space) for c in changes)
+
+        for key in KEYS:
+            moved = {n.node_id for n in old.get_nodes_for_key(key)} != {n.node_id for n in new.get_nodes_for_key(key)}
+            self.assertEqual(moved, in_changes(key), key)
+        moved_keys = sum(in_changes(key) for key in KEYS) / len(KEYS)
+        self.assertAlmostEqual(new.range_share(changes), moved_keys, delta=0.1)
+        self.assertEqual(old.ownership_changes(old), [])
+
+    def test_range_filter_selects_the_keys_of_the_changed_ranges(self):
+        old = EnergyGuardRing(self.nodes, replication_factor=2, vnodes=16)
+        new = EnergyGuardRing(self.nodes[1:], replication_factor=2, vnodes=16)
+        changes = old.ownership_changes(new)
+        contains = range_filter([(c['start'], c['end']) for c in changes], new.hash_function)
+        for key in KEYS:
+            moved = {n.node_id for n in old.get_nodes_for_key(key)} != {n.node_id for n in new.get_nodes_for_key(key)}
+            self.assertEqual(contains(key), moved, key)
+        self.assertFalse(range_filter([])(KEYS[0]))
+
+
+class TestRebalance(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmp.cleanup()
+
+    def _manager(self, strategy='consistent'):
+        self.manager = MeasurementReplicationManager(
+            num_nodes=3, strategy=strategy, replication_factor=2, node_options={'data_dir': self.tmp.name},
+            ring_options={'vnodes': 16}, rollup_interval=0, alert_options={'async_detection': False},
+            rebalance_options={'batch_size': 200})
+        self.manager.store_measurements([(key, 1.0) for key in KEYS])
+        return self.manager
+
+    def assert_placement(self, expected):
+        manager = self.manager
+        for key, value in expected.items():
+            holders = {node.node_id for node in manager.nodes if node.key_exists(key)}
+            if value is None:
+                self.assertEqual(holders, set(), key)
+                continue
+            self.assertEqual(float(manager.retrieve_measurement(key)['value']), value)
+            if manager.strategy == 'consistent':
+                self.assertEqual(holders, {node.node_id for node in manager.hash_ring.get_nodes_for_key(key)}, key)
+            else:
+                self.assertEqual(holders, {node.node_id for node in manager.nodes}, key)
+
+    def test_add_node_moves_only_changed_ranges_while_writing(self):
+        manager = self._manager()
+        expected = dict.fromkeys(KEYS, 1.0)
+        done = threading.Event()
+
+        def writer():
+            rng = random.Random(0)
+            while not done.is_set():
+                key = rng.choice(KEYS)
+                if rng.random() < 0.1:
+                    manager.delete_measurement(key)
+                    expected[key] = None
+                else:
+                    value = rng.random()
+                    manager.store_measurement(key, value)
+                    expected[key] = value
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            status = manager.add_node(wait=True)
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual(status['state'], 'done')
+        self.assertEqual([node.node_id for node in manager.nodes], [0, 1, 2, 3])
+        # Solo le chiavi con repliche diverse viaggiano: circa rf / (n + 1) dello spazio
+        self.assertLess(status['moved_share'], 0.8)
+        self.assertLess(status['rows_copied'], len(KEYS))
+        self.assertGreater(status['rows_deleted'], 0)
+        self.assertEqual(status['progress'], 1.0)
+        self.assert_placement(expected)
+
+    def test_writes_proceed_while_a_page_is_copied(self):
+        manager = self._manager()
+        copying, resume = threading.Event(), threading.Event()
+        write_many = StorageNode.write_many
+
+        def slow_write_many(node, pairs):
+            # Solo la copia del ribilanciamento usa write_many durante il test
+            copying.set()
+            resume.wait(10)
+            return write_many(node, pairs)
+
+        StorageNode.write_many = slow_write_many
+        try:
+            manager.add_node()
+            self.assertTrue(copying.wait(10))
+            # La pagina in copia è più vecchia di queste scritture: verranno ricopiate prima del passaggio
+            writer = threading.Thread(target=lambda: [manager.store_measurement(key, 2.0) for key in KEYS[:300]])
+            writer.start()
+            writer.join(10)
+            self.assertFalse(writer.is_alive())
+        finally:
+            resume.set()
+            StorageNode.write_many = write_many
+        status = manager._rebalance.wait(30)
+        self.assertEqual(status['state'], 'done')
+        self.assertLess(status['rows_copied'], len(KEYS))
+        self.assert_placement({**dict.fromkeys(KEYS, 1.0), **dict.fromkeys(KEYS[:300], 2.0)})
+
+    def test_remove_node_hands_its_ranges_over(self):
+        manager = self._manager()
+        status = manager.remove_node(1, wait=True)
+        self.assertEqual(status['state'], 'done')
+        self.assertGreater(status['rows_copied'], 0)
+        self.assertIsNone(manager.get_node(1))
+        self.assert_placement(dict.fromkeys(KEYS, 1.0))
+
+        with self.assertRaises(ValueError):
+            manager.remove_node(1)
+        manager.fail_node(0)
+        with self.assertRaises(ValueError):
+            manager.add_node()
+
+    def test_full_replication_copies_everything_to_the_new_node(self):
+        manager = self._manager('full')
+        status = manager.add_node(wait=True)
+        self.assertEqual(status['rows_copied'], len(KEYS))
+        self.assertEqual(manager.remove_node(0, wait=True)['rows_copied'], 0)
+        self.assertEqual([node.node_id for node in manager.nodes], [1, 2, 3])
+        self.assert_placement(dict.fromkeys(KEYS, 1.0))
+
+    def test_strategy_migration_converges_placement(self):
+        manager = self._manager('full')
+        status = manager.set_replication_strategy('consistent', 2, wait=True)
+        self.assertEqual(status['operation'], 'strategy')
+        self.assertEqual(status['rows_copied'], 0)
+        self.assertEqual(status['rows_deleted'], len(KEYS))
+        self.assert_placement(dict.fromkeys(KEYS, 1.0))
+
+        status = manager.set_replication_strategy('consistent', 3, wait=True)
+        self.assertEqual(status['rows_copied'], len(KEYS))
+        self.assert_placement(dict.fromkeys(KEYS, 1.0))
+
+        manager.set_replication_strategy('consistent', 1, wait=True)
+        manager.set_replication_strategy('full', wait=True)
+        self.assertEqual(manager.strategy, 'full')
+        self.assertIsNone(manager.hash_ring)
+        self.assert_placement(dict.fromkeys(KEYS, 1.0))
+        with self.assertRaises(ValueError):
+            manager.set_replication_strategy('random')
+
+    def test_reads_use_both_placements_during_migration(self):
+        manager = self._manager()
+        manager.set_replication_strategy('consistent', 1, wait=True)
+        manager.rebalance_options = {'batch_size': 100, 'max_rows_per_second': 2000}
+        manager.set_replication_strategy('full')
+        job = manager._rebalance
+        while job.state == 'wiping' or (job.state == 'copying' and not job.rows_copied):
+            time.sleep(0.001)
+        self.assertEqual(job.state, 'copying')
+        missing = [key for key in KEYS if manager.retrieve_measurement(key)['value'] is None]
+        self.assertEqual(missing, [])
+        job.stop()
+        self.assertEqual(manager.strategy, 'consistent')
+
+    def test_stopped_rebalance_keeps_the_old_placement(self):
+        manager = self._manager()
+        manager.rebalance_options = {'batch_size': 100, 'max_rows_per_second': 500}
+        manager.add_node()
+        manager._rebalance.stop()
+        self.assertEqual(manager.rebalance_status()['state'], 'aborted')
+        self.assertEqual([node.node_id for node in manager.nodes], [0, 1, 2])
+        self.assert_placement(dict.fromkeys(KEYS, 1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
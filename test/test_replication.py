@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models import MeasurementReplicationManager
+
+
+class TestHintedHandoff(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = self._manager()
+
+    def _manager(self):
+        return MeasurementReplicationManager(num_nodes=4, strategy='consistent', replication_factor=2,
+                                             node_options={'data_dir': self.tmp.name},
+                                             ring_options={'vnodes': 16})
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmp.cleanup()
+
+    def test_writes_for_dead_replica_are_handed_off_and_replayed(self):
+        self.manager.fail_node(1)
+        keys = [f'sensor{i % 5}:{1751738400 + i}' for i in range(200)]
+        self.manager.store_measurements([(key, 1.0) for key in keys[:100]])
+        for key in keys[100:]:
+            self.manager.store_measurement(key, 2.0)
+
+        owned = [key for key in keys if self.manager.nodes[1] in self.manager.hash_ring.get_nodes_for_key(key)]
+        self.assertTrue(owned)
+        self.assertEqual(self.manager.hint_backlog(), {1: len(owned)})
+        for key in owned:
+            self.assertIsNotNone(self.manager.retrieve_measurement(key)['value'])
+
+        # I suggerimenti sono su disco: sopravvivono al riavvio del manager
+        self.manager.close()
+        self.manager = self._manager()
+        self.manager.nodes[1].fail()
+        self.manager.delete_measurement(owned[0])
+        self.assertEqual(self.manager.hint_backlog(), {1: len(owned) + 1})
+
+        report = self.manager.recover_node(1)
+        self.assertEqual(report['hints_replayed'], len(owned) + 1)
+        self.assertEqual(self.manager.hint_backlog(), {})
+        node1 = self.manager.nodes[1]
+        self.assertFalse(node1.key_exists(owned[0]))
+        for key in owned[1:]:
+            self.assertTrue(node1.key_exists(key))
+        # Le copie custodite dai nodi non responsabili sono state rimosse
+        for key in keys:
+            holders = [n.node_id for n in self.manager.nodes if n.key_exists(key)]
+            expected = [n.node_id for n in self.manager.hash_ring.get_nodes_for_key(key)]
+            if key != owned[0]:
+                self.assertEqual(sorted(holders), sorted(expected))
+
+
+class TestProcessNodes(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = MeasurementReplicationManager(num_nodes=3, port=6200, strategy='consistent',
+                                                     replication_factor=2,
+                                                     node_options={'data_dir': self.tmp.name},
+                                                     node_mode='process')
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmp.cleanup()
+
+    def test_nodes_served_by_separate_processes(self):
+        self.assertTrue(all(process.is_alive() for process in self.manager._node_processes))
+        keys = [f'sensor1:{1751738400 + i}' for i in range(50)]
+        self.manager.store_measurements([(key, i) for i, key in enumerate(keys)])
+        self.assertEqual(self.manager.retrieve_measurement(keys[3])['value'], 3)
+        self.assertEqual([row[1] for row in self.manager.get_sensor_history('sensor1', limit=5)], keys[:5])
+
+        self.manager.fail_node(0)
+        self.manager.store_measurement('sensor2:1751738400', 7.5)
+        self.manager.recover_node(0)
+        self.assertEqual(self.manager.hint_backlog(), {})
+        for node in self.manager.hash_ring.get_nodes_for_key('sensor2:1751738400'):
+            self.assertEqual(node.read('sensor2:1751738400'), 7.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models import MeasurementReplicationManager
+
+DAY = 86400
+BASE = 1751673600  # inizio di un giorno UTC
+
+
+class TestRetention(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = MeasurementReplicationManager(num_nodes=3, node_options={'data_dir': self.tmp.name},
+                                                     rollup_interval=0, cache_options={},
+                                                     retention_seconds=2 * DAY, retention_interval=0)
+        self.manager.store_measurements([(f's1:{BASE + day * DAY + i * 3600}', i) for day in range(4)
+                                         for i in range(24)])
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmp.cleanup()
+
+    def test_drops_expired_days_on_every_node(self):
+        self.assertEqual(self.manager.retrieve_measurement(f's1:{BASE}')['value'], 0)
+        self.manager.rollups.compact()
+        # Alla fine del quarto giorno restano solo le ultime due partizioni intere
+        report = self.manager.enforce_retention(now=BASE + 4 * DAY)
+        self.assertEqual((report['partitions'], report['rows']), (6, 6 * 24))
+        self.assertIsNone(self.manager.retrieve_measurement(f's1:{BASE}')['value'])
+        self.assertEqual(len(self.manager.get_sensor_history('s1')), 48)
+        for node in self.manager.nodes:
+            self.assertEqual([stats['start'] for stats in node.partition_stats()], [BASE + 2 * DAY, BASE + 3 * DAY])
+        # I rollup sopravvivono ai dati grezzi
+        self.assertEqual(len(self.manager.aggregate_sensor_history('s1', '1d')), 4)
+        self.assertEqual(self.manager.metrics.get('energyguard_retention_dropped_partitions_total').value(0), 2)
+
+    def test_recovering_node_drops_partitions_expired_while_down(self):
+        node = self.manager.nodes[1]
+        self.manager.fail_node(1)
+        self.manager.enforce_retention(now=BASE + 3 * DAY)
+        self.assertEqual(len(node.partition_stats()), 4)
+        # Il nodo elimina le sue prima della sincronizzazione, che non trova così differenze da copiare;
+        # la soglia al recupero resta l'inizio del secondo giorno
+        self.manager.retention_seconds = time.time() - (BASE + DAY)
+        report = self.manager.recover_node(1)
+        self.assertEqual(report['rows_transferred'], 0)
+        self.assertEqual(sorted(node.get_all_keys()), sorted(self.manager.nodes[0].get_all_keys()))
+
+
+if __name__ == '__main__':
+    unittest.main()
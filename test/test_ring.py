@@ -0,0 +1,63 @@
+import os
+import sys
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.energyguardring import EnergyGuardRing
+
+
+class FakeNode:
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+
+class TestEnergyGuardRing(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = [FakeNode(i) for i in range(4)]
+        self.keys = [f'sensor{i % 20}:{i}' for i in range(5000)]
+
+    def test_single_vnode_keeps_original_placement(self):
+        ring = EnergyGuardRing(self.nodes, replication_factor=2)
+        # Percorso dell'anello come nella versione senza tabella precalcolata
+        for key in self.keys[:200]:
+            idx = ring._segment(key)
+            expected = []
+            while len(expected) < 2:
+                node = ring.ring[ring.sorted_hashes[idx % len(ring.sorted_hashes)]]
+                if node not in expected:
+                    expected.append(node)
+                idx += 1
+            self.assertEqual(list(ring.get_responsible_nodes(key)), expected)
+
+    def test_vnodes_reduce_skew(self):
+        single = EnergyGuardRing(self.nodes, replication_factor=2).distribution_report(self.keys)
+        virtual = EnergyGuardRing(self.nodes, replication_factor=2, vnodes=128,
+                                  hash_function='crc32').distribution_report(self.keys)
+        self.assertLess(virtual['skew'], single['skew'])
+        self.assertLess(virtual['sample_skew'], 1.2)
+
+    def test_weights_and_preference_list(self):
+        ring = EnergyGuardRing(self.nodes, replication_factor=2, vnodes=64, weights={0: 3})
+        shares = ring.distribution_report()['nodes']
+        self.assertGreater(shares[0]['primary_share'], shares[1]['primary_share'] * 2)
+        preference = ring.get_preference_list('sensor1:1')
+        self.assertEqual(sorted(n.node_id for n in preference), [0, 1, 2, 3])
+        self.assertEqual(tuple(ring.get_responsible_nodes('sensor1:1')), preference[:2])
+
+    def test_remove_node_rebuilds_table(self):
+        ring = EnergyGuardRing(self.nodes, replication_factor=3, vnodes=16)
+        ring.remove_storage_node(self.nodes[1])
+        for key in self.keys[:100]:
+            self.assertNotIn(self.nodes[1], ring.get_responsible_nodes(key))
+            self.assertEqual(len(ring.get_responsible_nodes(key)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models import MeasurementReplicationManager, StorageNode
+from app.segments import BLOCK_SIZE, Segment, numpy, write_segment
+
+DAY = 86400
+BASE = 1751673600  # inizio di un giorno UTC
+
+
+@unittest.skipIf(numpy is None, 'numpy non installato')
+class TestSegmentFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'test.seg')
+        rng = numpy.random.default_rng(0)
+        count = 3 * BLOCK_SIZE + 17
+        self.ts = numpy.sort(BASE + numpy.arange(count) * 10 + rng.integers(-2, 3, count))
+        self.series = {
+            'meter': (self.ts, numpy.round(230 + numpy.cumsum(rng.normal(0, 0.5, count)), 2)),
+            'counter': (self.ts[:100], numpy.arange(100) * 3.0),
+            'edge': (self.ts[:3], numpy.array([-0.5, numpy.inf, 1e300])),
+            'single': (self.ts[:1], numpy.array([7.25])),
+        }
+        self.size = write_segment(self.path, self.series)
+        self.segment = Segment(self.path)
+
+    def tearDown(self):
+        self.segment.close()
+        self.tmp.cleanup()
+
+    def test_round_trip_is_exact(self):
+        for sensor_id, (ts, values) in self.series.items():
+            decoded_ts, decoded_values = self.segment.arrays(sensor_id)
+            numpy.testing.assert_array_equal(decoded_ts, ts)
+            numpy.testing.assert_array_equal(decoded_values, values)
+        self.assertEqual(self.segment.rows, sum(len(ts) for ts, _ in self.series.values()))
+        self.assertEqual(self.segment.nbytes, self.size)
+        # Timestamp regolari e valori vicini occupano pochi byte per campione
+        self.assertLess(self.size / self.segment.rows, 10)
+
+    def test_range_and_point_reads(self):
+        start, end = int(self.ts[BLOCK_SIZE - 5]), int(self.ts[2 * BLOCK_SIZE + 5])
+        ts, values = self.segment.arrays('meter', start, end)
+        numpy.testing.assert_array_equal(ts, self.ts[BLOCK_SIZE - 5:2 * BLOCK_SIZE + 5])
+        self.assertEqual(self.segment.lookup('counter', int(self.ts[4])), 12)
+        self.assertIsNone(self.segment.lookup('counter', int(self.ts[4]) + 1))
+        self.assertIsNone(self.segment.lookup('missing', BASE))
+
+    def test_rows_page_follows_key_order(self):
+        rows = self.segment.rows_page(None, 10 ** 6)
+        keys = [key for key, _ in rows]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(rows), self.segment.rows)
+        self.assertEqual(self.segment.rows_page(keys[2000], 3), rows[2001:2004])
+        self.assertEqual(self.segment.rows_page('edge', 2), rows[keys.index(f'edge:{self.ts[0]}'):][:2])
+
+
+@unittest.skipIf(numpy is None, 'numpy non installato')
+class TestColdPartitions(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.node = StorageNode(0, 5000, data_dir=self.tmp.name)
+        self.rows = [(f's{j}:{BASE + i * 80 + j}', round(i * 0.37, 2) if i % 5 else i)
+                     for j in range(3) for i in range(3000)]
+        # Chiavi non canoniche e valori non numerici restano righe SQLite
+        self.rows += [('s1:2025-07-05T10:00:00', 3.5), (f's2:{BASE + 7}', 'text'), (f's0:{BASE + 8}', None)]
+        self.node.write_many(self.rows)
+
+    def tearDown(self):
+        self.node.close()
+        self.tmp.cleanup()
+
+    def snapshot(self):
+        return {
+            'keys': sorted(self.node.get_all_keys(), key=str),
+            'digests': self.node.bucket_digests(),
+            'pages': list(self.node.iter_rows(batch_size=500)),
+            'history': [list(self.node.iter_sensor(f's{j}', batch_size=700)) for j in range(3)],
+            'range': self.node.scan_sensor('s1', BASE + DAY // 2, BASE + 2 * DAY, limit=300),
+            'buckets': sorted(self.node.rows_in_buckets(list(range(0, 1024, 5))), key=str),
+            'hashes': self.node.row_hashes_in_buckets(list(range(1, 1024, 5))),
+            'rows': sorted(self.node.rows_for_keys([key for key, _ in self.rows[::11]]), key=str),
+            'reads': [(self.node.read(key), self.node.key_exists(key)) for key, _ in self.rows[::7]],
+        }
+
+    def test_compaction_keeps_every_read_identical(self):
+        before = self.snapshot()
+        report = self.node.compact_partitions(BASE + 3 * DAY)
+        self.assertEqual(report['partitions'], 3)
+        self.assertEqual(report['rows'], 9000)
+        self.assertEqual([stats['cold'] for stats in self.node.partition_stats()], [True, True, True])
+        self.assertEqual(self.snapshot(), before)
+        # Compattare di nuovo non cambia nulla
+        self.assertEqual(self.node.compact_partitions(BASE + 3 * DAY)['partitions'], 0)
+
+    def test_write_thaws_the_partition(self):
+        self.node.compact_partitions(BASE + 3 * DAY)
+        segments = self.node._segments
+        key = self.rows[0][0]
+        self.node.write(key, 99)
+        self.node.delete(self.rows[1][0])
+        self.assertEqual(self.node.read(key), 99)
+        self.assertIsNone(self.node.read(self.rows[1][0]))
+        self.assertEqual([stats['cold'] for stats in self.node.partition_stats()], [False, True, True])
+        self.assertEqual(len(os.listdir(self.node.segment_dir)), 2)
+        # Il segmento ritirato è chiuso prima di cancellarne il file
+        self.assertEqual([segment._mmap.closed for segment in segments.values()], [True, False, False])
+        self.assertEqual(len(self.node.get_all_keys()), len(self.rows) - 1)
+
+    def test_segments_survive_restart_and_retention(self):
+        self.node.compact_partitions(BASE + 3 * DAY)
+        before = self.snapshot()
+        self.node.close()
+        # Un segmento rimasto da una compattazione interrotta viene scartato
+        with open(os.path.join(self.node.segment_dir, 'measurements_0.seg'), 'wb') as f:
+            f.write(b'partial')
+        self.node = StorageNode(0, 5000, data_dir=self.tmp.name)
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(len(os.listdir(self.node.segment_dir)), 3)
+        segments = self.node._segments
+        self.assertEqual(self.node.drop_partitions(BASE + DAY)['partitions'], 1)
+        self.assertEqual(len(os.listdir(self.node.segment_dir)), 2)
+        self.assertEqual([segment._mmap.closed for segment in segments.values()], [True, False, False])
+        self.assertIsNone(self.node.read(self.rows[0][0]))
+
+    def test_manager_compacts_cold_partitions(self):
+        manager = MeasurementReplicationManager(num_nodes=2, node_options={'data_dir': self.tmp.name + '/cluster'},
+                                                rollup_interval=0, cold_after=DAY, retention_interval=0)
+        manager.store_measurements(self.rows)
+        report = manager.compact_cold_partitions(now=BASE + 3 * DAY)
+        self.assertEqual((report['partitions'], report['rows']), (4, 2 * 3 * 2160))
+        self.assertEqual(len(manager.get_sensor_history('s0')), 3001)
+        self.assertEqual(manager.retrieve_measurement(self.rows[5][0])['value'], self.rows[5][1])
+        manager.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
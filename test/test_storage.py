@@ -0,0 +1,255 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.merkle import key_bucket, row_hash
+from app.models import StorageNode
+from app.walstore import WalStorageNode
+
+
+class TestStorageNode(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.node = StorageNode(0, 5000, data_dir=self.tmp.name)
+
+    def tearDown(self):
+        self.node.close()
+        self.tmp.cleanup()
+
+    def test_pool_uses_wal_and_reuses_connections(self):
+        with self.node._connection() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            first = conn
+        with self.node._connection() as conn:
+            self.assertIs(conn, first)
+
+    def test_concurrent_writes_from_threads(self):
+        def writer(offset):
+            for i in range(50):
+                self.node.write(f'sensor{offset}:{i}', str(i))
+
+        threads = [threading.Thread(target=writer, args=(t,)) for t in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.node.get_all_keys()), 400)
+        self.assertLessEqual(self.node._opened, self.node.pool_size)
+
+    def test_scan_sensor_range(self):
+        self.node.write_many([(f'meter:2025-07-05T18:00:0{i}', str(i * 1.5)) for i in range(6)])
+        self.node.write('other:2025-07-05T18:00:02', '9')
+        rows = self.node.scan_sensor('meter', start=1751738402, end=1751738405, limit=2)
+        self.assertEqual([(ts, value) for ts, _, value in rows], [(1751738402, 3.0), (1751738403, 4.5)])
+
+    def test_migrates_legacy_schema(self):
+        path = os.path.join(self.tmp.name, 'storage_7.db')
+        conn = sqlite3.connect(path)
+        conn.execute('''CREATE TABLE measurements (key TEXT PRIMARY KEY, value TEXT)''')
+        conn.executemany('''INSERT INTO measurements VALUES (?, ?)''',
+                         [('s1:2025-07-05T18:00:00', '75.5'), ('key_1', 'value_1')])
+        conn.commit()
+        conn.close()
+
+        node = StorageNode(7, 5007, data_dir=self.tmp.name)
+        self.assertEqual(node.read('s1:2025-07-05T18:00:00'), 75.5)
+        self.assertEqual(node.read('key_1'), 'value_1')
+        self.assertEqual(len(node.scan_sensor('s1')), 1)
+        node.close()
+
+    def test_digests_follow_writes_and_deletes(self):
+        self.node.write_many([(f's:{i}', i) for i in range(100)])
+        self.node.write('s:5', 500)
+        self.node.delete('s:7')
+        expected = {}
+        for key, value in self.node.get_all_keys():
+            digest, count = expected.get(key_bucket(key), (0, 0))
+            expected[key_bucket(key)] = (digest ^ row_hash(key, value), count + 1)
+        self.assertEqual(self.node.bucket_digests(), expected)
+
+    def test_merkle_sync_transfers_only_differences(self):
+        peer = StorageNode(1, 5001, data_dir=self.tmp.name)
+        rows = [(f's:{i}', i) for i in range(500)]
+        self.node.write_many(rows)
+        peer.write_many(rows)
+        peer.write('s:1', 'changed')
+        peer.write('s:new', 42)
+        self.node.write('s:stale', 1)
+
+        self.node.fail()
+        report = self.node.recover([self.node, peer])
+        self.assertEqual(report['rows_transferred'], 2)
+        self.assertEqual(report['rows_deleted'], 1)
+        self.assertLessEqual(report['buckets_differing'], 3)
+        self.assertEqual(sorted(self.node.get_all_keys()), sorted(peer.get_all_keys()))
+        self.assertEqual(self.node.merkle_tree()[-1], peer.merkle_tree()[-1])
+        peer.close()
+
+    def test_invalid_synchronous_level(self):
+        with self.assertRaises(ValueError):
+            StorageNode(1, 5001, data_dir=self.tmp.name, synchronous='SOMETIMES')
+
+
+class TestPartitions(unittest.TestCase):
+
+    DAY = 86400
+    BASE = 1751673600  # inizio di un giorno UTC
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.node = StorageNode(0, 5000, data_dir=self.tmp.name)
+        # Tre giorni di un sensore, dieci misurazioni al giorno, più una chiave senza timestamp
+        self.node.write_many([(f'm:{self.BASE + day * self.DAY + i * 600}', day * 10 + i)
+                              for day in range(3) for i in range(10)])
+        self.node.write('m:latest', 1)
+
+    def tearDown(self):
+        self.node.close()
+        self.tmp.cleanup()
+
+    def test_one_partition_per_day(self):
+        partitions = self.node.partitions()
+        self.assertEqual([start for _, start, _ in partitions],
+                         [None, self.BASE, self.BASE + self.DAY, self.BASE + 2 * self.DAY])
+        self.assertEqual([stats['rows'] for stats in self.node.partition_stats()], [1, 10, 10, 10])
+        self.assertEqual(self.node.read(f'm:{self.BASE + self.DAY}'), 10)
+        self.assertEqual(len(self.node.get_all_keys()), 31)
+
+    def test_scans_prune_partitions_outside_the_interval(self):
+        start, end = self.BASE + self.DAY + 1200, self.BASE + 2 * self.DAY
+        self.assertEqual(self.node._scan_partitions(start, end, None), [f'measurements_{self.BASE + self.DAY}'])
+        rows = self.node.scan_sensor('m', start, end)
+        self.assertEqual([value for _, _, value in rows], list(range(12, 20)))
+
+        # La paginazione attraversa i confini delle partizioni senza perdere né duplicare righe
+        rows = list(self.node.iter_sensor('m', batch_size=7))
+        self.assertEqual([value for _, _, value in rows], [1] + list(range(30)))
+        keys = [key for key, _ in self.node.iter_rows(batch_size=4)]
+        self.assertEqual(keys, sorted(key for key, _ in self.node.get_all_keys()))
+
+    def test_drop_expired_partitions(self):
+        digests = self.node.bucket_digests()
+        report = self.node.drop_partitions(self.BASE + 2 * self.DAY + 1)
+        self.assertEqual(report, {'partitions': 2, 'rows': 20})
+        self.assertIsNone(self.node.read(f'm:{self.BASE}'))
+        self.assertEqual(len(self.node.scan_sensor('m', start=self.BASE)), 10)
+        # I digest restano coerenti con le righe rimaste
+        expected = {}
+        for key, value in self.node.get_all_keys():
+            digest, count = expected.get(key_bucket(key), (0, 0))
+            expected[key_bucket(key)] = (digest ^ row_hash(key, value), count + 1)
+        self.assertEqual(self.node.bucket_digests(), expected)
+        self.assertNotEqual(self.node.bucket_digests(), digests)
+        # Una scrittura in una finestra eliminata ricrea la partizione
+        self.node.write(f'm:{self.BASE + 5}', 7)
+        self.assertEqual(self.node.read(f'm:{self.BASE + 5}'), 7)
+        self.assertEqual(self.node.drop_partitions(self.BASE), {'partitions': 0, 'rows': 0})
+
+    def test_migrates_unpartitioned_schema(self):
+        path = os.path.join(self.tmp.name, 'storage_8.db')
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute('''CREATE TABLE measurements (key TEXT PRIMARY KEY, sensor_id TEXT, ts INTEGER,
+                            value NUMERIC, bucket INTEGER, h INTEGER)''')
+            conn.execute('''CREATE TABLE digests (bucket INTEGER PRIMARY KEY, digest INTEGER NOT NULL,
+                            count INTEGER NOT NULL)''')
+            conn.executemany('''INSERT INTO measurements VALUES (?, ?, ?, ?, ?, ?)''',
+                             [StorageNode._row(key, value) for key, value in self.node.get_all_keys()])
+            conn.execute('''PRAGMA user_version=2''')
+        conn.close()
+
+        node = StorageNode(8, 5008, data_dir=self.tmp.name)
+        self.assertEqual(node.partitions(), self.node.partitions())
+        self.assertEqual(node.bucket_digests(), self.node.bucket_digests())
+        self.assertEqual(node.read('m:latest'), 1)
+        node.close()
+
+    def test_millisecond_epochs_share_the_partition_of_their_day(self):
+        samples = [(f'ms:{(self.BASE + i * 60) * 1000 + i}', i) for i in range(1440)]
+        self.node.write_many(samples)
+        self.assertEqual(len(self.node.partitions()), 4)
+        self.assertEqual(self.node.read(samples[5][0]), 5)
+        history = self.node.scan_sensor('ms', self.BASE + 60, self.BASE + 180)
+        self.assertEqual([(ts, value) for ts, _, value in history], [(self.BASE + 60, 1), (self.BASE + 120, 2)])
+        # Ogni bucket ha la riga dei digest solo se contiene chiavi
+        with self.node._connection() as conn:
+            digests = conn.execute('''SELECT COUNT(*) FROM partition_digests WHERE partition=?''',
+                                   (f'measurements_{self.BASE + 2 * self.DAY}',)).fetchone()[0]
+        self.assertLessEqual(digests, 10)
+
+    def test_migrates_millisecond_partitions(self):
+        samples = [(f'ms:{(self.BASE + i * 3600) * 1000}', i) for i in range(30)]
+        with self.node._connection() as conn:
+            with conn:
+                # Righe scritte quando i millisecondi erano presi per secondi
+                for key, value in samples:
+                    row = (key, 'ms', int(key[3:]), *StorageNode._row(key, value)[3:])
+                    start = row[2] - row[2] % self.DAY
+                    self.node._create_partition(conn, (f'measurements_{start}', start, start + self.DAY))
+                    conn.execute(StorageNode.INSERT_SQL.format(table=f'measurements_{start}'), row)
+                conn.execute('''PRAGMA user_version=4''')
+        self.node.close()
+        self.node = StorageNode(0, 5000, data_dir=self.tmp.name, bloom_capacity=0)
+        self.assertEqual([start for _, start, _ in self.node.partitions()],
+                         [None, self.BASE, self.BASE + self.DAY, self.BASE + 2 * self.DAY])
+        self.assertEqual(self.node.read(samples[29][0]), 29)
+        self.assertEqual(len(self.node.scan_sensor('ms', self.BASE, self.BASE + self.DAY)), 24)
+        expected = {}
+        for key, value in self.node.get_all_keys():
+            digest, count = expected.get(key_bucket(key), (0, 0))
+            expected[key_bucket(key)] = (digest ^ row_hash(key, value), count + 1)
+        self.assertEqual(self.node.bucket_digests(), expected)
+
+    def test_keeps_partition_width_of_existing_data(self):
+        self.node.close()
+        node = StorageNode(0, 5000, data_dir=self.tmp.name, partition_seconds=3600)
+        self.assertEqual(node.partition_seconds, self.DAY)
+        self.assertEqual(len(node.scan_sensor('m', start=self.BASE, end=self.BASE + self.DAY)), 10)
+        node.close()
+
+
+class TestWalStorageNode(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_memtable_reads_and_flush(self):
+        node = WalStorageNode(0, 5000, data_dir=self.tmp.name, memtable_limit=50, flush_interval=0)
+        node.write_many([(f'w:{1751738400 + i}', str(i)) for i in range(30)])
+        node.delete('w:1751738401')
+        self.assertEqual(node.read('w:1751738402'), 2)
+        self.assertIsNone(node.read('w:1751738401'))
+        self.assertFalse(node.key_exists('w:1751738401'))
+        self.assertEqual(len(node.scan_sensor('w')), 29)
+        self.assertEqual(node._memtable, {})
+        node.write_many([(f'x:{i}', i) for i in range(60)])  # supera memtable_limit
+        self.assertEqual(node._memtable, {})
+        node.close()
+
+    def test_crash_replay(self):
+        node = WalStorageNode(1, 5001, data_dir=self.tmp.name, flush_interval=0)
+        node.write('c:1', 10)
+        node.write('c:2', 20)
+        node.delete('c:1')
+        # Nessun flush: un nuovo nodo sulla stessa directory riapplica il WAL
+        recovered = WalStorageNode(1, 5001, data_dir=self.tmp.name, flush_interval=0)
+        self.assertEqual(recovered._memtable, {})
+        self.assertEqual(StorageNode.read(recovered, 'c:2'), 20)
+        self.assertIsNone(StorageNode.read(recovered, 'c:1'))
+        recovered.close()
+        node._segment.close()
+        StorageNode.close(node)
+
+
+if __name__ == '__main__':
+    unittest.main()
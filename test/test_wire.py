@@ -0,0 +1,44 @@
+import os
+import sys
+import unittest
+
+# Aggiungi il percorso del progetto alla variabile sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import wire
+
+
+class TestWire(unittest.TestCase):
+
+    def test_packed_round_trip(self):
+        records = [('s1', 1751738400, 1.25), ('sensore-è', -1, -3.0), ('', 0, 0.0)]
+        self.assertEqual(wire.unpack_records(wire.pack_records(records)), records)
+        self.assertEqual(wire.unpack_records(wire.pack_records([])), [])
+
+    def test_malformed_packed_bodies(self):
+        body = wire.pack_records([('s1', 1, 2.0)])
+        for bad in (body[:-1], body + b'x', b'XXXX' + body[4:], b'EG'):
+            with self.assertRaises(ValueError):
+                wire.unpack_records(bad)
+
+    def test_to_record(self):
+        self.assertEqual(wire.to_record('s:1751738400', 3), ('s', 1751738400, 3.0))
+        for key, value in (('s:2025-07-05T18:00:00', 1), ('s:01', 1), ('nokey', 1), ('s:1', 'on'), ('s:1', True)):
+            with self.assertRaises(ValueError):
+                wire.to_record(key, value)
+
+    def test_negotiate(self):
+        offered = (wire.JSON_MIMETYPE, wire.MSGPACK_MIMETYPE)
+        self.assertEqual(wire.negotiate(None, offered), wire.JSON_MIMETYPE)
+        self.assertEqual(wire.negotiate('*/*', offered), wire.JSON_MIMETYPE)
+        self.assertEqual(wire.negotiate('application/x-msgpack', offered), wire.MSGPACK_MIMETYPE)
+        self.assertEqual(wire.negotiate('application/json;q=0.5, application/msgpack', offered), wire.MSGPACK_MIMETYPE)
+        self.assertEqual(wire.negotiate('application/vnd.energyguard.packed', offered), wire.JSON_MIMETYPE)
+
+    def test_invalid_msgpack(self):
+        with self.assertRaises(ValueError):
+            wire.unpackb(b'\xc1')
+
+
+if __name__ == '__main__':
+    unittest.main()